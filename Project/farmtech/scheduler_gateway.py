@@ -7,8 +7,8 @@ import time
 import logging
 import threading
 import functools
-from typing import Dict, Any, Final, Optional, List
-from flask import Flask, jsonify, request, session
+from typing import Dict, Any, Final, Optional, List, Iterable, Iterator
+from flask import Flask, jsonify, request, session, Response, stream_with_context
 from flask_cors import CORS
 from flask_session import Session
 import psutil 
@@ -16,18 +16,23 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import redis # <-- NEW
 
 # --- (All other imports are the same) ---
-from src.ai.ai_agent import start_ai_agent_thread, AIActionDecEnder, ai_agent_status, ai_agent_status_lock
+from src.ai.ai_agent import start_ai_agent_thread, AIActionDecider, ai_agent_status, ai_agent_status_lock
+from src.ai.rule_compiler import columns_from_readings
 from src.ai.heuristic_engine import HeuristicEngine
 from src.ai.tool_executioner import ToolExecutor
 from src.ai.ai_chat_parser import parse_ai_query, update_last_decision
 from src.ml.ml_model import MachineLearningModel
-import src.ml.model_training as model_trainer
 import src.ml.data_loader as data_loader
 from src.services.monitoring_service import MonitoringService
 from src.services.db_connector import DBConnector, IS_PRODUCTION # <-- NEW
+from src.services.sql_statements import register_statement
+from src.services.migrations import run_migrations, start_maintenance
+from src.services.sensor_rollups import update_rollups
+from src.services.sensor_data_writer import SensorDataWriter
+from src.services.job_queue import IngestionJobQueue, JobQueueFullError, JOB_WORKERS, MAX_QUEUED_JOBS
 from src.core.config import ConfigurationManager
 from src.services.external_api_client import ExternalAPIClient
-from src.core.schema_definitions import is_valid_schema
+from src.core.schema_definitions import validate_record, validate_records, apply_optional_defaults
 from src.core.utils import load_json_file
 import random
 
@@ -53,6 +58,11 @@ else:
     app.config["SESSION_TYPE"] = "filesystem"
 
 app.config["SECRET_KEY"] = os.environ.get('SECRET_KEY', 'local-secret-key-please-change')
+MAX_BATCH_READINGS = int(os.environ.get('MAX_BATCH_READINGS', 1000))
+MAX_NDJSON_LINE_BYTES = 64 * 1024 # One reading per line; longer lines are rejected, not buffered
+MAX_JOB_WAIT_SECONDS = 25 # Longest a /api/jobs long-poll may hold a request thread
+USER_BY_USERNAME = register_statement("user_by_username", "SELECT id, username, password_hash, role FROM users WHERE username = ?")
+INSERT_USER = register_statement("insert_user", "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)")
 Session(app)
 # --- END NEW ---
 
@@ -65,18 +75,56 @@ def teardown_db(exception):
 # ... (login_required decorator) ...
 class DataIngestionHandler:
     def __init__(self, config, model):
-        self.config=config; self.model=model; self.ai_agent=None; self.autonomy_engine=None; self.heuristic_engine=None
+        self.config=config; self.model=model; self.ai_agent=None; self.autonomy_engine=None; self.heuristic_engine=None; self.sensor_writer=None
     def validate_data(self, data: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
-        validated_data = data[0]; return validated_data if is_valid_schema(validated_data) else None
+        validated_data, error = self.check_data(data[0]); return validated_data
+    def check_data(self, record: Any) -> (Optional[Dict[str, Any]], Optional[tuple]):
+        """(record with optional defaults filled in, None) if valid, else (None, (error_code, field))."""
+        error = validate_record(record)
+        return (None, error) if error else (apply_optional_defaults(record), None)
     def get_prediction(self, data: Dict[str, Any]) -> str: return self.model.run_prediction([data])
     def handle_data_ingestion(self, data: List[Dict[str, Any]]) -> (Dict[str, Any], int):
-        validated_data = self.validate_data(data)
-        if not validated_data: return {"message": "Invalid data schema"}, 400
+        validated_data, error = self.check_data(data[0])
+        if not validated_data: return schema_error_body(error), 400
         prediction = self.get_prediction(validated_data)
         if not all([self.ai_agent, self.autonomy_engine, self.heuristic_engine]):
             return {"message": "AI core components not initialized"}, 500
         ai_action, explanation = self.ai_agent.decide_action(prediction, validated_data)
         update_last_decision(explanation)
+        if self.sensor_writer: self.sensor_writer.record(validated_data, ai_action)
+        action_result = self.execute_and_learn(ai_action, validated_data)
+        return {
+            "status": "success", "prediction": prediction, "ai_action": ai_action,
+            "explanation": explanation, "execution_result": action_result,
+            "safety_lock_active": self.config.is_safety_lock_active()
+        }, 200
+    def handle_stream_ingestion(self, lines: Iterable[Optional[bytes]]) -> Iterator[str]:
+        """
+        Runs each NDJSON line through the single-reading pipeline as it arrives and
+        yields one NDJSON result per line, so memory stays flat for any upload size.
+        A None line stands for an oversized line the reader already skipped.
+        """
+        index = 0
+        for line in lines:
+            if line is not None and not line.strip(): continue
+            item = {"index": index}
+            if line is None:
+                item.update({"status": "error", "code": 413, "error_code": "LINE_TOO_LONG"})
+            else:
+                try: reading = json.loads(line)
+                except ValueError: reading = None; item.update({"status": "error", "code": 400, "error_code": "INVALID_JSON"})
+                if reading is not None and not isinstance(reading, dict):
+                    item.update({"status": "error", "code": 400, "error_code": "INVALID_SCHEMA"})
+                elif isinstance(reading, dict):
+                    try: response, code = self.handle_data_ingestion([reading])
+                    except Exception as e:
+                        logging.error(f"Stream ingestion: line {index} failed: {e}", exc_info=True); response, code = {}, 500
+                    item.update(response); item["code"] = code
+                    if code != 200: item.update({"status": "error", "error_code": "INVALID_SCHEMA" if code == 400 else "PROCESSING_FAILED"})
+            index += 1
+            yield json.dumps(item, default=str) + "\n"
+    def execute_and_learn(self, ai_action: str, validated_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Runs the chosen tool and feeds the outcome back to the heuristic engine."""
         try:
             action_result = self.autonomy_engine.execute_action(ai_action, validated_data.get("field_id"))
             rule_id=action_result.get("rule_id", ai_action); field_id=validated_data.get('field_id'); success=action_result.get("success", False)
@@ -84,9 +132,36 @@ class DataIngestionHandler:
         except Exception as e:
             action_result = {"status": "execution_failed", "error": str(e), "success": False}
             self.heuristic_engine.learn_from_feedback(ai_action, validated_data.get('field_id'), False)
+        return action_result
+    def handle_batch_ingestion(self, readings: List[Any]) -> (Dict[str, Any], int):
+        """
+        Validates, predicts, decides (vectorized), executes and learns for a list of readings.
+        Every item gets its own result and error code; one bad reading never fails the batch.
+        """
+        if not all([self.ai_agent, self.autonomy_engine, self.heuristic_engine]):
+            return {"message": "AI core components not initialized"}, 500
+        results: List[Optional[Dict[str, Any]]] = [None] * len(readings)
+        valid_positions, valid_readings = [], []
+        for i, (reading, error) in enumerate(zip(readings, validate_records(readings))):
+            if error is None:
+                valid_positions.append(i); valid_readings.append(apply_optional_defaults(reading))
+            else:
+                results[i] = {"index": i, "status": "error", "code": 400, "error_code": "INVALID_SCHEMA", "schema_error": error[0], "field": error[1]}
+        if valid_readings:
+            predictions = self.model.predict_batch(valid_readings)
+            columns, present = columns_from_readings(valid_readings, self.ai_agent.decision_fields)
+            decisions = self.ai_agent.decide_batch(predictions, columns, present=present)
+            update_last_decision(decisions[-1][1])
+            for i, reading, prediction, (ai_action, explanation) in zip(valid_positions, valid_readings, predictions, decisions):
+                if self.sensor_writer: self.sensor_writer.record(reading, ai_action)
+                action_result = self.execute_and_learn(ai_action, reading)
+                item = {"index": i, "status": "success", "code": 200, "field_id": reading.get("field_id"),
+                        "prediction": prediction, "ai_action": ai_action, "explanation": explanation, "execution_result": action_result}
+                if action_result.get("status") == "execution_failed": item["error_code"] = "EXECUTION_FAILED"
+                results[i] = item
         return {
-            "status": "success", "prediction": prediction, "ai_action": ai_action,
-            "explanation": explanation, "execution_result": action_result,
+            "status": "success", "total": len(readings), "accepted": len(valid_readings),
+            "rejected": len(readings) - len(valid_readings), "results": results,
             "safety_lock_active": self.config.is_safety_lock_active()
         }, 200
 class AutonomousCoreEngine:
@@ -109,6 +184,17 @@ class AnalyticsScheduler:
     def __init__(self, config: ConfigurationManager): self.config = config
     def run_service(self):
         while True: logging.info("AnalyticsScheduler loop running..."); time.sleep(self.config.HEARTBEAT_INTERVAL * 2)
+def schema_error_body(error: tuple) -> Dict[str, Any]:
+    return {"message": "Invalid data schema", "schema_error": error[0], "field": error[1]}
+def iter_ndjson_lines(stream: Any, max_line_bytes: int = MAX_NDJSON_LINE_BYTES) -> Iterator[Optional[bytes]]:
+    """Reads a request stream one line at a time. Oversized lines are drained and reported as None."""
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line: return
+        if len(line) > max_line_bytes:
+            while line and not line.endswith(b"\n"): line = stream.readline(max_line_bytes)
+            yield None; continue
+        yield line
 def login_required(f):
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
@@ -125,17 +211,17 @@ def index():
 def handle_register():
     data = request.get_json(); username = data.get('username'); password = data.get('password')
     if not username or not password: return jsonify({"message": "Username and password are required."}), 400
-    user = DBConnector.execute_query("SELECT * FROM users WHERE username = ?", (username,), one=True)
+    user = DBConnector.execute_statement(USER_BY_USERNAME, (username,), one=True)
     if user: return jsonify({"message": "Username already taken."}), 409
     password_hash = generate_password_hash(password); role = "user"
-    DBConnector.execute_commit("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)", (username, password_hash, role))
+    DBConnector.commit_statement(INSERT_USER, (username, password_hash, role))
     logging.info(f"New user registered: {username} (Role: {role})")
     return jsonify({"message": "Registration successful. You can now log in."}), 201
 @app.route("/api/login", methods=['POST'])
 def handle_login():
     data = request.get_json(); username = data.get('username'); password = data.get('password')
     if not username or not password: return jsonify({"message": "Username and password are required."}), 400
-    user = DBConnector.execute_query("SELECT * FROM users WHERE username = ?", (username,), one=True)
+    user = DBConnector.execute_statement(USER_BY_USERNAME, (username,), one=True)
     if not user: return jsonify({"message": "Invalid credentials."}), 401
     if not check_password_hash(user['password_hash'], password):
         return jsonify({"message": "Invalid credentials."}), 401
@@ -174,14 +260,51 @@ def get_status():
     with ai_agent_status_lock: status_snapshot = ai_agent_status.copy()
     try: deep_status = app.monitoring_service.get_full_agent_status(); safety_lock_status = app.app_config.is_safety_lock_active()
     except Exception as e: deep_status = {"error": "components not initialized", "total_decisions": 0, "uptime_seconds": 0, "agent_health_status": "ERROR"}; safety_lock_status = "unknown"
-    return jsonify({"status": "ONLINE", "safety_lock": safety_lock_status, "agent_status": status_snapshot, "agent_deep_status": deep_status})
+    try: db_pool = DBConnector.pool_stats()
+    except Exception as e: db_pool = {"error": str(e)}
+    status = {"status": "ONLINE", "safety_lock": safety_lock_status, "agent_status": status_snapshot, "agent_deep_status": deep_status, "db_pool": db_pool}
+    if not IS_PRODUCTION: status["sqlite_writer"] = DBConnector.sqlite_writer().stats()
+    status["history_cache"] = data_loader.HISTORY_CACHE.stats()
+    return jsonify(status)
 @app.route("/api/process_full_ai", methods=['POST'])
 @login_required
 def process_full_ai():
     data = request.get_json();
     if not data: return jsonify({"message": "No input data"}), 400
+    if request.args.get('async') in ('1', 'true') or 'respond-async' in request.headers.get('Prefer', ''): return enqueue_ingestion(data)
     try: response, code = app.data_handler.handle_data_ingestion([data]); return jsonify(response), code
     except Exception as e: return jsonify({"message": f"Unhandled error: {e}"}), 500
+def enqueue_ingestion(data: Dict[str, Any]):
+    # Async mode: validate now, run the pipeline on a job worker, answer 202 straight away
+    validated_data, error = app.data_handler.check_data(data)
+    if error: return jsonify(schema_error_body(error)), 400
+    try: job = app.job_queue.submit(validated_data['field_id'], session['user_id'], app.data_handler.handle_data_ingestion, [validated_data])
+    except JobQueueFullError: return jsonify({"message": "Ingestion queue is full. Retry later."}), 429, {"Retry-After": "1"}
+    status_url = f"/api/jobs/{job.id}"
+    return jsonify({"job_id": job.id, "status": job.status, "status_url": status_url}), 202, {"Location": status_url}
+@app.route("/api/jobs/<job_id>", methods=['GET'])
+@login_required
+def get_job(job_id):
+    job = app.job_queue.get(job_id)
+    if job is None or (job.owner != session['user_id'] and session.get('role') != 'admin'): return jsonify({"message": "Job not found."}), 404
+    wait = min(max(request.args.get('wait', 0, type=float), 0), MAX_JOB_WAIT_SECONDS)
+    if wait: job.wait(wait)
+    return jsonify(job.to_dict()), 200 if job.is_finished() else 202
+@app.route("/api/process_full_ai/batch", methods=['POST'])
+@login_required
+def process_full_ai_batch():
+    data = request.get_json(silent=True)
+    readings = data.get('readings') if isinstance(data, dict) else data
+    if not isinstance(readings, list) or not readings: return jsonify({"message": "Expected a non-empty array of readings"}), 400
+    if len(readings) > MAX_BATCH_READINGS: return jsonify({"message": f"Batch too large (max {MAX_BATCH_READINGS} readings)"}), 413
+    try: response, code = app.data_handler.handle_batch_ingestion(readings); return jsonify(response), code
+    except Exception as e: return jsonify({"message": f"Unhandled error: {e}"}), 500
+@app.route("/api/process_full_ai/stream", methods=['POST'])
+@login_required
+def process_full_ai_stream():
+    # Body is newline-delimited JSON (one reading per line); results stream back the same way
+    lines = iter_ndjson_lines(request.stream)
+    return Response(stream_with_context(app.data_handler.handle_stream_ingestion(lines)), mimetype='application/x-ndjson')
 @app.route("/api/ai_chat", methods=['POST'])
 @login_required
 def handle_ai_chat():
@@ -193,28 +316,36 @@ def handle_ai_chat():
 @login_required
 def get_heuristics():
     if session.get('role') not in ['developer', 'maintenance', 'admin']: return jsonify({"message": "Unauthorized."}), 403
-    try: data = load_json_file('dynamic_heuristics.json'); return jsonify(data), 200
+    try: data = app.heuristic_engine.snapshot(); return jsonify(data), 200
     except Exception as e: return jsonify({"message": f"Could not load heuristics: {e}"}), 500
 @app.route("/api/yield_prediction", methods=['POST'])
 @login_required
 def handle_yield_prediction():
-    data = request.get_json(); validated_data = app.data_handler.validate_data([data])
-    if not validated_data: return jsonify({"message": "Invalid data schema"}), 400
+    data = request.get_json(); validated_data, error = app.data_handler.check_data(data)
+    if error: return jsonify(schema_error_body(error)), 400
     prediction = app.data_handler.get_prediction(validated_data)
     return jsonify({ "prediction": prediction, "message": "Yield prediction complete." }), 200
 @app.route("/api/soil_analysis", methods=['POST'])
 @login_required
 def handle_soil_analysis():
-    data = request.get_json(); validated_data = app.data_handler.validate_data([data])
-    if not validated_data: return jsonify({"message": "Invalid data schema"}), 400
+    data = request.get_json(); validated_data, error = app.data_handler.check_data(data)
+    if error: return jsonify(schema_error_body(error)), 400
     prediction = app.data_handler.get_prediction(validated_data)
     history = data_loader.load_historical_data(validated_data['field_id'], days=7)
     return jsonify({ "field_id": validated_data['field_id'], "current_prediction": prediction, "historical_records": history }), 200
+@app.route("/api/history_summary/<field_id>", methods=['GET'])
+@login_required
+def get_history_summary(field_id):
+    granularity = request.args.get('granularity', 'daily')
+    if granularity not in data_loader.SUMMARY_GRANULARITIES: return jsonify({"message": f"granularity must be one of {data_loader.SUMMARY_GRANULARITIES}."}), 400
+    try: days = max(1, min(int(request.args.get('days', 7)), 3660))
+    except ValueError: return jsonify({"message": "days must be an integer."}), 400
+    return jsonify({"field_id": field_id, "granularity": granularity, "buckets": data_loader.load_historical_summary(field_id, granularity, days)}), 200
 @app.route("/api/ml_insights")
 @login_required
 def get_ml_insights():
     if session.get('role') not in ['developer', 'admin']: return jsonify({"message": "Unauthorized."}), 403
-    try: config_data = load_json_file('simulated_model_v1.json'); return jsonify(config_data), 200
+    try: return jsonify(app.predictive_model.describe()), 200
     except Exception as e: return jsonify({"message": f"Could not load ML config: {e}"}), 500
 @app.route("/api/location_intel", methods=['POST'])
 @login_required
@@ -226,33 +357,9 @@ def get_location_intel():
 
 # --- SECTION 5: INITIALIZATION AND STARTUP ---
 def initialize_database():
-    # --- NEW: Cloud-Aware Schema ---
-    # PostgreSQL uses different type names
-    user_table_sql = """
-    CREATE TABLE IF NOT EXISTS users (
-        id SERIAL PRIMARY KEY,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        role TEXT NOT NULL DEFAULT 'user'
-    );"""
-    
-    sensor_table_sql = """
-    CREATE TABLE IF NOT EXISTS sensor_data (
-        id SERIAL PRIMARY KEY, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
-        field_id TEXT, moisture INTEGER, temp INTEGER, nutrient_level TEXT, 
-        pump_pressure INTEGER, ai_action TEXT, wind_speed INTEGER, solar_radiation INTEGER
-    );"""
-
-    if not IS_PRODUCTION:
-        # --- Local SQLite Schema ---
-        user_table_sql = user_table_sql.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
-        sensor_table_sql = sensor_table_sql.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
-        sensor_table_sql = sensor_table_sql.replace("TIMESTAMP DEFAULT CURRENT_TIMESTAMP", "DATETIME DEFAULT CURRENT_TIMESTAMP")
-    
-    DBConnector.execute_commit(user_table_sql)
-    DBConnector.execute_commit(sensor_table_sql)
-    logging.info("Database initialized with 'users' and 'sensor_data' tables.")
-    # --- END NEW ---
+    # Schema lives in src/services/migrations.py; this applies whatever this database is missing
+    applied = run_migrations()
+    logging.info(f"Database schema up to date (applied now: {applied or 'none'}).")
 
 def create_first_admin():
     # ... (This function is unchanged) ...
@@ -277,8 +384,14 @@ def init_components():
     app.data_handler = DataIngestionHandler(app.app_config, app.predictive_model)
     app.autonomy_engine = AutonomousCoreEngine(app.app_config, app.api_client)
     app.scheduler = AnalyticsScheduler(app.app_config)
+    app.sensor_writer = SensorDataWriter()
+    app.sensor_writer.add_flush_hook(update_rollups) # Hourly/daily rollups move in the same transaction as the rows
+    app.sensor_writer.add_flush_hook(data_loader.HISTORY_CACHE.flush_started); app.sensor_writer.add_commit_listener(data_loader.HISTORY_CACHE.flush_finished)
+    app.job_queue = IngestionJobQueue(workers=int(os.environ.get('JOB_WORKERS', JOB_WORKERS)),
+                                      max_queued=int(os.environ.get('MAX_QUEUED_JOBS', MAX_QUEUED_JOBS)))
     initialize_database()
     create_first_admin()
+    DBConnector.close_db() # Hand the startup connection back to the pool
 
 def start_background_threads():
     # ... (This function is unchanged) ...
@@ -289,6 +402,11 @@ def start_background_threads():
     app.data_handler.ai_agent = app.ai_decider_agent
     app.data_handler.autonomy_engine = app.autonomy_engine
     app.data_handler.heuristic_engine = app.heuristic_engine
+    app.sensor_writer.start() # sensor_data exists by now (init_components created it)
+    app.data_handler.sensor_writer = app.sensor_writer
+    app.job_queue.start()
+    app.predictive_model.start_watcher() # Picks up newly published model versions without a restart
+    start_maintenance() # Creates upcoming sensor_data partitions and enforces data_retention_days
 
 # --- NEW: Run only for local development ---
 if __name__ == "__main__":
@@ -3,10 +3,13 @@
 
 import logging
 import json
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 import time
 import threading
-from src.ai.heuristic_engine import HeuristicEngine
+import numpy as np
+from src.ai.heuristic_engine import HeuristicEngine, MAX_CONFIDENCE
+from src.ai.rule_compiler import compile_rules, RuleIndex, evaluate_masks
+from src.core.schema_definitions import SENSOR_DATA_SCHEMA
 
 # ... (AgentConfig, LoggerUtility, ai_agent_status, ai_agent_status_lock remain unchanged) ...
 class AgentConfig:
@@ -27,7 +30,7 @@ ai_agent_status = {
     "safety_lock_status": True, "geographical_zone": "Kenya_Highlands",
     "uptime_seconds": 0, "total_decisions": 0
 }
-ai_agent_status_lock = threading.Lock()
+ai_agent_status_lock = threading.RLock() # Re-entered by run_agent_loop -> get_runtime_status
 # ... (AgentContext and SystemHealthMonitor classes remain unchanged) ...
 class AgentContext:
     def __init__(self, config_manager, knowledge_path):
@@ -49,7 +52,7 @@ class SystemHealthMonitor:
         self.decision_count = 0
         self.last_heartbeat_time = time.time()
         self.last_action = "INIT"
-    def record_decision(self): self.decision_count += 1
+    def record_decision(self, count: int = 1): self.decision_count += count
     def record_heartbeat(self, action: str):
         self.last_heartbeat_time = time.time()
         self.last_action = action
@@ -71,13 +74,23 @@ class AIActionDecider:
         self.context = AgentContext(core_engine.config, AgentConfig.KNOWLEDGE_FILE)
         self.monitor = SystemHealthMonitor()
         self.rules = self.context.knowledge.get("decision_rules", [])
+        # Conditions are parsed once here; broken rules are reported now, not per reading
+        self.compiled_rules, self.rule_compile_errors = compile_rules(
+            self.rules, self.context.thresholds, known_fields=SENSOR_DATA_SCHEMA.keys())
+        self.rule_index = RuleIndex(self.compiled_rules)
+        # Reading fields any rule looks at (the columns decide_batch needs)
+        self.decision_fields = sorted(set().union(*(c.fields for c in self.compiled_rules)) | {'field_id'})
         self.last_decision_log = "No decisions made yet." # <-- NEW: For chat
         
         with ai_agent_status_lock:
             ai_agent_status['safety_lock_status'] = self.context.config_manager.is_safety_lock_active()
             ai_agent_status['geographical_zone'] = self.context.location
         
-        logging.info(f"AI Action Decider (Rational+Heuristic) initialized. {len(self.rules)} rules loaded.")
+        if self.rule_compile_errors:
+            logging.error(f"{len(self.rule_compile_errors)} decision rules failed to compile and will never fire: "
+                          f"{sorted(self.rule_compile_errors)}")
+        logging.info(f"AI Action Decider (Rational+Heuristic) initialized. "
+                     f"{len(self.compiled_rules)}/{len(self.rules)} rules compiled. Index: {self.rule_index.describe()}")
 
     def decide_action(self, prediction: str, sensor_data: Dict[str, Any]) -> (str, str):
         """
@@ -86,37 +99,48 @@ class AIActionDecider:
         self.monitor.record_decision()
         field_id = sensor_data.get('field_id', 'unknown')
         
-        eval_context = sensor_data.copy()
-        eval_context.update({'prediction': prediction, **self.context.thresholds})
-        
-        matched_rules = []
+        # Only rules whose equality tests this reading satisfies are candidates,
+        # visited from highest priority down.
+        candidates = self.rule_index.candidates(sensor_data, prediction)
+        best_scored_rule = None
+        matched_count = 0
         rule_check_count = 0
         
-        for rule in self.rules:
-            rule_check_count += 1
-            try:
-                if eval(rule["condition"], {"__builtins__": {}}, eval_context):
-                    matched_rules.append(rule)
-            except Exception as e:
-                logging.error(f"Error evaluating rule {rule['id']}: {e}")
+        position = 0
+        while position < len(candidates):
+            # --- THE "ADVANCED" CHOICE ---
+            # Candidates are grouped into tiers of equal priority. final_score is
+            # priority*10 + confidence*5 and confidence never exceeds MAX_CONFIDENCE,
+            # so once a tier's bound can't reach the best score we can stop.
+            priority = candidates[position].priority
+            if best_scored_rule and (priority * 10) + (MAX_CONFIDENCE * 5) < best_scored_rule['score']:
+                break
+            tier = []
+            while position < len(candidates) and candidates[position].priority == priority:
+                rule_check_count += 1
+                if candidates[position].matches(sensor_data, prediction):
+                    tier.append(candidates[position])
+                position += 1
+            if not tier:
+                continue
+            matched_count += len(tier)
+            # One batched confidence lookup per tier (a single pipeline on Redis)
+            confidences = self.heuristic_engine.get_confidence_scores([c.id for c in tier], field_id)
+            for compiled, confidence in zip(tier, confidences):
+                final_score = (compiled.priority * 10) + (confidence * 5)
+                # Ties go to the rule listed first in the knowledge file
+                if (best_scored_rule is None or final_score > best_scored_rule['score'] or
+                        (final_score == best_scored_rule['score'] and compiled.index < best_scored_rule['index'])):
+                    best_scored_rule = {"rule": compiled.rule, "score": final_score, "index": compiled.index,
+                                        "priority": compiled.priority, "confidence": confidence}
         
         with ai_agent_status_lock:
             ai_agent_status['rules_checked'] = rule_check_count
 
-        if not matched_rules:
+        if not best_scored_rule:
             self.last_decision_log = "No rules matched the data. I decided to monitor quietly."
             return "ACTION: MONITOR_QUIETLY", self.last_decision_log
             
-        # --- THE "ADVANCED" CHOICE ---
-        scored_rules = []
-        for rule in matched_rules:
-            rule_id = rule['id']
-            priority = rule.get('priority', 0)
-            confidence = self.heuristic_engine.get_confidence_score(rule_id, field_id)
-            final_score = (priority * 10) + (confidence * 5)
-            scored_rules.append({ "rule": rule, "score": final_score, "priority": priority, "confidence": confidence })
-            
-        best_scored_rule = max(scored_rules, key=lambda r: r['score'])
         best_rule = best_scored_rule['rule']
         
         # --- NEW: Save the explanation for the chatbot ---
@@ -124,10 +148,98 @@ class AIActionDecider:
                                   f"with a learned confidence of {best_scored_rule['confidence']:.2f}. "
                                   f"The reason was: {best_rule['log']}")
         
-        logging.info(f"HEURISTIC DECISION: {len(scored_rules)} rules matched. Selected: {best_rule['id']}")
+        logging.info(f"HEURISTIC DECISION: {matched_count} of {rule_check_count} evaluated rules matched. Selected: {best_rule['id']}")
             
         return best_rule["action"], self.last_decision_log
 
+    def decide_batch(self, predictions: Sequence[str], columns: Dict[str, Any],
+                     categories: Optional[Dict[str, Dict[str, int]]] = None,
+                     present: Optional[Dict[str, Any]] = None) -> List[Tuple[str, str]]:
+        """
+        Vectorized decide_action for N readings given as columns
+        (e.g. {'moisture': array, 'temp': array, 'field_id': array, ...}).
+        Every rule is evaluated as a boolean mask over the batch, scored with
+        array ops, and the best rule per row is picked with an argmax.
+        Encoded categoricals are decoded through `categories` ({column: {label: code}}).
+        present ({column: bool array}) marks which readings carry a field, as returned
+        by columns_from_readings; a reading without a field a rule reads doesn't match it.
+        Returns one (action, explanation) pair per reading, identical to decide_action.
+        """
+        rows = len(predictions)
+        self.monitor.record_decision(rows)
+        if rows == 0:
+            return []
+        
+        columns = dict(columns)
+        predictions = np.asarray(predictions, dtype=object)
+        for name, mapping in (categories or {}).items():
+            labels = np.empty(max(mapping.values()) + 1, dtype=object)
+            for label, code in mapping.items():
+                labels[code] = label
+            if name != 'prediction' and name not in columns:
+                continue
+            codes = np.asarray(predictions if name == 'prediction' else columns[name], dtype=np.int64)
+            unknown = ~np.isin(codes, list(mapping.values()))
+            if unknown.any():
+                raise ValueError(f"Column '{name}' has codes with no category: {sorted(set(codes[unknown].tolist()))}")
+            if name == 'prediction':
+                predictions = labels[codes]
+            else:
+                columns[name] = labels[codes]
+        for name, column in columns.items():
+            if len(column) != rows:
+                raise ValueError(f"Column '{name}' has {len(column)} values, expected {rows}.")
+        
+        masks = evaluate_masks(self.compiled_rules, columns, predictions, rows, present)
+        with ai_agent_status_lock:
+            ai_agent_status['rules_checked'] = len(self.compiled_rules)
+        
+        # Confidence is per (rule, field): look it up once per distinct field
+        field_ids = columns.get('field_id')
+        if field_ids is None:
+            field_ids = ['unknown'] * rows
+        elif present and 'field_id' in present:
+            # Same default as decide_action's sensor_data.get('field_id', 'unknown')
+            field_ids = [f if has else 'unknown' for f, has in zip(field_ids, present['field_id'])]
+        field_slots: Dict[Any, int] = {}
+        field_index = np.fromiter((field_slots.setdefault(f, len(field_slots)) for f in field_ids), dtype=np.int64, count=rows)
+        distinct_fields = list(field_slots)
+        
+        scores = np.full(masks.shape, -np.inf)
+        confidences = np.zeros(masks.shape)
+        active = [i for i in range(len(self.compiled_rules)) if masks[i].any()]
+        matrix = self.heuristic_engine.get_confidence_matrix([self.compiled_rules[i].id for i in active], distinct_fields)
+        for i, per_field in zip(active, matrix):
+            compiled = self.compiled_rules[i]
+            confidences[i] = np.asarray(per_field, dtype=np.float64)[field_index]
+            scores[i] = np.where(masks[i], (compiled.priority * 10) + (confidences[i] * 5), -np.inf)
+        
+        # argmax returns the first maximum, i.e. the rule listed first on ties
+        best = scores.argmax(axis=0)
+        matched = masks.any(axis=0)
+        
+        results = []
+        explanations: Dict[Tuple[int, float], str] = {}
+        quiet = ("ACTION: MONITOR_QUIETLY", "No rules matched the data. I decided to monitor quietly.")
+        for row in range(rows):
+            if not matched[row]:
+                results.append(quiet)
+                continue
+            i = best[row]
+            compiled = self.compiled_rules[i]
+            confidence = float(confidences[i, row])
+            explanation = explanations.get((i, confidence))
+            if explanation is None:
+                explanation = explanations[(i, confidence)] = (
+                    f"I selected rule {compiled.rule['id']} (Priority: {compiled.priority}) "
+                    f"with a learned confidence of {confidence:.2f}. "
+                    f"The reason was: {compiled.rule['log']}")
+            results.append((compiled.rule["action"], explanation))
+        
+        self.last_decision_log = results[-1][1]
+        logging.info(f"HEURISTIC BATCH DECISION: {rows} readings, {int(matched.sum())} matched a rule.")
+        return results
+
     # --- THE AUTONOMY FLAW LOOP (Unchanged) ---
     def run_agent_loop(self):
         logging.info("AI Agent Loop (with Autonomy Flaw) started.")
@@ -45,7 +45,7 @@ def parse_ai_query(query: str, ai_agent: AIActionDecider, heuristic_engine: Heur
 
         # --- Rule 2: "confidence in [tool]" ---
         if "confidence" in query:
-            if not hasattr(heuristic_engine, 'heuristics'):
+            if not hasattr(heuristic_engine, 'get_average_confidence'):
                 return "Heuristic engine is not initialized. Cannot get confidence yet."
 
             if "irrigation" in query:
@@ -55,12 +55,12 @@ def parse_ai_query(query: str, ai_agent: AIActionDecider, heuristic_engine: Heur
             else:
                 return "Which tool's confidence are you asking about? (e.g., 'irrigation', 'cooling')"
             
-            # Get the *average* confidence for this rule across all fields
-            scores = [v['confidence'] for k, v in heuristic_engine.heuristics.items() if rule_id in k]
-            if not scores:
+            # Get the *average* confidence for this rule across all fields (kept as a running aggregate)
+            avg_confidence = heuristic_engine.get_average_confidence(rule_id)
+            if avg_confidence is None:
                 return f"I have no learning data for {rule_id} yet. My default confidence is 100%."
             
-            avg_score = (sum(scores) / len(scores)) * 100
+            avg_score = avg_confidence * 100
             return f"My current learned confidence for rule {rule_id} is {avg_score:.1f}%."
 
         # --- Rule 3: "status of [field]" ---
@@ -1,72 +1,324 @@
 # src/ai/heuristic_engine.py
+import atexit
 import json
+from contextlib import contextmanager
 import logging
-from typing import Dict, Any
+import os
+import threading
+import time
+from typing import Dict, Any, Callable, Iterator, List, Tuple, Optional
+import redis
+try:
+    import fcntl
+except ImportError: # Windows: no gunicorn workers there, so one process owns the files
+    fcntl = None
+from src.ai.heuristic_store import HeuristicStore, RedisHeuristicStore, split_key
 
-HEURISTIC_FILE = 'dynamic_heuristics.json'
+# Shared across workers when set (same Redis the gateway uses for sessions)
+REDIS_URL = os.environ.get('REDIS_URL')
+REDIS_SOCKET_TIMEOUT = 2.0     # Seconds before a Redis call counts as failed
+REDIS_RETRY_INTERVAL = 30.0    # Seconds served from local memory after a Redis error
+HEURISTIC_FILE = 'dynamic_heuristics.json'               # Compacted snapshot of the AI's memory
+HEURISTIC_JOURNAL_FILE = 'dynamic_heuristics.journal'    # Append-only feedback log (JSON lines)
+HEURISTIC_LOCK_SUFFIX = '.lock'  # flock file next to the snapshot: shared for appends, exclusive for compaction
+JOURNAL_FLUSH_INTERVAL = 1.0   # Seconds between journal flushes (the most a crash can lose)
+JOURNAL_FLUSH_BATCH = 500      # Flush early once this many updates are buffered
+COMPACTION_INTERVAL = 300      # Seconds between folding the journal into the snapshot
 LEARNING_RATE = 0.1
 FAILURE_PENALTY = -0.2
 SUCCESS_REWARD = 0.1
+# Learned confidence always stays inside these bounds
+MIN_CONFIDENCE = 0.1
+MAX_CONFIDENCE = 1.0
+DEFAULT_ENTRY = {"confidence": MAX_CONFIDENCE, "successes": 0, "failures": 0}  # Memory of a rule never used
+
+def _feedback_count(entry: Dict[str, Any]) -> int:
+    """Feedback an entry has absorbed; only ever grows, so it orders copies of one entry."""
+    return entry["successes"] + entry["failures"]
 
 class HeuristicEngine:
     """
     This is the "Advanced Crazy" AI.
     It learns from the outcomes of actions to build a dynamic
     confidence score for different rules and situations.
+
+    Memory lives in a pluggable store. With REDIS_URL set, every worker shares a
+    RedisHeuristicStore; if Redis fails later on, reads and updates go to an in-memory
+    HeuristicStore for REDIS_RETRY_INTERVAL before Redis is tried again. Feedback taken
+    meanwhile is kept as success/failure events and replayed into Redis once it is back.
+    The first worker to find the shared memory empty imports the file-mode snapshot and journal.
+    Otherwise (or if Redis is unreachable at startup) a local HeuristicStore is used,
+    and feedback is written behind: each update is buffered, appended to a journal by
+    a background thread, and periodically compacted into the snapshot file.
+    Startup loads the snapshot and replays the journal. Worker processes share both files:
+    compaction holds an exclusive lock and folds in every worker's journaled feedback
+    before rewriting them, then takes on the other workers' newer entries itself.
     """
-    def __init__(self):
-        self.heuristics = self._load_heuristics()
-        logging.info("Heuristic Engine (Learning AI) initialized.")
+    def __init__(self, heuristic_file: str = HEURISTIC_FILE, journal_file: str = HEURISTIC_JOURNAL_FILE,
+                 store: Optional[Any] = None):
+        self.heuristic_file = heuristic_file
+        self.journal_file = journal_file
+        if store is None:
+            store = self._connect_redis_store()
+            if store is not None:
+                self._seed_redis_store(store)
+        self._journaled = store is None
+        self.heuristics = store if store is not None else HeuristicStore(self._read_heuristics())
+        self._fallback = HeuristicStore()      # Serves while the shared store is failing
+        self._fallback_until = 0.0
+        self._missed: List[Tuple[str, str, bool]] = []  # Feedback the fallback took, to replay into Redis
+        self._lock = threading.Lock()          # Guards the pending buffer and missed feedback
+        self._io_lock = threading.Lock()       # Serializes journal/snapshot writes
+        self._pending: List[Tuple[str, float, int, int]] = []
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._last_compaction = time.time()
+        self._writer = None
+        if self._journaled:
+            self._writer = threading.Thread(target=self._run_writer, name="Heuristic_Journal_Writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+        logging.info(f"Heuristic Engine (Learning AI) initialized with {type(self.heuristics).__name__}.")
+
+    @staticmethod
+    def _connect_redis_store() -> Optional[RedisHeuristicStore]:
+        """Shared Redis memory if configured and reachable, else None (local fallback)."""
+        if not REDIS_URL:
+            return None
+        try:
+            client = redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=REDIS_SOCKET_TIMEOUT,
+                                    socket_connect_timeout=REDIS_SOCKET_TIMEOUT)
+            client.ping()
+            logging.info("Heuristic Engine: using shared Redis memory.")
+            return RedisHeuristicStore(client)
+        except Exception as e:
+            logging.error(f"Heuristic Engine: Redis unavailable ({e}). Falling back to local memory.")
+            return None
+
+    def _seed_redis_store(self, store: RedisHeuristicStore):
+        """First start with Redis: carries over what file mode learned, if the shared memory is empty."""
+        try:
+            seeded = store.seed(self._read_heuristics())
+        except redis.RedisError as e:
+            logging.error(f"Heuristic Engine: could not import local memory into Redis: {e}")
+            return
+        if seeded:
+            logging.info(f"Heuristic Engine: imported {seeded} heuristics from {self.heuristic_file} into Redis.")
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        """flock across worker processes sharing the snapshot and journal."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.heuristic_file}{HEURISTIC_LOCK_SUFFIX}", 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _read_heuristics(self) -> Dict[str, Any]:
+        """_load_heuristics without racing another worker's compaction."""
+        with self._file_lock(exclusive=False):
+            return self._load_heuristics()
 
     def _load_heuristics(self) -> Dict[str, Any]:
-        """Loads the AI's 'memory' from a file."""
+        """Loads the AI's 'memory': the last snapshot plus any journaled feedback after it."""
         try:
-            with open(HEURISTIC_FILE, 'r') as f:
-                return json.load(f)
+            with open(self.heuristic_file, 'r') as f:
+                heuristics = json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
-            logging.warning(f"Heuristic file '{HEURISTIC_FILE}' not found. Starting with empty memory.")
-            return {}
+            logging.warning(f"Heuristic file '{self.heuristic_file}' not found. Starting with empty memory.")
+            heuristics = {}
+
+        replayed = 0
+        try:
+            with open(self.journal_file, 'r') as f:
+                for line in f:
+                    try:
+                        key, confidence, successes, failures = json.loads(line)
+                    except (ValueError, TypeError):
+                        continue # Torn final line from a crash mid-write
+                    # Entries hold absolute state; successes+failures only ever grows,
+                    # so anything older than what we already have is skipped.
+                    current = heuristics.get(key)
+                    if current is None or successes + failures > _feedback_count(current):
+                        heuristics[key] = {"confidence": confidence, "successes": successes, "failures": failures}
+                        replayed += 1
+        except FileNotFoundError:
+            pass
+        if replayed:
+            logging.info(f"Heuristic Engine: replayed {replayed} journaled updates.")
+        return heuristics
+
+    def _flush_journal(self):
+        """Appends buffered updates to the journal."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            with self._file_lock(exclusive=False), open(self.journal_file, 'a') as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in batch))
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logging.error(f"Failed to write heuristic journal: {e}")
+            with self._lock:
+                self._pending = batch + self._pending # Retry on the next flush
 
     def _save_heuristics(self):
-        """Saves the AI's 'memory' to a file."""
+        """Compacts the AI's 'memory' into the snapshot file and truncates the journal."""
+        # Journal first, so a failed snapshot write loses nothing. Updates that land
+        # after this are in the snapshot *and* re-journaled later; replay skips the duplicate.
+        self._flush_journal()
         try:
-            with open(HEURISTIC_FILE, 'w') as f:
-                json.dump(self.heuristics, f, indent=4)
+            with self._file_lock(exclusive=True):
+                # Other workers' feedback is only on disk; whichever copy of an entry has
+                # seen more feedback wins, the same rule journal replay uses
+                snapshot = self._load_heuristics()
+                for key, entry in self.snapshot().items():
+                    current = snapshot.get(key)
+                    if current is None or _feedback_count(entry) >= _feedback_count(current):
+                        snapshot[key] = entry
+                tmp_file = f"{self.heuristic_file}.tmp"
+                with open(tmp_file, 'w') as f:
+                    json.dump(snapshot, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, self.heuristic_file)
+                open(self.journal_file, 'w').close()
+            self._last_compaction = time.time()
         except Exception as e:
             logging.error(f"Failed to save heuristics: {e}")
+            return
+        self._adopt(snapshot)
+
+    def _adopt(self, snapshot: Dict[str, Any]):
+        """Takes on entries other workers have given more feedback than this one has seen."""
+        def newer(disk: Dict[str, Any]) -> Callable[[Dict[str, Any]], None]:
+            def apply(entry: Dict[str, Any]):
+                if _feedback_count(disk) > _feedback_count(entry):
+                    entry.update(disk)
+            return apply
+        for key, entry in snapshot.items():
+            current = self.heuristics.get(*split_key(key))
+            if current is None or _feedback_count(entry) > _feedback_count(current):
+                self.heuristics.update(*split_key(key), dict(entry), newer(entry))
+
+    def _run_writer(self):
+        while not self._stopped.is_set():
+            self._flush_requested.wait(JOURNAL_FLUSH_INTERVAL)
+            self._flush_requested.clear()
+            with self._io_lock:
+                if time.time() - self._last_compaction >= COMPACTION_INTERVAL:
+                    self._save_heuristics()
+                else:
+                    self._flush_journal()
+
+    def close(self):
+        """Stops the writer and leaves a fully compacted snapshot behind."""
+        if self._stopped.is_set() or not self._journaled:
+            return
+        self._stopped.set()
+        self._flush_requested.set()
+        self._writer.join(timeout=5)
+        with self._io_lock:
+            self._save_heuristics()
+
+    def _call(self, method: str, *args: Any, feedback: Optional[Tuple[str, str, bool]] = None) -> Any:
+        """
+        Runs a store method, on the local fallback while the shared store is failing.
+        feedback (rule_id, field_id, success) marks an update to replay if the fallback takes it.
+        """
+        if time.monotonic() >= self._fallback_until:
+            try:
+                if self._missed:
+                    self._replay_missed()
+                return getattr(self.heuristics, method)(*args)
+            except redis.RedisError as e:
+                self._fallback_until = time.monotonic() + REDIS_RETRY_INTERVAL
+                logging.error(f"Heuristic Engine: Redis error ({e}). Using local memory for {REDIS_RETRY_INTERVAL:.0f}s.")
+        if feedback is not None:
+            with self._lock:
+                self._missed.append(feedback)
+        return getattr(self._fallback, method)(*args)
+
+    def _replay_missed(self):
+        """Applies feedback taken during a Redis outage to Redis, in order; stops (and keeps the rest) on an error."""
+        with self._lock:
+            missed, self._missed = self._missed, []
+        for i, (rule_id, field_id, success) in enumerate(missed):
+            try:
+                self.heuristics.update(rule_id, field_id, dict(DEFAULT_ENTRY),
+                                       self._feedback_update(f"{rule_id}@{field_id}", success))
+            except redis.RedisError:
+                with self._lock:
+                    self._missed = missed[i:] + self._missed
+                raise
+        self._fallback = HeuristicStore() # Redis holds all of it now; the next outage starts clean
+        logging.info(f"Heuristic Engine: replayed {len(missed)} feedback updates from the Redis outage.")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """A consistent copy of the current in-memory heuristics."""
+        return self._call("snapshot")
 
     def get_confidence_score(self, rule_id: str, field_id: str) -> float:
         """
         Gets the AI's learned confidence in a specific rule for a specific field.
         Returns 1.0 (100% confidence) if it has no memory.
         """
-        key = f"{rule_id}@{field_id}"
-        return self.heuristics.get(key, {}).get("confidence", 1.0)
+        return self._call("confidence", rule_id, field_id, MAX_CONFIDENCE)
+
+    def get_confidence_scores(self, rule_ids: List[str], field_id: str) -> List[float]:
+        """get_confidence_score for several rules at once (one round trip on Redis)."""
+        return self._call("confidences", rule_ids, field_id, MAX_CONFIDENCE)
+
+    def get_confidence_matrix(self, rule_ids: List[str], field_ids: List[str]) -> List[List[float]]:
+        """Confidences for every (rule, field) pair, one row per rule."""
+        return self._call("confidence_matrix", rule_ids, field_ids, MAX_CONFIDENCE)
+
+    def get_average_confidence(self, rule_id: str) -> Optional[float]:
+        """Average learned confidence for a rule across all fields (None if never used)."""
+        return self._call("average_confidence", rule_id)
+
+    def _feedback_update(self, key: str, success: bool) -> Callable[[Dict[str, Any]], float]:
+        """The store update for one piece of feedback on key; returns the confidence before it."""
+        update = SUCCESS_REWARD if success else FAILURE_PENALTY
+
+        def apply(entry: Dict[str, Any]) -> float:
+            current_confidence = entry["confidence"]
+            if success:
+                entry["successes"] += 1
+            else:
+                entry["failures"] += 1
+            # Update confidence using a learning rate
+            new_confidence = current_confidence + update
+            # Clamp confidence between 0.1 (never 0) and 1.0
+            entry["confidence"] = max(MIN_CONFIDENCE, min(MAX_CONFIDENCE, new_confidence))
+            if self._journaled:
+                # Buffered while the entry's stripe is still held, so journal order per key is update order
+                with self._lock:
+                    self._pending.append((key, entry["confidence"], entry["successes"], entry["failures"]))
+            return current_confidence
+        return apply
 
     def learn_from_feedback(self, rule_id: str, field_id: str, success: bool):
         """
         This is the core learning loop. The AI updates its own confidence.
+        The update is only buffered here; the writer thread persists it.
         """
         key = f"{rule_id}@{field_id}"
-        if key not in self.heuristics:
-            self.heuristics[key] = {"confidence": 1.0, "successes": 0, "failures": 0}
-        
-        current_confidence = self.heuristics[key]["confidence"]
-        
+        update = SUCCESS_REWARD if success else FAILURE_PENALTY
+        current_confidence = self._call("update", rule_id, field_id, dict(DEFAULT_ENTRY), self._feedback_update(key, success),
+                                        feedback=(rule_id, field_id, success))
+        pending_count = len(self._pending)
+
         if success:
-            # Apply reward
-            update = SUCCESS_REWARD
-            self.heuristics[key]["successes"] += 1
             logging.info(f"HEURISTIC: Rewarding rule {key}. Confidence {current_confidence:.2f} -> {current_confidence + update:.2f}")
         else:
-            # Apply penalty
-            update = FAILURE_PENALTY
-            self.heuristics[key]["failures"] += 1
             logging.warning(f"HEURISTIC: Penalizing rule {key}. Confidence {current_confidence:.2f} -> {current_confidence + update:.2f}")
-            
-        # Update confidence using a learning rate
-        new_confidence = current_confidence + update
-        # Clamp confidence between 0.1 (never 0) and 1.0
-        self.heuristics[key]["confidence"] = max(0.1, min(1.0, new_confidence))
-        
-        self._save_heuristics()
\ No newline at end of file
+
+        if pending_count >= JOURNAL_FLUSH_BATCH:
+            self._flush_requested.set()
@@ -0,0 +1,245 @@
+# src/ai/heuristic_store.py
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Any, Optional, Callable, Tuple, Set, Iterator, List, Sequence
+
+STRIPE_COUNT = 64 # Independent locks; concurrent updates only contend when they hash together
+
+def split_key(key: str) -> Tuple[str, str]:
+    """'R006@field-7' -> ('R006', 'field-7')"""
+    rule_id, _, field_id = key.partition('@')
+    return rule_id, field_id
+
+class HeuristicStore:
+    """
+    Thread-safe in-memory heuristic memory (the local backend; HeuristicEngine
+    persists it through its file journal).
+    Entries are keyed on 'rule@field' and guarded by striped locks, indexed by rule
+    and by field, and each rule keeps a running confidence sum/count so its
+    average across all fields is O(1).
+    """
+    def __init__(self, entries: Optional[Dict[str, Dict[str, Any]]] = None, stripes: int = STRIPE_COUNT):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._by_rule: Dict[str, Set[str]] = {}
+        self._by_field: Dict[str, Set[str]] = {}
+        self._rule_totals: Dict[str, list] = {}   # rule -> [confidence_sum, entry_count]
+        self._key_locks = [threading.Lock() for _ in range(stripes)]
+        self._rule_locks = [threading.Lock() for _ in range(stripes)]
+        self._index_lock = threading.Lock()
+        for key, entry in (entries or {}).items():
+            self.put(*split_key(key), entry)
+
+    def _stripe(self, locks: list, name: str) -> threading.Lock:
+        return locks[zlib.crc32(name.encode()) % len(locks)]
+
+    def _index_new_key(self, rule_id: str, field_id: str):
+        with self._index_lock:
+            self._by_rule.setdefault(rule_id, set()).add(field_id)
+            self._by_field.setdefault(field_id, set()).add(rule_id)
+
+    def _adjust_totals(self, rule_id: str, delta: float, new_entries: int):
+        with self._stripe(self._rule_locks, rule_id):
+            totals = self._rule_totals.setdefault(rule_id, [0.0, 0])
+            totals[0] += delta
+            totals[1] += new_entries
+
+    def get(self, rule_id: str, field_id: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(f"{rule_id}@{field_id}")
+
+    def confidence(self, rule_id: str, field_id: str, default: float) -> float:
+        entry = self._entries.get(f"{rule_id}@{field_id}")
+        return entry["confidence"] if entry is not None else default
+
+    def confidences(self, rule_ids: Sequence[str], field_id: str, default: float) -> List[float]:
+        return [self.confidence(rule_id, field_id, default) for rule_id in rule_ids]
+
+    def confidence_matrix(self, rule_ids: Sequence[str], field_ids: Sequence[str], default: float) -> List[List[float]]:
+        """Confidences for every (rule, field) pair, one row per rule."""
+        return [[self.confidence(rule_id, field_id, default) for field_id in field_ids] for rule_id in rule_ids]
+
+    def put(self, rule_id: str, field_id: str, entry: Dict[str, Any]):
+        """Stores an entry as-is (used when loading memory)."""
+        key = f"{rule_id}@{field_id}"
+        with self._stripe(self._key_locks, key):
+            old = self._entries.get(key)
+            self._entries[key] = dict(entry)
+            if old is None:
+                self._index_new_key(rule_id, field_id)
+                self._adjust_totals(rule_id, entry["confidence"], 1)
+            else:
+                self._adjust_totals(rule_id, entry["confidence"] - old["confidence"], 0)
+
+    def update(self, rule_id: str, field_id: str, default: Dict[str, Any],
+               apply: Callable[[Dict[str, Any]], Any]) -> Any:
+        """
+        Atomically mutates one entry (created from `default` if missing) with apply(entry)
+        and returns whatever apply returns. Only the entry's stripe is locked.
+        """
+        key = f"{rule_id}@{field_id}"
+        with self._stripe(self._key_locks, key):
+            entry = self._entries.get(key)
+            is_new = entry is None
+            if is_new:
+                entry = self._entries[key] = dict(default)
+                self._index_new_key(rule_id, field_id)
+            before = 0.0 if is_new else entry["confidence"]
+            result = apply(entry)
+            self._adjust_totals(rule_id, entry["confidence"] - before, 1 if is_new else 0)
+        return result
+
+    def average_confidence(self, rule_id: str) -> Optional[float]:
+        """Mean learned confidence of a rule across every field it has run on, or None."""
+        with self._stripe(self._rule_locks, rule_id):
+            totals = self._rule_totals.get(rule_id)
+            if not totals or not totals[1]:
+                return None
+            return totals[0] / totals[1]
+
+    def fields_for_rule(self, rule_id: str) -> Set[str]:
+        with self._index_lock:
+            return set(self._by_rule.get(rule_id, ()))
+
+    def rules_for_field(self, field_id: str) -> Set[str]:
+        with self._index_lock:
+            return set(self._by_field.get(field_id, ()))
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Holds every key stripe (in a fixed order) for a point-in-time view."""
+        with ExitStack() as stack:
+            for lock in self._key_locks:
+                stack.enter_context(lock)
+            yield
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self.locked():
+            return {k: dict(v) for k, v in self._entries.items()}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisHeuristicStore:
+    """
+    Heuristic memory shared by every worker process through Redis.
+    Each 'rule@field' entry is a hash; counters move with HINCRBY inside a
+    WATCH/MULTI transaction (so the clamped confidence is computed from the value
+    actually stored), and per-rule sum/count hashes keep averages O(1).
+    Multi-rule reads are pipelined into a single round trip.
+    """
+    def __init__(self, client: Any, prefix: str = "agriadvisor:heuristics"):
+        self.client = client
+        self.prefix = prefix
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.prefix}:entry:{key}"
+
+    def _rule_key(self, rule_id: str) -> str:
+        return f"{self.prefix}:rule:{rule_id}"
+
+    @staticmethod
+    def _text(value: Any) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    @classmethod
+    def _decode(cls, raw: Dict[Any, Any]) -> Optional[Dict[str, Any]]:
+        if not raw:
+            return None
+        raw = {cls._text(k): cls._text(v) for k, v in raw.items()}
+        return {"confidence": float(raw.get("confidence", 0.0)),
+                "successes": int(raw.get("successes", 0)), "failures": int(raw.get("failures", 0))}
+
+    def get(self, rule_id: str, field_id: str) -> Optional[Dict[str, Any]]:
+        return self._decode(self.client.hgetall(self._entry_key(f"{rule_id}@{field_id}")))
+
+    def confidence(self, rule_id: str, field_id: str, default: float) -> float:
+        value = self.client.hget(self._entry_key(f"{rule_id}@{field_id}"), "confidence")
+        return float(self._text(value)) if value is not None else default
+
+    def confidences(self, rule_ids: Sequence[str], field_id: str, default: float) -> List[float]:
+        return [row[0] for row in self.confidence_matrix(rule_ids, [field_id], default)]
+
+    def confidence_matrix(self, rule_ids: Sequence[str], field_ids: Sequence[str], default: float) -> List[List[float]]:
+        pipe = self.client.pipeline(transaction=False)
+        for rule_id in rule_ids:
+            for field_id in field_ids:
+                pipe.hget(self._entry_key(f"{rule_id}@{field_id}"), "confidence")
+        values = iter(pipe.execute())
+        return [[float(self._text(v)) if v is not None else default for v in (next(values) for _ in field_ids)]
+                for _ in rule_ids]
+
+    def _write(self, pipe: Any, rule_id: str, field_id: str, before: Optional[Dict[str, Any]], after: Dict[str, Any]):
+        key = f"{rule_id}@{field_id}"
+        entry_key = self._entry_key(key)
+        old = before or {"confidence": 0.0, "successes": 0, "failures": 0}
+        pipe.hset(entry_key, "confidence", repr(float(after["confidence"])))
+        pipe.hincrby(entry_key, "successes", after["successes"] - old["successes"])
+        pipe.hincrby(entry_key, "failures", after["failures"] - old["failures"])
+        pipe.hincrbyfloat(self._rule_key(rule_id), "sum", after["confidence"] - old["confidence"])
+        if before is None:
+            pipe.hincrby(self._rule_key(rule_id), "count", 1)
+            pipe.sadd(f"{self.prefix}:keys", key)
+            pipe.sadd(f"{self.prefix}:rule_fields:{rule_id}", field_id)
+            pipe.sadd(f"{self.prefix}:field_rules:{field_id}", rule_id)
+
+    def put(self, rule_id: str, field_id: str, entry: Dict[str, Any]):
+        def store(pipe):
+            before = self._decode(pipe.hgetall(self._entry_key(f"{rule_id}@{field_id}")))
+            pipe.multi()
+            self._write(pipe, rule_id, field_id, before, dict(entry))
+        self.client.transaction(store, self._entry_key(f"{rule_id}@{field_id}"))
+
+    def seed(self, entries: Dict[str, Dict[str, Any]]) -> int:
+        """
+        One-time import of existing memory (e.g. the file-mode snapshot) into an empty prefix.
+        SETNX on a marker key lets only the first worker ever try; the import is one
+        transaction, skipped if anything was learned meanwhile. Returns the entries written.
+        """
+        if not entries or not self.client.setnx(f"{self.prefix}:seeded", 1):
+            return 0
+        keys = f"{self.prefix}:keys"
+        def load(pipe):
+            if pipe.scard(keys):
+                return 0
+            pipe.multi()
+            for key, entry in entries.items():
+                self._write(pipe, *split_key(key), None, entry)
+            return len(entries)
+        return self.client.transaction(load, keys, value_from_callable=True)
+
+    def update(self, rule_id: str, field_id: str, default: Dict[str, Any],
+               apply: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Same contract as HeuristicStore.update. `apply` may re-run if another worker races us."""
+        entry_key = self._entry_key(f"{rule_id}@{field_id}")
+        outcome = []
+        def mutate(pipe):
+            before = self._decode(pipe.hgetall(entry_key))
+            entry = dict(before or default)
+            outcome[:] = [apply(entry)]
+            pipe.multi()
+            self._write(pipe, rule_id, field_id, before, entry)
+        self.client.transaction(mutate, entry_key)
+        return outcome[0]
+
+    def average_confidence(self, rule_id: str) -> Optional[float]:
+        total, count = self.client.hmget(self._rule_key(rule_id), "sum", "count")
+        if not count or not int(self._text(count)):
+            return None
+        return float(self._text(total)) / int(self._text(count))
+
+    def fields_for_rule(self, rule_id: str) -> Set[str]:
+        return {self._text(f) for f in self.client.smembers(f"{self.prefix}:rule_fields:{rule_id}")}
+
+    def rules_for_field(self, field_id: str) -> Set[str]:
+        return {self._text(r) for r in self.client.smembers(f"{self.prefix}:field_rules:{field_id}")}
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        keys = sorted(self._text(k) for k in self.client.smembers(f"{self.prefix}:keys"))
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(self._entry_key(key))
+        return {key: entry for key, entry in zip(keys, map(self._decode, pipe.execute())) if entry}
+
+    def __len__(self) -> int:
+        return self.client.scard(f"{self.prefix}:keys")
@@ -0,0 +1,368 @@
+# src/ai/rule_compiler.py
+import ast
+import functools
+import logging
+import operator
+from typing import Dict, Any, List, Tuple, Callable, Iterable, Optional
+import numpy as np
+
+# Names the compiled predicates receive as arguments
+READING_ARG = '_reading'
+PREDICTION_ARG = '_prediction'
+
+# Rule conditions are plain comparisons and boolean logic over sensor fields.
+# Anything outside this whitelist (calls, attributes, subscripts...) is rejected.
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.Name, ast.Load, ast.Constant, ast.Tuple, ast.List, ast.Set,
+)
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+class RuleCompilationError(Exception):
+    pass
+
+class CompiledRule:
+    """A decision rule whose condition has been turned into a ready-to-call predicate."""
+    __slots__ = ('index', 'rule', 'id', 'priority', 'action', 'expression', 'predicate', 'fields', 'mask')
+
+    def __init__(self, index: int, rule: Dict[str, Any], expression: ast.expr, predicate: Callable,
+                 fields: Iterable[str] = (), mask: Optional[Callable] = None):
+        self.index = index                  # Position in the knowledge file (tie-breaker)
+        self.rule = rule
+        self.id = rule.get('id', f"#{index}")
+        self.priority = rule.get('priority', 0)
+        self.action = rule.get('action')
+        self.expression = expression        # Resolved AST, reused by the index/batch engines
+        self.predicate = predicate          # predicate(reading, prediction) -> truthy on match
+        self.fields = frozenset(fields)     # Reading fields the condition reads
+        self.mask = mask                    # mask(columns) -> per-row truth values (batch mode)
+
+    def matches(self, reading: Dict[str, Any], prediction: str) -> bool:
+        """Evaluates the rule. A reading missing a referenced field never matches."""
+        try:
+            return bool(self.predicate(reading, prediction))
+        except Exception:
+            return False
+
+class _NameResolver(ast.NodeTransformer):
+    """
+    Binds every bare name in a condition the same way the old eval() context did:
+    thresholds win over the prediction, which wins over the sensor reading.
+    Scalar thresholds are folded into constants at compile time.
+    """
+    def __init__(self, constants: Dict[str, Any]):
+        self.constants = constants
+        self.reading_fields = set()
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id in self.constants:
+            value = self.constants[node.id]
+            if isinstance(value, _SCALAR_TYPES):
+                return ast.copy_location(ast.Constant(value=value), node)
+            return node # Non-scalar threshold, looked up in the predicate's globals
+        if node.id == 'prediction':
+            return ast.copy_location(ast.Name(id=PREDICTION_ARG, ctx=ast.Load()), node)
+        self.reading_fields.add(node.id)
+        lookup = ast.Subscript(value=ast.Name(id=READING_ARG, ctx=ast.Load()),
+                               slice=ast.Constant(value=node.id), ctx=ast.Load())
+        return ast.copy_location(lookup, node)
+
+def compile_rule(index: int, rule: Dict[str, Any], constants: Dict[str, Any],
+                 known_fields: Optional[Iterable[str]] = None) -> CompiledRule:
+    """
+    Parses a rule's condition once and builds a predicate(reading, prediction).
+    Raises RuleCompilationError if the condition cannot be used.
+    """
+    rule_id = rule.get('id', f"#{index}")
+    condition = rule.get('condition')
+    if not isinstance(condition, str) or not condition.strip():
+        raise RuleCompilationError(f"Rule {rule_id} has no condition.")
+
+    try:
+        tree = ast.parse(condition.strip(), mode='eval')
+    except SyntaxError as e:
+        raise RuleCompilationError(f"Rule {rule_id} has invalid syntax: {e.msg}")
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise RuleCompilationError(f"Rule {rule_id} uses unsupported construct '{type(node).__name__}'.")
+
+    resolver = _NameResolver(constants)
+    expression = resolver.visit(tree).body
+
+    if known_fields is not None:
+        unknown = resolver.reading_fields - set(known_fields)
+        if unknown:
+            # Still compiled: the reading may carry extra keys. Flag it once here
+            # rather than failing on every request.
+            logging.warning(f"Rule {rule_id} references fields outside the sensor schema: {sorted(unknown)}")
+
+    args = ast.arguments(posonlyargs=[], args=[ast.arg(arg=READING_ARG), ast.arg(arg=PREDICTION_ARG)],
+                         kwonlyargs=[], kw_defaults=[], defaults=[])
+    lambda_tree = ast.fix_missing_locations(ast.Expression(body=ast.Lambda(args=args, body=expression)))
+    namespace = {"__builtins__": {}}
+    namespace.update({k: v for k, v in constants.items() if not isinstance(v, _SCALAR_TYPES)})
+    try:
+        predicate = eval(compile(lambda_tree, f"<rule {rule_id}>", 'eval'), namespace)
+    except Exception as e:
+        raise RuleCompilationError(f"Rule {rule_id} could not be compiled: {e}")
+
+    return CompiledRule(index, rule, expression, predicate,
+                        fields=resolver.reading_fields, mask=_vectorize(expression, constants))
+
+def compile_rules(rules: List[Dict[str, Any]], constants: Dict[str, Any],
+                  known_fields: Optional[Iterable[str]] = None) -> Tuple[List[CompiledRule], Dict[str, str]]:
+    """
+    Compiles a whole rule set. Returns the compiled rules (in knowledge-file order)
+    and a map of rule id -> reason for every rule that was rejected.
+    """
+    compiled, failures = [], {}
+    for index, rule in enumerate(rules):
+        try:
+            compiled.append(compile_rule(index, rule, constants, known_fields))
+        except RuleCompilationError as e:
+            failures[rule.get('id', f"#{index}")] = str(e)
+            logging.error(f"RULE COMPILER: {e}")
+    return compiled, failures
+
+# --- Vectorized (batch) evaluation ---
+_VECTOR_COMPARE = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge,
+    ast.In: lambda a, b: np.isin(a, list(b)), ast.NotIn: lambda a, b: ~np.isin(a, list(b)),
+    ast.Is: np.frompyfunc(operator.is_, 2, 1), ast.IsNot: np.frompyfunc(operator.is_not, 2, 1),
+}
+_VECTOR_BINOP = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+}
+_python_truth = np.frompyfunc(bool, 1, 1)
+
+def truth(values: Any) -> np.ndarray:
+    """Python truthiness, element-wise."""
+    arr = np.asarray(values)
+    if arr.dtype == bool:
+        return arr
+    if arr.dtype.kind in 'OUS':
+        return _python_truth(arr).astype(bool)
+    return arr.astype(bool)
+
+def _vectorize(node: ast.expr, constants: Dict[str, Any]) -> Callable[[Dict[str, Any]], Tuple[Any, Any]]:
+    """
+    Turns a resolved condition AST into a function over a dict of column arrays. It returns
+    (values, errors): errors marks the rows where the scalar predicate would have raised
+    (a missing field it actually reads, after Python's short-circuiting), which never match.
+    """
+    field = _tested_field(node)
+    if field is not None:
+        def lookup(cols):
+            present = cols[PRESENT_KEY].get(field)
+            return cols[field], (False if present is None else ~present)
+        return lookup
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda cols: (value, False)
+    if isinstance(node, ast.Name): # Non-scalar threshold
+        value = constants[node.id]
+        return lambda cols: (value, False)
+    if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+        items = [_vectorize(e, constants) for e in node.elts]
+        container = {ast.Tuple: tuple, ast.List: list, ast.Set: set}[type(node)]
+        def collect(cols):
+            evaluated = [item(cols) for item in items]
+            return container(v for v, _ in evaluated), functools.reduce(np.logical_or, [e for _, e in evaluated], False)
+        return collect
+    if isinstance(node, ast.BoolOp):
+        parts = [_vectorize(v, constants) for v in node.values]
+        is_and = isinstance(node.op, ast.And)
+        combine = np.logical_and if is_and else np.logical_or
+        def boolean(cols):
+            value, errors = parts[0](cols)
+            result = truth(value)
+            for part in parts[1:]:
+                # Later operands are only evaluated where the result is still undecided
+                undecided = np.logical_and(result if is_and else ~result, ~np.asarray(errors))
+                value, part_errors = part(cols)
+                errors = np.logical_or(errors, np.logical_and(undecided, part_errors))
+                result = combine(result, truth(value))
+            return result, errors
+        return boolean
+    if isinstance(node, ast.UnaryOp):
+        operand = _vectorize(node.operand, constants)
+        if isinstance(node.op, ast.Not):
+            def negate(cols):
+                value, errors = operand(cols)
+                return ~truth(value), errors
+            return negate
+        unary = operator.neg if isinstance(node.op, ast.USub) else operator.pos
+        def apply_unary(cols):
+            value, errors = operand(cols)
+            return unary(value), errors
+        return apply_unary
+    if isinstance(node, ast.BinOp):
+        left, right = _vectorize(node.left, constants), _vectorize(node.right, constants)
+        binop = _VECTOR_BINOP[type(node.op)]
+        checks_zero = isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod))
+        def arithmetic(cols):
+            (a, a_errors), (b, b_errors) = left(cols), right(cols)
+            errors = np.logical_or(a_errors, b_errors)
+            if checks_zero and np.any(np.logical_and(np.asarray(b) == 0, ~np.asarray(errors))):
+                raise ZeroDivisionError("division by zero") # Let the scalar path decide
+            return binop(a, b), errors
+        return arithmetic
+    if isinstance(node, ast.Compare):
+        operands = [_vectorize(n, constants) for n in [node.left] + node.comparators]
+        ops = [_VECTOR_COMPARE[type(op)] for op in node.ops]
+        def compare(cols):
+            # a < b < c  ==  (a < b) and (b < c); c is only evaluated where a < b held
+            left, errors = operands[0](cols)
+            mask = True
+            for position, (op, operand) in enumerate(zip(ops, operands[1:])):
+                right, right_errors = operand(cols)
+                if position:
+                    right_errors = np.logical_and(right_errors, np.logical_and(mask, ~np.asarray(errors)))
+                errors = np.logical_or(errors, right_errors)
+                mask = np.logical_and(mask, truth(op(left, right)))
+                left = right
+            return mask, errors
+        return compare
+    raise RuleCompilationError(f"Cannot vectorize '{type(node).__name__}'.")
+
+def columns_from_readings(readings: List[Dict[str, Any]],
+                          fields: Iterable[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """
+    Builds column arrays from reading dicts. Numeric columns get a numeric dtype;
+    anything else (strings, mixed types, None values) stays an object array.
+    Also returns, for every field some readings lack, a boolean "present" mask;
+    the missing slots hold a placeholder (0 or None) that evaluation ignores.
+    """
+    columns, present = {}, {}
+    for field in fields:
+        values = [r.get(field) for r in readings]
+        has_field = np.fromiter((field in r for r in readings), dtype=bool, count=len(readings))
+        kinds = {type(v) for v, has in zip(values, has_field) if has}
+        if not has_field.all():
+            present[field] = has_field
+        if kinds <= {int}:
+            columns[field] = np.array([v if has else 0 for v, has in zip(values, has_field)], dtype=np.int64)
+        elif kinds <= {int, float}:
+            columns[field] = np.array([v if has else 0 for v, has in zip(values, has_field)], dtype=np.float64)
+        else:
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            columns[field] = column
+    return columns, present
+
+def evaluate_masks(compiled_rules: List[CompiledRule], columns: Dict[str, Any], predictions: Any, rows: int,
+                   present: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+    """
+    Evaluates every rule over a whole batch at once. Returns a (rules x rows) boolean matrix.
+    present maps a column to the rows that actually carry it (absent: every row does).
+    A rule whose vectorized form fails on this data (missing column, mixed types...)
+    falls back to its scalar predicate row by row, so the result always matches decide_action.
+    """
+    present = present or {}
+    cols = dict(columns)
+    cols[PREDICTION_KEY] = predictions
+    cols[PRESENT_KEY] = present
+    masks = np.zeros((len(compiled_rules), rows), dtype=bool)
+    for i, compiled in enumerate(compiled_rules):
+        try:
+            with np.errstate(all='ignore'):
+                value, errors = compiled.mask(cols)
+                masks[i] = np.broadcast_to(np.logical_and(truth(value), ~np.asarray(errors)), (rows,))
+        except Exception:
+            # Plain Python values, so the scalar predicate sees exactly what decide_action would
+            values = {f: np.asarray(columns[f]).tolist() for f in compiled.fields if f in columns}
+            has = {f: present[f].tolist() for f in values if f in present}
+            row_predictions = np.asarray(predictions).tolist()
+            for row in range(rows):
+                reading = {f: column[row] for f, column in values.items() if f not in has or has[f][row]}
+                masks[i, row] = compiled.matches(reading, row_predictions[row])
+    return masks
+
+# --- Rule index (Rete-lite discrimination on equality tests) ---
+PREDICTION_KEY = 'prediction'
+PRESENT_KEY = '__present__' # Batch columns: per-field masks of the rows that carry the field
+_MISSING = object()
+
+def _tested_field(node: ast.expr) -> Optional[str]:
+    """Returns the reading field (or 'prediction') a resolved AST node reads, if it is a plain lookup."""
+    if isinstance(node, ast.Name) and node.id == PREDICTION_ARG:
+        return PREDICTION_KEY
+    if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name)
+            and node.value.id == READING_ARG and isinstance(node.slice, ast.Constant)):
+        return node.slice.value
+    return None
+
+def _hashable_constant(node: ast.expr) -> bool:
+    return isinstance(node, ast.Constant) and isinstance(node.value, _SCALAR_TYPES)
+
+def _equality_tests(expression: ast.expr) -> List[Tuple[str, Tuple[Any, ...]]]:
+    """
+    Finds the tests a rule cannot match without: top-level conjuncts of the form
+    `field == CONST` or `field in (CONST, ...)`. Returns (field, allowed values) pairs.
+    """
+    conjuncts = expression.values if isinstance(expression, ast.BoolOp) and isinstance(expression.op, ast.And) else [expression]
+    tests = []
+    for node in conjuncts:
+        if not isinstance(node, ast.Compare) or len(node.ops) != 1:
+            continue
+        left, op, right = node.left, node.ops[0], node.comparators[0]
+        if isinstance(op, ast.Eq):
+            if _tested_field(left) is not None and _hashable_constant(right):
+                tests.append((_tested_field(left), (right.value,)))
+            elif _tested_field(right) is not None and _hashable_constant(left):
+                tests.append((_tested_field(right), (left.value,)))
+        elif isinstance(op, ast.In) and _tested_field(left) is not None:
+            if isinstance(right, (ast.Tuple, ast.List, ast.Set)) and right.elts and all(_hashable_constant(e) for e in right.elts):
+                tests.append((_tested_field(left), tuple(e.value for e in right.elts)))
+    return tests
+
+class RuleIndex:
+    """
+    Buckets compiled rules by one categorical equality test each, so a reading only
+    evaluates rules whose discriminating value it actually carries. Rules without
+    such a test always remain candidates.
+    """
+    def __init__(self, compiled_rules: List[CompiledRule]):
+        self.buckets: Dict[str, Dict[Any, List[CompiledRule]]] = {}
+        self.unindexed: List[CompiledRule] = []
+        for compiled in compiled_rules:
+            tests = _equality_tests(compiled.expression)
+            if not tests:
+                self.unindexed.append(compiled)
+                continue
+            # The most selective test (fewest allowed values) discriminates best
+            field, values = min(tests, key=lambda t: len(t[1]))
+            field_buckets = self.buckets.setdefault(field, {})
+            for value in set(values):
+                field_buckets.setdefault(value, []).append(compiled)
+
+    @staticmethod
+    def evaluation_order(compiled: CompiledRule) -> Tuple[Any, int]:
+        """Highest priority first, then knowledge-file order."""
+        return (-compiled.priority, compiled.index)
+
+    def candidates(self, reading: Dict[str, Any], prediction: str) -> List[CompiledRule]:
+        """Rules that can possibly match this reading, in evaluation order."""
+        found = list(self.unindexed)
+        for field, field_buckets in self.buckets.items():
+            value = prediction if field == PREDICTION_KEY else reading.get(field, _MISSING)
+            try:
+                bucket = field_buckets.get(value)
+            except TypeError: # Unhashable reading value can't equal a scalar constant
+                continue
+            if bucket:
+                found.extend(bucket)
+        found.sort(key=RuleIndex.evaluation_order)
+        return found
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "indexed_fields": {field: len(b) for field, b in self.buckets.items()},
+            "unindexed_rules": len(self.unindexed)
+        }
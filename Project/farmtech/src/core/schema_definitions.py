@@ -1,5 +1,6 @@
 # src/core/schema_definitions.py
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple, Callable, Sequence
+import numpy as np
 
 # The definitive schema definition, used by the AI and API
 # --- NEW FIELDS ADDED ---
@@ -15,6 +16,19 @@ SENSOR_DATA_SCHEMA: Dict[str, Any] = {
     "solar_radiation": int   # <-- NEW
 }
 
+# Newer fields older sensors don't send yet; readings without them get these values
+OPTIONAL_FIELD_DEFAULTS: Dict[str, Any] = {"wind_speed": 0, "solar_radiation": 0}
+
+# Inclusive bounds, checked once every field has the right type
+FIELD_RANGES: Dict[str, Tuple[int, int]] = {"moisture": (0, 100), "temp": (0, 50)}
+
+# Structured validation errors: (error code, offending field or None)
+NOT_AN_OBJECT = "NOT_AN_OBJECT"
+MISSING_FIELD = "MISSING_FIELD"
+WRONG_TYPE = "WRONG_TYPE"
+OUT_OF_RANGE = "OUT_OF_RANGE"
+ValidationError = Tuple[str, Optional[str]]
+
 # --- NEW: Dropdown options for the user-friendly UI ---
 NUTRIENT_LEVELS: Dict[str, str] = {
     "LOW": "Low nutrient concentration.",
@@ -29,26 +43,110 @@ HISTORICAL_TRENDS: Dict[str, str] = {
 }
 # --- END NEW ---
 
+class _Missing:
+    """Marks an absent value in a column (None is a real, if invalid, value)."""
+    def __repr__(self) -> str:
+        return "MISSING"
+
+MISSING = _Missing()
+
+def compile_validator(schema: Dict[str, Any] = SENSOR_DATA_SCHEMA,
+                      optional: Dict[str, Any] = OPTIONAL_FIELD_DEFAULTS,
+                      ranges: Dict[str, Tuple[int, int]] = FIELD_RANGES) -> Callable[[Any], Optional[ValidationError]]:
+    """
+    Generates a straight-line validate(record) for the schema: one lookup and one
+    exact type check per field, then the range checks. It returns None for a valid
+    record or a prebuilt (code, field) tuple, and never touches the record.
+    Fields are checked in schema order, so the first failing field is reported.
+    """
+    namespace: Dict[str, Any] = {"MISSING": MISSING, "NOT_AN_OBJECT_ERROR": (NOT_AN_OBJECT, None)}
+    lines = ["def validate(record):",
+             "    if not isinstance(record, dict): return NOT_AN_OBJECT_ERROR",
+             "    get = record.get"]
+    for i, (field, expected_type) in enumerate(schema.items()):
+        namespace[f"T{i}"] = expected_type
+        namespace[f"MISSING{i}"] = (MISSING_FIELD, field)
+        namespace[f"WRONG{i}"] = (WRONG_TYPE, field)
+        lines.append(f"    v = get({field!r}, MISSING)")
+        if field in optional:
+            lines.append(f"    if v is not MISSING and type(v) is not T{i}: return WRONG{i}")
+        else:
+            lines.append(f"    if v is MISSING: return MISSING{i}")
+            lines.append(f"    if type(v) is not T{i}: return WRONG{i}")
+    for i, (field, (low, high)) in enumerate(ranges.items()):
+        namespace[f"RANGE{i}"] = (OUT_OF_RANGE, field)
+        default = optional.get(field, low)
+        lines.append(f"    if not ({low!r} <= get({field!r}, {default!r}) <= {high!r}): return RANGE{i}")
+    lines.append("    return None")
+    exec(compile("\n".join(lines), "<schema validator>", "exec"), namespace)
+    return namespace["validate"]
+
+validate_record = compile_validator()
+
+def apply_optional_defaults(record: Dict[str, Any]) -> Dict[str, Any]:
+    """The record itself if it has every optional field, otherwise a copy with the defaults filled in."""
+    for field in OPTIONAL_FIELD_DEFAULTS:
+        if field not in record:
+            return {**OPTIONAL_FIELD_DEFAULTS, **record}
+    return record
+
+def _type_column(values: Any, expected_type: type, rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(missing, wrong_type) masks for one column; typed NumPy arrays skip the per-value work."""
+    if isinstance(values, np.ndarray) and values.dtype != object:
+        kind_ok = (values.dtype.kind in "iu") if expected_type is int else (values.dtype.kind == "U") if expected_type is str else False
+        if kind_ok:
+            none = np.zeros(rows, dtype=bool)
+            return none, none
+    types = np.fromiter(map(type, values), dtype=object, count=rows)
+    missing = types == _Missing
+    return missing, ~missing & (types != expected_type)
+
+def validate_columns(columns: Dict[str, Sequence[Any]], rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Validates a whole batch given as columns (lists or NumPy arrays, MISSING for absent
+    values; a column left out entirely counts as missing everywhere).
+    Returns (codes, fields): object arrays holding each row's error code and field, None where valid.
+    Rows get the same first error validate_record would report.
+    """
+    codes = np.full(rows, None, dtype=object)
+    fields = np.full(rows, None, dtype=object)
+    failed = np.zeros(rows, dtype=bool)
+
+    def mark(mask: np.ndarray, code: str, field: str):
+        new = mask & ~failed
+        codes[new] = code
+        fields[new] = field
+        failed[:] |= new
+
+    for field, expected_type in SENSOR_DATA_SCHEMA.items():
+        if field not in columns:
+            if field not in OPTIONAL_FIELD_DEFAULTS:
+                mark(np.ones(rows, dtype=bool), MISSING_FIELD, field)
+            continue
+        missing, wrong_type = _type_column(columns[field], expected_type, rows)
+        if field not in OPTIONAL_FIELD_DEFAULTS:
+            mark(missing, MISSING_FIELD, field)
+        mark(wrong_type, WRONG_TYPE, field)
+
+    for field, (low, high) in FIELD_RANGES.items():
+        if field not in columns:
+            continue
+        values = columns[field]
+        checkable = ~failed
+        if not (isinstance(values, np.ndarray) and values.dtype.kind in "iu"):
+            # Only rows that passed the type checks hold ints here; others are left at the low bound
+            default = OPTIONAL_FIELD_DEFAULTS.get(field, low)
+            values = np.array([v if ok and v is not MISSING else default for v, ok in zip(values, checkable)], dtype=np.int64)
+        mark(checkable & ((values < low) | (values > high)), OUT_OF_RANGE, field)
+    return codes, fields
+
+def validate_records(records: List[Any]) -> List[Optional[ValidationError]]:
+    """
+    One (code, field) or None per record. For row-shaped input the compiled validator
+    is already cheaper than building columns; validate_columns is for columnar uploads.
+    """
+    return [validate_record(r) for r in records]
 
 def is_valid_schema(data: Dict[str, Any]) -> bool:
     """Checks if a dictionary conforms to the SENSOR_DATA_SCHEMA."""
-    for field, expected_type in SENSOR_DATA_SCHEMA.items():
-        if field not in data:
-            # Allow new fields to be optional for now
-            if field in ['wind_speed', 'solar_radiation']:
-                data[field] = 0 # Default value
-            else:
-                logging.warning(f"Schema Validation Failed: Missing key {field}")
-                return False
-        
-        if not isinstance(data.get(field), expected_type):
-            logging.warning(f"Schema Validation Failed: Key {field} has wrong type. Expected {expected_type}, got {type(data.get(field))}")
-            return False
-            
-    # Basic range checks
-    if not (0 <= data['moisture'] <= 100): return False
-    if not (0 <= data['temp'] <= 50): return False
-    
-    return True
-
-import logging # Make sure logging is imported
\ No newline at end of file
+    return validate_record(data) is None
@@ -1,33 +1,60 @@
 # --- CHANGED ---
 # import sqlite3 # No longer need this
+import datetime
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Union
 from src.services.db_connector import DBConnector # --- ADDED ---
+from src.services.sql_statements import register_statement
+from src.services.sensor_rollups import ROLLUP_METRICS, ROLLUP_GRANULARITIES
+from src.ml.history_cache import FieldHistoryCache, HISTORY_COLUMNS
 
-def load_historical_data(field_id: str, days: int = 30) -> List[Dict[str, Any]]:
+# Hot path (/api/soil_analysis): declared once, prepared per pooled connection
+FIELD_HISTORY = register_statement("field_history", f"""
+    SELECT {', '.join(HISTORY_COLUMNS)}
+    FROM sensor_data
+    WHERE field_id = ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+""")
+_HISTORY_DESCRIPTION = [(column,) for column in HISTORY_COLUMNS]
+
+# Recent readings of the fields being polled; the SensorDataWriter keeps it current
+HISTORY_CACHE = FieldHistoryCache(
+    lambda field_id, limit: DBConnector.execute_statement(FIELD_HISTORY, (field_id, limit), row_format="tuple"))
+
+# Summary reads touch only the rollup tables (one row per field per hour/day)
+_ROLLUP_READS = {
+    granularity: (
+        register_statement(f"rollup_{granularity}", f"""
+            SELECT * FROM sensor_rollup_{granularity}
+            WHERE field_id = ? AND bucket >= ? AND bucket < ? ORDER BY bucket"""),
+        register_statement(f"action_rollup_{granularity}", f"""
+            SELECT bucket, ai_action, readings FROM sensor_action_rollup_{granularity}
+            WHERE field_id = ? AND bucket >= ? AND bucket < ?"""),
+    ) for granularity in ROLLUP_GRANULARITIES
+}
+SUMMARY_GRANULARITIES = ROLLUP_GRANULARITIES + ["weekly"]
+
+def load_historical_data(field_id: str, days: int = 30, row_format: str = "dict") -> List[Any]:
     """
     Fetches historical sensor data for training or context
     using the thread-safe DBConnector. (Task 2)
+    row_format: "dict" (default), "tuple" or "namedtuple".
+    The newest readings of recently read fields come from HISTORY_CACHE, not the database.
     """
     # DB_NAME = "local_farm_data.db" # --- REMOVED ---
-    query = f"""
-        SELECT moisture, temp, nutrient_level, pump_pressure, ai_action, timestamp 
-        FROM sensor_data 
-        WHERE field_id = ? 
-        ORDER BY timestamp DESC 
-        LIMIT ?
-    """
     # conn = None # --- REMOVED ---
     
     # --- CHANGED ---
     # The entire try/except/finally block is replaced
     # with one call to the efficient DBConnector.
     
-    historical_data = DBConnector.execute_query(query, (field_id, days))
+    rows = HISTORY_CACHE.recent(field_id, days)
 
-    if historical_data is None:
+    if rows is None:
         logging.error(f"DBConnector failed to load historical data for {field_id}.")
         return []
+    historical_data = FIELD_HISTORY.shape(_HISTORY_DESCRIPTION, rows, row_format)
     
     logging.info(f"Loaded {len(historical_data)} historical records for {field_id}.")
     return historical_data
@@ -38,4 +65,63 @@ def load_historical_data(field_id: str, days: int = 30) -> List[Dict[str, Any]]:
     #     ... (all old logic) ...
     # finally:
     #     if conn:
-    #         conn.close()
\ No newline at end of file
+    #         conn.close()
+
+def _summary_bucket(bucket: Any, granularity: str) -> str:
+    """Rollup bucket as a string; for weekly summaries, the Monday of its week."""
+    bucket = bucket if isinstance(bucket, str) else bucket.strftime('%Y-%m-%d %H:%M:%S')
+    if granularity != "weekly":
+        return bucket
+    day = datetime.datetime.strptime(bucket[:10], '%Y-%m-%d')
+    return (day - datetime.timedelta(days=day.weekday())).strftime('%Y-%m-%d 00:00:00')
+
+def _summary_range(granularity: str, time_range: Union[int, Tuple[str, str]]) -> Tuple[str, str]:
+    if not isinstance(time_range, int):
+        return time_range
+    now = datetime.datetime.utcnow()
+    if granularity == "hourly":
+        start = now.replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=24 * time_range - 1)
+    else:
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(days=time_range - 1)
+        if granularity == "weekly":
+            start -= datetime.timedelta(days=start.weekday()) # Whole weeks, starting on Monday
+    return start.strftime('%Y-%m-%d %H:%M:%S'), "9999-12-31 00:00:00"
+
+def load_historical_summary(field_id: str, granularity: str = "daily",
+                            time_range: Union[int, Tuple[str, str]] = 7) -> List[Dict[str, Any]]:
+    """
+    Per-bucket trends for a field, read from the pre-aggregated rollups only: readings,
+    min/max/mean/count of each metric and ai_action counts per hour, day or week.
+    time_range is a number of days back from now or a (start, end) pair of timestamps.
+    """
+    if granularity not in SUMMARY_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {SUMMARY_GRANULARITIES}")
+    start, end = _summary_range(granularity, time_range)
+    metric_statement, action_statement = _ROLLUP_READS["daily" if granularity == "weekly" else granularity]
+    rows = DBConnector.execute_statement(metric_statement, (field_id, start, end))
+    action_rows = DBConnector.execute_statement(action_statement, (field_id, start, end), row_format="tuple")
+
+    buckets: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        bucket = _summary_bucket(row["bucket"], granularity)
+        summary = buckets.setdefault(bucket, {"bucket": bucket, "readings": 0, "actions": {},
+                                              **{m: {"count": 0, "sum": 0.0, "min": None, "max": None} for m in ROLLUP_METRICS}})
+        summary["readings"] += row["readings"]
+        for m in ROLLUP_METRICS:
+            stats = summary[m]
+            stats["count"] += row[f"{m}_count"]
+            stats["sum"] += row[f"{m}_sum"]
+            for stat, pick in (("min", min), ("max", max)):
+                value = row[f"{m}_{stat}"]
+                if value is not None:
+                    stats[stat] = value if stats[stat] is None else pick(stats[stat], value)
+    for bucket, action, readings in action_rows:
+        bucket = _summary_bucket(bucket, granularity)
+        if bucket in buckets:
+            actions = buckets[bucket]["actions"]
+            actions[action] = actions.get(action, 0) + readings
+    for summary in buckets.values():
+        for m in ROLLUP_METRICS:
+            stats = summary[m]
+            stats["mean"] = stats.pop("sum") / stats["count"] if stats["count"] else None
+    return [buckets[b] for b in sorted(buckets)]
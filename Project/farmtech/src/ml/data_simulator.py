@@ -1,7 +1,15 @@
 # src/ml/data_simulator.py
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterator, List, Tuple
 import pandas as pd
 import numpy as np
 import logging
+from src.ml.feature_engineering import NUTRIENT_MAP, TREND_MAP
+from src.services.db_connector import DBConnector
+from src.services.sensor_data_writer import SENSOR_DATA_TABLE, SENSOR_DATA_COLUMNS
 
 def generate_simulated_data(records: int = 1000) -> pd.DataFrame:
     """
@@ -28,4 +36,125 @@ def generate_simulated_data(records: int = 1000) -> pd.DataFrame:
     
     df = pd.DataFrame(data)
     logging.info("Simulated data generation complete.")
-    return df
\ No newline at end of file
+    return df
+
+# --- Large-scale time-series generation (load tests, out-of-core training) ---
+SERIES_CHUNK_ROWS = 100000      # Rows per field generated (and written) at a time
+SERIES_INTERVAL_SEC = 60        # One reading per minute
+SERIES_START = '2025-01-01T00:00:00'
+IRRIGATION_RATE = 0.02          # Chance per hour that a field is irrigated (or it rains)
+EVAPORATION_RATE = 0.008        # Fraction of soil moisture lost per hour at 25C (more when hotter)
+NUTRIENT_LEVELS_CYCLE = ["N/A", "LOW", "OPTIMAL", "HIGH"]
+
+def _field_series(field_id: str, seed: Any, steps: int, interval: int = SERIES_INTERVAL_SEC,
+                  chunk_rows: int = SERIES_CHUNK_ROWS, start: str = SERIES_START) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    One field's readings as column chunks of at most chunk_rows. Temperature follows a
+    daily cycle; moisture decays faster when it is hot and jumps back up on irrigation.
+    Moisture, nutrients and the clock carry over from one chunk to the next.
+    """
+    rng = np.random.default_rng(seed)
+    base_temp = rng.uniform(18, 28)
+    trend = "HIGH_INTERVENTION" if rng.random() < 0.2 else "NORMAL"
+    nutrient = int(rng.choice(4, p=[.1, .2, .6, .1]))
+    moisture = rng.uniform(50, 80)
+    start_time = np.datetime64(start, 's')
+    for offset in range(0, steps, chunk_rows):
+        n = min(chunk_rows, steps - offset)
+        step = np.arange(offset, offset + n)
+        hour = (step * interval / 3600.0) % 24
+        temp = base_temp + 7 * np.sin(2 * np.pi * (hour - 9) / 24) + rng.normal(0, 1, n)
+        # Evaporation grows with temperature; irrigation resets moisture to a refill level
+        hours = interval / 3600.0
+        decay = np.log1p(-np.clip(EVAPORATION_RATE * (1 + 0.1 * (temp - 25)) * hours, 0.0, 0.5))
+        refills = rng.random(n) < IRRIGATION_RATE * hours
+        segment = np.cumsum(refills)
+        level = np.concatenate([[moisture], rng.uniform(70, 95, refills.sum())])[segment]
+        cumulative = np.cumsum(decay)
+        anchor = np.concatenate([[0.0], cumulative[refills]])[segment]
+        soil = np.clip(level * np.exp(cumulative - anchor) + rng.normal(0, 0.5, n), 0, 100)
+        moisture = float(soil[-1])
+        # Nutrients are re-tested a few times a month
+        changes = rng.random(n) < 1.0 / (10 * 86400 / interval)
+        nutrient_codes = (nutrient + np.cumsum(changes * rng.choice([-1, 1], n))) % 4
+        nutrient = int(nutrient_codes[-1])
+        solar = np.clip(900 * np.sin(2 * np.pi * (hour - 6) / 24), 0, None) + rng.normal(0, 20, n)
+        columns = {
+            "timestamp": np.char.replace(np.datetime_as_string(start_time + step * interval, unit='s'), 'T', ' '),
+            "field_id": np.full(n, field_id),
+            "moisture": np.rint(soil).astype(np.int64),
+            "temp": np.clip(np.rint(temp), 0, 50).astype(np.int64),
+            "nutrient_level": np.array(NUTRIENT_LEVELS_CYCLE)[nutrient_codes],
+            "pump_pressure": np.rint(rng.normal(70, 6, n)).astype(np.int64),
+            "historical_trend": np.full(n, trend),
+            "wind_speed": np.rint(rng.gamma(2.0, 4.0, n)).astype(np.int64),
+            "solar_radiation": np.clip(np.rint(solar), 0, None).astype(np.int64),
+        }
+        # Same relationship generate_simulated_data uses, so the rows are trainable
+        columns["yield_observed"] = (columns["moisture"] * 0.5 - columns["temp"] * 0.2
+                                     + np.array([NUTRIENT_MAP[v] for v in NUTRIENT_LEVELS_CYCLE])[nutrient_codes] * 0.3
+                                     - TREND_MAP[trend] * 1.0 + rng.normal(0, 5, n))
+        yield columns
+
+def _write_rows(columns: Dict[str, np.ndarray], retries: int = 5) -> bool:
+    """Bulk-inserts a chunk through the same path the ingestion writer uses."""
+    n = len(columns["field_id"])
+    ordered = [columns[c].tolist() if c in columns else [None] * n for c in SENSOR_DATA_COLUMNS]
+    rows = list(zip(*ordered))
+    for attempt in range(retries):
+        if DBConnector.insert_many(SENSOR_DATA_TABLE, SENSOR_DATA_COLUMNS, rows):
+            return True
+        time.sleep(0.5 * (attempt + 1)) # e.g. SQLite busy while another worker commits
+    return False
+
+def _generate_fields(task: Tuple[int, List[Tuple[str, Any]], int, int, int, str, str]) -> int:
+    """Worker: generates its fields chunk by chunk and streams each chunk to the sink."""
+    worker, fields, steps, interval, chunk_rows, sink, out_dir = task
+    written = 0
+    for field_id, seed in fields:
+        for part, columns in enumerate(_field_series(field_id, seed, steps, interval, chunk_rows)):
+            if sink == "db":
+                if not _write_rows(columns):
+                    raise RuntimeError(f"Could not write chunk {part} of {field_id}")
+            else:
+                np.savez_compressed(os.path.join(out_dir, f"{field_id}-{part:05d}.npz"), **columns)
+            written += len(columns["field_id"])
+    DBConnector.close_db()
+    return written
+
+def generate_time_series(fields: int, steps: int, seed: int = 42, workers: int = None, sink: str = "db",
+                         out_dir: str = "simulated_data", interval: int = SERIES_INTERVAL_SEC,
+                         chunk_rows: int = SERIES_CHUNK_ROWS) -> int:
+    """
+    Generates `fields` x `steps` readings across a process pool and streams them into
+    sensor_data (sink="db") or compressed per-chunk column files (sink="npz").
+    Each field gets its own child seed of `seed`, so output doesn't depend on the
+    worker count. Memory per worker is bounded by chunk_rows. Returns rows written.
+    """
+    workers = workers or os.cpu_count() or 1
+    if sink == "npz":
+        os.makedirs(out_dir, exist_ok=True)
+    seeds = np.random.SeedSequence(seed).spawn(fields)
+    field_seeds = [(f"SIM-{i:06d}", seeds[i]) for i in range(fields)]
+    tasks = [(w, field_seeds[w::workers], steps, interval, chunk_rows, sink, out_dir) for w in range(workers)]
+    logging.info(f"Generating {fields * steps} readings ({fields} fields x {steps} steps) with {workers} workers -> {sink}...")
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        total = sum(pool.map(_generate_fields, tasks))
+    logging.info(f"Generated {total} readings in {time.time() - start:.1f}s.")
+    return total
+
+if __name__ == "__main__":
+    # "python -m src.ml.data_simulator --fields 1000 --steps 50000 --sink db" (sensor_data must exist: start the server once)
+    parser = argparse.ArgumentParser(description="Generate per-field sensor time series for load tests.")
+    parser.add_argument("--fields", type=int, default=100)
+    parser.add_argument("--steps", type=int, default=10000, help="Readings per field.")
+    parser.add_argument("--interval", type=int, default=SERIES_INTERVAL_SEC, help="Seconds between readings.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: one per CPU).")
+    parser.add_argument("--sink", choices=["db", "npz"], default="db")
+    parser.add_argument("--out", default="simulated_data", help="Directory for --sink npz.")
+    parser.add_argument("--chunk-rows", type=int, default=SERIES_CHUNK_ROWS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    generate_time_series(args.fields, args.steps, args.seed, args.workers, args.sink, args.out, args.interval, args.chunk_rows)
@@ -1,25 +1,39 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+import numpy as np
 
 # Simple mapping for categorical features (should match model_config.json)
 NUTRIENT_MAP: Dict[str, int] = {"N/A": 0, "LOW": 1, "OPTIMAL": 2, "HIGH": 3}
 TREND_MAP: Dict[str, int] = {"NORMAL": 0, "HIGH_INTERVENTION": 1}
 
+# Every feature build_feature_matrix can produce, in its default column order
+FEATURE_NAMES: List[str] = [
+    "moisture", "temp", "pump_pressure",
+    "nutrient_level_encoded", "historical_trend_encoded", "heat_stress_index"
+]
+# Raw reading fields and the defaults apply_feature_engineering used for missing values
+RAW_FIELD_DEFAULTS: Dict[str, Any] = {
+    "moisture": 0, "temp": 0, "pump_pressure": 0, "nutrient_level": "N/A", "historical_trend": "NORMAL"
+}
+
+ReadingsOrColumns = Union[List[Dict[str, Any]], Dict[str, Sequence[Any]]]
+
 def apply_feature_engineering(raw_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Transforms raw sensor data into the numerical features required by the ML model.
+    Per-record version; batch scoring and training use build_feature_matrix.
     """
     processed_data = []
-    
+
     for record in raw_data:
         # 1. Encode Categorical Features
         nutrient_encoded = NUTRIENT_MAP.get(record.get('nutrient_level', 'N/A').upper(), 0)
         trend_encoded = TREND_MAP.get(record.get('historical_trend', 'NORMAL').upper(), 0)
-        
+
         # 2. Calculate Derived Features (e.g., Heat Stress Index)
         moisture = record.get('moisture', 0)
         temp = record.get('temp', 0)
-        heat_stress_index = (temp * 0.5) - (moisture * 0.1) 
-        
+        heat_stress_index = (temp * 0.5) - (moisture * 0.1)
+
         # 3. Create the final feature vector
         feature_vector = {
             "field_id": record.get('field_id'),
@@ -31,5 +45,90 @@ def apply_feature_engineering(raw_data: List[Dict[str, Any]]) -> List[Dict[str,
             "heat_stress_index": heat_stress_index
         }
         processed_data.append(feature_vector)
-        
-    return processed_data
\ No newline at end of file
+
+    return processed_data
+
+class FeatureBuffer:
+    """
+    Reusable float32 output for build_feature_matrix. Grows (doubling) when a batch
+    doesn't fit and is otherwise reused, so steady-state batches allocate no matrix.
+    A matrix returned from it is only valid until the buffer's next use.
+    """
+    def __init__(self, rows: int = 1024, features: int = len(FEATURE_NAMES)):
+        self._data = np.empty((rows, features), dtype=np.float32)
+
+    def view(self, rows: int, features: int) -> np.ndarray:
+        capacity, width = self._data.shape
+        if features != width:
+            self._data = np.empty((max(rows, capacity), features), dtype=np.float32)
+        elif rows > capacity:
+            self._data = np.empty((max(rows, capacity * 2), features), dtype=np.float32)
+        return self._data[:rows]
+
+def _encode(values: Sequence[Any], mapping: Dict[str, int], rows: int) -> np.ndarray:
+    """Dictionary-encodes a string column: uppercasing and lookups happen once per distinct value."""
+    if rows == 0:
+        return np.zeros(0, dtype=np.float32)
+    uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    codes = np.array([mapping.get(u.upper(), 0) for u in uniques.tolist()], dtype=np.float32)
+    return codes[inverse.reshape(-1)]
+
+def _columns(data: ReadingsOrColumns, needed: Sequence[str]) -> Tuple[Dict[str, Any], Any, int]:
+    """Normalizes readings or columns into ({name: column}, field_ids, rows)."""
+    if isinstance(data, dict):
+        rows = len(next(iter(data.values()))) if data else 0
+        columns = {name: data[name] if name in data else [RAW_FIELD_DEFAULTS.get(name, 0)] * rows for name in needed}
+        return columns, data.get("field_id"), rows
+    columns = {name: [r.get(name, RAW_FIELD_DEFAULTS.get(name, 0)) for r in data] for name in needed}
+    return columns, [r.get("field_id") for r in data], len(data)
+
+# Raw columns each feature is computed from when it isn't supplied ready-made
+_FEATURE_INPUTS: Dict[str, Tuple[str, ...]] = {
+    "moisture": ("moisture",), "temp": ("temp",), "pump_pressure": ("pump_pressure",),
+    "nutrient_level_encoded": ("nutrient_level",), "historical_trend_encoded": ("historical_trend",),
+    "heat_stress_index": ("temp", "moisture"),
+}
+
+def build_feature_matrix(data: ReadingsOrColumns, features: Sequence[str] = FEATURE_NAMES,
+                         out: Optional[FeatureBuffer] = None) -> Tuple[np.ndarray, Any]:
+    """
+    Columnar feature engineering. `data` is a list of readings or a dict of columns
+    (lists or NumPy arrays); a column already named like a feature (e.g. an encoded
+    column from the simulator) is used as-is. Returns a C-contiguous float32
+    (rows x features) matrix in `features` order, plus the field_id vector (None if absent).
+    """
+    provided = set(data) if isinstance(data, dict) else set()
+    needed = []
+    for feature in features:
+        for name in ((feature,) if feature in provided else _FEATURE_INPUTS[feature]):
+            if name not in needed:
+                needed.append(name)
+    columns, field_ids, rows = _columns(data, needed)
+    matrix = out.view(rows, len(features)) if out is not None else np.empty((rows, len(features)), dtype=np.float32)
+
+    for j, feature in enumerate(features):
+        target = matrix[:, j]
+        if feature in provided or feature in ("moisture", "temp", "pump_pressure"):
+            target[:] = columns[feature]
+        elif feature == "nutrient_level_encoded":
+            target[:] = _encode(columns["nutrient_level"], NUTRIENT_MAP, rows)
+        elif feature == "historical_trend_encoded":
+            target[:] = _encode(columns["historical_trend"], TREND_MAP, rows)
+        elif feature == "heat_stress_index":
+            np.multiply(np.asarray(columns["temp"], dtype=np.float32), 0.5, out=target)
+            target -= np.asarray(columns["moisture"], dtype=np.float32) * np.float32(0.1)
+    return matrix, field_ids
+
+# Scalar form of each feature for a single reading (hashable, used as cache keys)
+_SCALAR_FEATURES = {
+    "moisture": lambda r: r.get("moisture", 0),
+    "temp": lambda r: r.get("temp", 0),
+    "pump_pressure": lambda r: r.get("pump_pressure", 0),
+    "nutrient_level_encoded": lambda r: NUTRIENT_MAP.get(str(r.get("nutrient_level", "N/A")).upper(), 0),
+    "historical_trend_encoded": lambda r: TREND_MAP.get(str(r.get("historical_trend", "NORMAL")).upper(), 0),
+    "heat_stress_index": lambda r: (r.get("temp", 0), r.get("moisture", 0)),
+}
+
+def feature_key(record: Dict[str, Any], features: Sequence[str]) -> tuple:
+    """The encoded features of one reading as a tuple: equal tuples give equal predictions."""
+    return tuple(_SCALAR_FEATURES[feature](record) for feature in features)
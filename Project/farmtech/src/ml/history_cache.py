@@ -0,0 +1,115 @@
+# src/ml/history_cache.py
+import datetime
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from src.core.lru_cache import LRUCache
+from src.services.db_connector import IS_PRODUCTION
+from src.services.sensor_data_writer import SENSOR_DATA_COLUMNS
+
+# Columns of a cached history row, in the order FIELD_HISTORY selects them
+HISTORY_COLUMNS = ["moisture", "temp", "nutrient_level", "pump_pressure", "ai_action", "timestamp"]
+HISTORY_CACHE_FIELDS = int(os.environ.get('HISTORY_CACHE_FIELDS', 1000))  # Fields kept in memory; 0 disables
+HISTORY_CACHE_ROWS = int(os.environ.get('HISTORY_CACHE_ROWS', 50))        # Most recent readings kept per field
+
+_FIELD_ID = SENSOR_DATA_COLUMNS.index("field_id")
+_HISTORY_INDEX = [SENSOR_DATA_COLUMNS.index(c) for c in HISTORY_COLUMNS]
+_TIMESTAMP = HISTORY_COLUMNS.index("timestamp")
+
+def _timestamp_key(row: tuple) -> Any:
+    return row[_TIMESTAMP]
+
+class FieldHistoryCache:
+    """
+    The newest rows_per_field readings of recently read fields, newest first, evicted
+    LRU by field. A miss loads the field from the database; readings the
+    SensorDataWriter persists are merged into cached fields once committed, and the fields
+    of a flush whose outcome is uncertain are dropped. A load that overlaps a flush is
+    returned but not kept, so the cache never misses or repeats a row.
+    """
+    def __init__(self, load: Callable[[str, int], List[tuple]], max_fields: int = HISTORY_CACHE_FIELDS,
+                 rows_per_field: int = HISTORY_CACHE_ROWS):
+        self._load = load # load(field_id, limit) -> newest-first tuples in HISTORY_COLUMNS order
+        self.rows_per_field = rows_per_field
+        self._fields = LRUCache(max_fields) if max_fields > 0 and rows_per_field > 0 else None
+        self._lock = threading.Lock()
+        self._generation = 0  # Bumped when a flush starts and when it ends
+        self._writing = False # A flush is between its transaction and its commit listener
+        self.bypassed = 0     # Reads for more rows than are cached
+        self.merged_rows = 0
+        self.invalidated_fields = 0
+
+    def recent(self, field_id: str, limit: int) -> List[tuple]:
+        """The newest `limit` readings of a field, from memory when possible."""
+        if self._fields is None or limit > self.rows_per_field:
+            with self._lock:
+                self.bypassed += 1
+            return self._load(field_id, limit)
+        rows = self._fields.get(field_id)
+        if rows is None:
+            with self._lock:
+                generation = None if self._writing else self._generation
+            rows = self._load(field_id, self.rows_per_field)
+            # Empty results are not kept: a failed query returns them too
+            with self._lock:
+                if rows and generation == self._generation:
+                    self._fields.put(field_id, rows)
+        return rows[:limit]
+
+    def flush_started(self, cursor: Any, rows: List[tuple]):
+        """SensorDataWriter flush hook: runs in the flush's transaction, before it commits."""
+        with self._lock:
+            self._writing = True
+            self._generation += 1
+
+    def flush_finished(self, rows: List[tuple], committed: bool):
+        """
+        SensorDataWriter commit listener: folds committed rows into the fields already cached.
+        A failed flush may still have committed (e.g. a connection lost during COMMIT), and a
+        commit reported without flush_started before it means the ordering broke, so in both
+        cases the batch's fields are dropped and reloaded on their next read instead.
+        """
+        with self._lock:
+            if self._fields is not None:
+                if committed and self._writing:
+                    self._merge(rows)
+                else:
+                    if committed:
+                        logging.warning("FieldHistoryCache: flush committed without flush_started; dropping its fields.")
+                    self._invalidate(rows)
+            self._writing = False
+            self._generation += 1
+
+    def _invalidate(self, rows: List[tuple]):
+        for field_id in {row[_FIELD_ID] for row in rows}:
+            if self._fields.pop(field_id) is not None:
+                self.invalidated_fields += 1
+
+    def _merge(self, rows: List[tuple]):
+        by_field: Dict[str, List[tuple]] = {}
+        for row in rows:
+            by_field.setdefault(row[_FIELD_ID], []).append(row)
+        for field_id, new_rows in by_field.items():
+            cached = self._fields.peek(field_id)
+            if cached is None:
+                continue
+            history = [tuple(row[i] for i in _HISTORY_INDEX) for row in new_rows]
+            if IS_PRODUCTION: # PostgreSQL hands timestamps back as datetimes
+                history = [row[:_TIMESTAMP] + (datetime.datetime.strptime(row[_TIMESTAMP], '%Y-%m-%d %H:%M:%S'),)
+                           for row in history]
+            # A new list, so readers slicing the old one are unaffected
+            merged = sorted(history + cached, key=_timestamp_key, reverse=True)[:self.rows_per_field]
+            self._fields.replace(field_id, merged)
+            self.merged_rows += len(new_rows)
+
+    def clear(self):
+        if self._fields is not None:
+            self._fields.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        if self._fields is None:
+            return {"enabled": False, "bypassed": self.bypassed}
+        with self._lock:
+            return dict(self._fields.stats(), enabled=True, rows_per_field=self.rows_per_field,
+                        bypassed=self.bypassed, merged_rows=self.merged_rows, invalidated_fields=self.invalidated_fields)
@@ -1,56 +1,211 @@
 # src/ml/ml_model.py
 import logging
-from typing import Dict, List, Any
-import random
+from typing import Dict, List, Any, Optional, Tuple
 import json
+import os
+import threading
+import time
+import numpy as np
+from src.ml.feature_engineering import build_feature_matrix, FeatureBuffer, feature_key
+from src.core.lru_cache import LRUCache
+from src.ml.model_registry import ModelRegistry, ModelRegistryError
 
 # This is the "trained" model file created by model_training.py
 MODEL_FILE = 'simulated_model_v1.json'
+# Fitted weights saved next to it (NumPy .npz: coefficients, intercept, features)
+MODEL_ARTIFACT_FILE = 'simulated_model_v1.npz'
+MODEL_WATCH_INTERVAL = 5.0  # Seconds between checks of the registry's CURRENT pointer
+# Single-reading predictions remembered per (model version, encoded features); 0 disables
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+
+# Predicted yield -> label. A yield below bounds[i] gets labels[i]; anything at or
+# above the last bound gets the final label. Override with "label_thresholds" in MODEL_FILE.
+DEFAULT_LABEL_THRESHOLDS: Dict[str, List[Any]] = {
+    "bounds": [20.0, 28.0, 38.0],
+    "labels": ["Critical Drought Warning", "Optimal Irrigation Recommended",
+               "All Metrics Stable", "Waterlogging Risk Detected"]
+}
+
+class _ModelState:
+    """Everything one model version needs to score. Never mutated; a reload builds a new one."""
+    __slots__ = ('version', 'metadata', 'coefficients', 'intercept', 'features', 'label_bounds', 'labels')
+
+    def __init__(self, version: str, metadata: Dict[str, Any], coefficients: np.ndarray,
+                 intercept: float, features: List[str]):
+        self.version = version
+        self.metadata = metadata
+        self.coefficients = coefficients
+        self.intercept = intercept
+        self.features = features
+        self.label_bounds, self.labels = _parse_thresholds(metadata.get("label_thresholds", DEFAULT_LABEL_THRESHOLDS))
+
+def _parse_thresholds(thresholds: Dict[str, List[Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    bounds = np.asarray(thresholds["bounds"], dtype=np.float64)
+    labels = np.asarray(thresholds["labels"], dtype=object)
+    if len(labels) != len(bounds) + 1 or np.any(np.diff(bounds) < 0):
+        raise ValueError("label_thresholds needs ascending bounds and exactly one more label than bounds")
+    return bounds, labels
 
 class MachineLearningModel:
     """
-    Simulates the predictive model.
-    It now loads its "metadata" from a trained model file.
+    Serves the trained linear yield model.
+    The active version comes from the model registry (weights memory-mapped) or, if the
+    registry is empty, from the legacy MODEL_FILE/MODEL_ARTIFACT_FILE pair. A batch is
+    scored as one matrix-vector product and each predicted yield is mapped to a label.
+    A watcher thread can swap in a newly activated version; every prediction reads the
+    state reference once, so a swap never mixes two versions within one call.
     """
-    
-    def __init__(self):
-        self.model_metadata = self._load_trained_model()
-        if self.model_metadata:
-            logging.info(f"ML Model '{self.model_metadata.get('model_name')}' loaded.")
-            logging.info(f"Model Performance: R2: {self.model_metadata['performance_metrics'].get('r_squared', 'N/A')}")
+
+    def __init__(self, model_file: str = MODEL_FILE, artifact_file: Optional[str] = None,
+                 registry: Optional[ModelRegistry] = None, cache_size: int = PREDICTION_CACHE_SIZE):
+        self.model_file = model_file
+        self.artifact_file = artifact_file
+        self.registry = registry or ModelRegistry()
+        self._buffers = threading.local()   # One reusable feature buffer per serving thread
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self.prediction_cache = LRUCache(cache_size) if cache_size > 0 else None
+        self._state: Optional[_ModelState] = self._load_state()
+        if self._state:
+            logging.info(f"ML Model '{self._state.metadata.get('model_name')}' ({self._state.version}) loaded.")
+            logging.info(f"Model Performance: R2: {self._state.metadata.get('performance_metrics', {}).get('r_squared', 'N/A')}")
         else:
             logging.error("Failed to load any ML model metadata.")
 
-    def _load_trained_model(self) -> Dict[str, Any]:
+    def _load_state(self) -> Optional[_ModelState]:
+        version = self.registry.current_version()
+        if version:
+            try:
+                metadata, coefficients = self.registry.load(version)
+                return _ModelState(version, metadata, coefficients, float(metadata["intercept"]), list(metadata["features"]))
+            except (ModelRegistryError, KeyError, ValueError) as e:
+                logging.error(f"Model registry version {version} unusable ({e}). Falling back to {self.model_file}.")
+        return self._load_legacy_state()
+
+    def _load_legacy_state(self) -> Optional[_ModelState]:
+        """The single-file model written by model_training (no registry yet)."""
+        metadata = self._load_trained_model(self.model_file)
+        if not metadata:
+            return None
+        artifact_file = self.artifact_file or metadata.get("artifact_file", MODEL_ARTIFACT_FILE)
+        try:
+            with np.load(artifact_file, allow_pickle=False) as artifact:
+                coefficients = artifact["coefficients"].astype(np.float32)
+                intercept = float(artifact["intercept"])
+                features = [str(f) for f in artifact["features"]]
+        except Exception as e:
+            logging.error(f"Could not load model weights {artifact_file}: {e}")
+            return None
+        return _ModelState("legacy", metadata, coefficients, intercept, features)
+
+    def _load_trained_model(self, model_file: str) -> Dict[str, Any]:
         """Loads the 'trained' model's metadata."""
         try:
-            with open(MODEL_FILE, 'r') as f:
+            with open(model_file, 'r') as f:
                 return json.load(f)
         except Exception as e:
-            logging.error(f"Could not load model file {MODEL_FILE}: {e}")
+            logging.error(f"Could not load model file {model_file}: {e}")
             return None
 
-    def run_prediction(self, feature_vector: List[Dict]) -> str:
+    @property
+    def model_metadata(self) -> Optional[Dict[str, Any]]:
+        state = self._state
+        return state.metadata if state else None
+
+    @property
+    def version(self) -> Optional[str]:
+        state = self._state
+        return state.version if state else None
+
+    def describe(self) -> Dict[str, Any]:
+        """Active model metadata plus its registry version (for /api/ml_insights)."""
+        state = self._state
+        if not state:
+            return {"model_version": None, "message": "No model loaded."}
+        cache = self.prediction_cache.stats() if self.prediction_cache is not None else None
+        return dict(state.metadata, model_version=state.version, prediction_cache=cache)
+
+    def reload_if_changed(self) -> bool:
+        """Swaps in the registry's active version if it differs from the one being served."""
+        with self._reload_lock:
+            version = self.registry.current_version()
+            if not version or version == self.version:
+                return False
+            try:
+                metadata, coefficients = self.registry.load(version)
+                state = _ModelState(version, metadata, coefficients, float(metadata["intercept"]), list(metadata["features"]))
+            except (ModelRegistryError, KeyError, ValueError) as e:
+                logging.error(f"Could not hot-swap to model {version}: {e}. Keeping {self.version}.")
+                return False
+            previous, self._state = self.version, state
+            if self.prediction_cache is not None:
+                self.prediction_cache.clear() # Keys carry the version anyway; this just frees the old entries
+            logging.info(f"ML Model hot-swapped {previous} -> {version}.")
+            return True
+
+    def start_watcher(self, interval: float = MODEL_WATCH_INTERVAL):
+        if self._watcher is not None:
+            return
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    logging.error(f"Model watcher error: {e}")
+        self._watcher = threading.Thread(target=watch, name="Model_Registry_Watcher", daemon=True)
+        self._watcher.start()
+
+    def is_available(self) -> bool:
+        return self._state is not None
+
+    def _feature_matrix(self, state: _ModelState, records: List[Dict[str, Any]]) -> np.ndarray:
+        buffer = getattr(self._buffers, "buffer", None)
+        if buffer is None:
+            buffer = self._buffers.buffer = FeatureBuffer(features=len(state.features))
+        matrix, _ = build_feature_matrix(records, state.features, out=buffer)
+        return matrix
+
+    def feature_matrix(self, records: List[Dict[str, Any]]) -> np.ndarray:
         """
-        Simulates a prediction based on the input data.
+        Engineered float32 features in the model's feature order. The matrix lives in
+        this thread's reusable buffer, so it is only valid until the next call.
         """
-        if not self.model_metadata:
-             return "ERROR: Model_Unavailable"
+        return self._feature_matrix(self._state, records)
 
-        # Simulate the model's prediction logic
+    def predict_yield(self, records: List[Dict[str, Any]]) -> np.ndarray:
+        """Predicted yield for every record, in one matrix-vector product."""
+        state = self._state
+        return self._feature_matrix(state, records) @ state.coefficients + state.intercept
+
+    def label_yields(self, yields: np.ndarray) -> List[str]:
+        state = self._state
+        return state.labels[np.searchsorted(state.label_bounds, yields, side='right')].tolist()
+
+    def predict_batch(self, records: List[Dict[str, Any]]) -> List[str]:
+        """Labels for a whole batch of raw readings."""
+        state = self._state
+        if state is None:
+            return ["ERROR: Model_Unavailable"] * len(records)
         try:
-            moisture = feature_vector[0].get('moisture', 70)
-            temp = feature_vector[0].get('temp', 25)
-            
-            if moisture < 50 and temp > 30:
-                return "Critical Drought Warning"
-            elif moisture < 65:
-                return "Optimal Irrigation Recommended"
-            elif moisture > 85:
-                return "Waterlogging Risk Detected"
-            else:
-                return "All Metrics Stable"
-                
+            yields = self._feature_matrix(state, records) @ state.coefficients + state.intercept
+            return state.labels[np.searchsorted(state.label_bounds, yields, side='right')].tolist()
         except Exception as e:
             logging.error(f"Error during ML prediction: {e}")
-            return "ERROR: Prediction_Failed"
\ No newline at end of file
+            return ["ERROR: Prediction_Failed"] * len(records)
+
+    def run_prediction(self, feature_vector: List[Dict]) -> str:
+        """
+        Predicts the label for the first record (single-reading endpoints),
+        answering from the prediction cache when the same features were seen before.
+        """
+        state = self._state
+        if self.prediction_cache is None or state is None:
+            return self.predict_batch(feature_vector[:1])[0]
+        key = (state.version, feature_key(feature_vector[0], state.features))
+        label = self.prediction_cache.get(key)
+        if label is None:
+            label = self.predict_batch(feature_vector[:1])[0]
+            if not label.startswith("ERROR"):
+                self.prediction_cache.put(key, label)
+        return label
@@ -0,0 +1,102 @@
+# src/ml/model_registry.py
+import argparse
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', 'model_registry')
+CURRENT_POINTER = 'CURRENT'            # Text file naming the active version
+WEIGHTS_FILE = 'coefficients.npy'      # float32, memory-mapped by every worker
+METADATA_FILE = 'metadata.json'        # Training metadata plus intercept and feature order
+
+class ModelRegistryError(Exception):
+    pass
+
+def _fsync_write(path: str, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+class ModelRegistry:
+    """
+    A directory of immutable model versions (v0001, v0002, ...) and a CURRENT pointer.
+    A version directory is fully written under a temporary name and then renamed into
+    place, and the pointer is swapped with os.replace, so readers never see a partial model.
+    """
+    def __init__(self, root: str = MODEL_REGISTRY_DIR):
+        self.root = root
+
+    def list_versions(self) -> List[str]:
+        try:
+            return sorted(d for d in os.listdir(self.root) if d.startswith('v') and d[1:].isdigit())
+        except FileNotFoundError:
+            return []
+
+    def current_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, CURRENT_POINTER), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, coefficients: Any, intercept: float, features: List[str],
+                metadata: Dict[str, Any], activate: bool = True) -> str:
+        """Stores a new version and (by default) makes it the active one. Returns its name."""
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=self.root)
+        np.save(os.path.join(staging, WEIGHTS_FILE), np.ascontiguousarray(coefficients, dtype=np.float32))
+        document = dict(metadata, intercept=float(intercept), features=list(features))
+        _fsync_write(os.path.join(staging, METADATA_FILE), json.dumps(document, indent=4).encode())
+        while True:
+            versions = self.list_versions()
+            version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+            try:
+                os.rename(staging, os.path.join(self.root, version))
+                break
+            except OSError:
+                if not os.path.isdir(os.path.join(self.root, version)):
+                    raise
+                # Another trainer took this number first; try the next one
+        logging.info(f"Model registry: published {version}.")
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version: str):
+        """Points CURRENT at an existing version (also how a rollback is done)."""
+        if version not in self.list_versions():
+            raise ModelRegistryError(f"Unknown model version: {version}")
+        pointer = os.path.join(self.root, CURRENT_POINTER)
+        _fsync_write(f"{pointer}.tmp", version.encode())
+        os.replace(f"{pointer}.tmp", pointer)
+        logging.info(f"Model registry: {version} is now active.")
+
+    def load(self, version: str) -> Tuple[Dict[str, Any], np.ndarray]:
+        """(metadata, coefficients). The weights are a read-only memory map, so
+        every worker process on the machine shares the same physical pages."""
+        path = os.path.join(self.root, version)
+        try:
+            with open(os.path.join(path, METADATA_FILE), 'r') as f:
+                metadata = json.load(f)
+            coefficients = np.load(os.path.join(path, WEIGHTS_FILE), mmap_mode='r', allow_pickle=False)
+        except (OSError, ValueError) as e:
+            raise ModelRegistryError(f"Could not load model version {version}: {e}")
+        return metadata, coefficients
+
+if __name__ == "__main__":
+    # "python -m src.ml.model_registry list" / "... activate v0003" (rollback)
+    parser = argparse.ArgumentParser(description="Inspect or switch the active model version.")
+    parser.add_argument("command", choices=["list", "activate"])
+    parser.add_argument("version", nargs="?")
+    args = parser.parse_args()
+    registry = ModelRegistry()
+    if args.command == "list":
+        current = registry.current_version()
+        for version in registry.list_versions():
+            print(f"{'*' if version == current else ' '} {version}")
+    else:
+        registry.activate(args.version)
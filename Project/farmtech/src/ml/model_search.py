@@ -0,0 +1,134 @@
+# src/ml/model_search.py
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Tuple
+import numpy as np
+from sklearn.model_selection import KFold, train_test_split
+from sklearn.linear_model import LinearRegression, Ridge, Lasso, BayesianRidge
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from src.ml.data_simulator import generate_simulated_data
+from src.ml.feature_engineering import build_feature_matrix
+from src.ml.ml_model import MODEL_ARTIFACT_FILE, DEFAULT_LABEL_THRESHOLDS
+from src.ml.model_training import MODEL_FEATURES, TARGET_VARIABLE, publish_trained_model
+
+SEARCH_FOLDS = 5
+SEARCH_RECORDS = 20000
+
+# Estimators by name, so candidates stay plain (picklable) dicts
+_ESTIMATORS = {
+    "LinearRegression": LinearRegression, "Ridge": Ridge, "Lasso": Lasso, "BayesianRidge": BayesianRidge,
+    "RandomForestRegressor": RandomForestRegressor, "GradientBoostingRegressor": GradientBoostingRegressor,
+}
+# Regularized linear, Bayesian and tree families (cf. predictive_algorithms.get_algorithm_details;
+# the sequential LSTM family needs time series we don't train on yet).
+# Only linear models can be served from the .npz artifact, so only they can win.
+SEARCH_MODELS: List[Dict[str, Any]] = [
+    {"name": "ols", "family": "linear", "estimator": "LinearRegression", "params": {}},
+    {"name": "ridge_1", "family": "regularized_linear", "estimator": "Ridge", "params": {"alpha": 1.0}},
+    {"name": "ridge_10", "family": "regularized_linear", "estimator": "Ridge", "params": {"alpha": 10.0}},
+    {"name": "lasso_0.1", "family": "regularized_linear", "estimator": "Lasso", "params": {"alpha": 0.1}},
+    {"name": "bayesian_ridge", "family": "bayesian", "estimator": "BayesianRidge", "params": {}},
+    {"name": "random_forest", "family": "tree", "estimator": "RandomForestRegressor",
+     "params": {"n_estimators": 100, "max_depth": 10, "n_jobs": 1, "random_state": 42}},
+    {"name": "gradient_boosting", "family": "tree", "estimator": "GradientBoostingRegressor",
+     "params": {"n_estimators": 150, "max_depth": 3, "random_state": 42}},
+]
+SERVABLE_ESTIMATORS = {"LinearRegression", "Ridge", "Lasso", "BayesianRidge"}
+
+def candidate_feature_sets() -> List[List[str]]:
+    """All model features, each one left out in turn, and all of them plus heat_stress_index."""
+    sets = [list(MODEL_FEATURES), MODEL_FEATURES + ["heat_stress_index"]]
+    sets += [[f for f in MODEL_FEATURES if f != left_out] for left_out in MODEL_FEATURES]
+    return sets
+
+# Per-worker copy of the training data, set once by the pool initializer
+_worker_data: Dict[str, Any] = {}
+
+def _init_worker(X: np.ndarray, y: np.ndarray, feature_index: Dict[str, int], splits: List[Tuple[np.ndarray, np.ndarray]]):
+    _worker_data.update(X=X, y=y, feature_index=feature_index, splits=splits)
+
+def _build(model: Dict[str, Any]) -> Any:
+    return _ESTIMATORS[model["estimator"]](**model["params"])
+
+def _evaluate_fold(task: Tuple[int, Dict[str, Any], List[str], int]) -> Dict[str, Any]:
+    candidate_id, model, features, fold = task
+    train_idx, test_idx = _worker_data["splits"][fold]
+    columns = [_worker_data["feature_index"][f] for f in features]
+    X = _worker_data["X"][:, columns]
+    y = _worker_data["y"]
+    estimator = _build(model)
+    start = time.perf_counter()
+    estimator.fit(X[train_idx], y[train_idx])
+    fit_time = time.perf_counter() - start
+    y_pred = estimator.predict(X[test_idx])
+    return {"candidate": candidate_id, "mae": mean_absolute_error(y[test_idx], y_pred),
+            "r_squared": r2_score(y[test_idx], y_pred), "fit_time_sec": fit_time}
+
+def run_model_search(records: int = SEARCH_RECORDS, folds: int = SEARCH_FOLDS, workers: int = None) -> Dict[str, Any]:
+    """
+    Cross-validates every (feature set, model) candidate over k folds in a process pool
+    sized to the machine, refits the best servable candidate on the full training split,
+    scores it on the held-out test split and saves it with the leaderboard in its metadata.
+    """
+    workers = workers or os.cpu_count() or 1
+    logging.info(f"--- STARTING MODEL SEARCH ({workers} workers, {folds} folds) ---")
+    start_time = time.time()
+    data = generate_simulated_data(records=records)
+    all_features = list(dict.fromkeys(f for features in candidate_feature_sets() for f in features))
+    X, _ = build_feature_matrix({column: data[column].to_numpy() for column in data.columns}, all_features)
+    y = data[TARGET_VARIABLE].to_numpy()
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    candidates = [{"features": features, "model": model} for features in candidate_feature_sets() for model in SEARCH_MODELS]
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=42).split(X_train))
+    tasks = [(i, c["model"], c["features"], fold) for i, c in enumerate(candidates) for fold in range(folds)]
+    feature_index = {f: i for i, f in enumerate(all_features)}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(X_train, y_train, feature_index, splits)) as pool:
+        fold_results = list(pool.map(_evaluate_fold, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    leaderboard = []
+    for i, candidate in enumerate(candidates):
+        results = [r for r in fold_results if r["candidate"] == i]
+        r2 = np.array([r["r_squared"] for r in results])
+        leaderboard.append({
+            "model": candidate["model"]["name"], "family": candidate["model"]["family"],
+            "features": candidate["features"], "servable": candidate["model"]["estimator"] in SERVABLE_ESTIMATORS,
+            "cv_r_squared_mean": float(r2.mean()), "cv_r_squared_std": float(r2.std()),
+            "cv_mae_mean": float(np.mean([r["mae"] for r in results])),
+            "fit_time_sec_mean": float(np.mean([r["fit_time_sec"] for r in results])),
+        })
+    leaderboard.sort(key=lambda entry: entry["cv_r_squared_mean"], reverse=True)
+    best = next(entry for entry in leaderboard if entry["servable"])
+    logging.info(f"Best overall: {leaderboard[0]['model']} (CV R2 {leaderboard[0]['cv_r_squared_mean']:.3f}); "
+                 f"best servable: {best['model']} (CV R2 {best['cv_r_squared_mean']:.3f})")
+
+    # Refit the winner on the whole training split and score it on data no fold has seen
+    model = next(m for m in SEARCH_MODELS if m["name"] == best["model"])
+    columns = [feature_index[f] for f in best["features"]]
+    estimator = _build(model)
+    fit_start = time.time()
+    estimator.fit(X_train[:, columns], y_train)
+    train_time = time.time() - fit_start
+    y_pred = estimator.predict(X_test[:, columns])
+    mae, r2 = mean_absolute_error(y_test, y_pred), r2_score(y_test, y_pred)
+
+    model_metadata = {
+        "model_name": f"Search-{best['model']}-v1.0",
+        "last_trained": time.time(),
+        "training_time_sec": train_time,
+        "records_trained": len(X_train),
+        "performance_metrics": {"mae": mae, "r_squared": r2},
+        "features_used": best["features"],
+        "artifact_file": MODEL_ARTIFACT_FILE,
+        "label_thresholds": DEFAULT_LABEL_THRESHOLDS,
+        "search": {"folds": folds, "workers": workers, "candidates": len(candidates),
+                   "wall_time_sec": time.time() - start_time, "leaderboard": leaderboard},
+    }
+    logging.info(f"Search winner performance on test split: MAE: {mae:.2f}, R2: {r2:.2f}")
+    publish_trained_model(estimator.coef_, estimator.intercept_, best["features"], model_metadata)
+    logging.info("--- MODEL SEARCH FINISHED ---")
+    return model_metadata
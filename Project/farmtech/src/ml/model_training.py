@@ -3,10 +3,17 @@ import logging
 import time
 import json
 import os
+import argparse
+from typing import Dict, Any, Iterator, List, Optional
+import numpy as np
 from src.ml.data_simulator import generate_simulated_data
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_absolute_error, r2_score
+from src.ml.ml_model import MODEL_ARTIFACT_FILE, DEFAULT_LABEL_THRESHOLDS
+from src.ml.feature_engineering import build_feature_matrix, FeatureBuffer
+from src.services.db_connector import DBConnector
+from src.ml.model_registry import ModelRegistry
 
 # --- NEW CONFIG ---
 MODEL_FEATURES = [
@@ -16,6 +23,169 @@ MODEL_FEATURES = [
 TARGET_VARIABLE = 'yield_prediction'
 MODEL_SAVE_FILE = 'simulated_model_v1.json' # This is the "trained" model
 
+# --- Out-of-core training from sensor_data ---
+OBSERVED_TARGET = 'yield_observed'   # Filled in on sensor_data rows once the harvest is known
+TRAINING_CHUNK_SIZE = 50000          # Rows per streamed chunk; bounds training memory
+TEST_PERCENT = 20                    # Share of rows (by id hash) held out for evaluation
+RAW_TRAINING_COLUMNS = ['moisture', 'temp', 'pump_pressure', 'nutrient_level', 'historical_trend']
+
+def save_model_artifact(coefficients: Any, intercept: float, features: list, path: str, **extra: np.ndarray):
+    """Stores what serving needs (coefficients, intercept, feature order) as plain NumPy arrays."""
+    with open(path, 'wb') as f:
+        np.savez(f, coefficients=np.asarray(coefficients, dtype=np.float64),
+                 intercept=np.float64(intercept), features=np.asarray(features, dtype=str), **extra)
+
+def save_model_metadata(model_metadata: Dict[str, Any]):
+    with open(MODEL_SAVE_FILE, 'w') as f:
+        json.dump(model_metadata, f, indent=4)
+
+def publish_trained_model(coefficients: Any, intercept: float, features: list, model_metadata: Dict[str, Any], **extra: np.ndarray):
+    """
+    Saves a trained model: a new active version in the model registry (running servers
+    hot-swap to it), plus the local artifact/metadata files incremental training reads.
+    """
+    try:
+        model_metadata["model_version"] = ModelRegistry().publish(coefficients, intercept, features, model_metadata)
+        save_model_artifact(coefficients, intercept, features, MODEL_ARTIFACT_FILE, **extra)
+        save_model_metadata(model_metadata)
+        logging.info(f"New model saved to {MODEL_SAVE_FILE} and published as {model_metadata['model_version']}.")
+    except Exception as e:
+        logging.error(f"Failed to save model file: {e}")
+
+class LinearSufficientStats:
+    """
+    Running XᵀX, Xᵀy, yᵀy, Σy and n for least squares with an intercept (last column).
+    Chunks add up exactly, so stats saved with a model can be extended with new rows later.
+    """
+    def __init__(self, features: int):
+        width = features + 1
+        self.xtx = np.zeros((width, width))
+        self.xty = np.zeros(width)
+        self.yty = 0.0
+        self.y_sum = 0.0
+        self.n = 0
+
+    def add(self, X: np.ndarray, y: np.ndarray):
+        """X is the (rows x width) float64 design matrix, intercept column included."""
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        self.yty += float(y @ y)
+        self.y_sum += float(y.sum())
+        self.n += len(y)
+
+    def solve(self) -> np.ndarray:
+        return np.linalg.lstsq(self.xtx, self.xty, rcond=None)[0]
+
+    def evaluate(self, beta: np.ndarray) -> Dict[str, float]:
+        """R² and RMSE of beta on these rows, straight from the sums (no second pass)."""
+        if not self.n:
+            return {"r_squared": None, "rmse": None, "records": 0}
+        sse = max(self.yty - 2 * beta @ self.xty + beta @ self.xtx @ beta, 0.0)
+        sst = self.yty - self.y_sum ** 2 / self.n
+        return {"r_squared": float(1 - sse / sst) if sst > 0 else None,
+                "rmse": float(np.sqrt(sse / self.n)), "records": self.n}
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        return {f"{prefix}_xtx": self.xtx, f"{prefix}_xty": self.xty,
+                f"{prefix}_scalars": np.array([self.yty, self.y_sum, self.n], dtype=np.float64)}
+
+    @classmethod
+    def from_arrays(cls, arrays: Any, prefix: str) -> "LinearSufficientStats":
+        stats = cls(len(arrays[f"{prefix}_xty"]) - 1)
+        stats.xtx = np.array(arrays[f"{prefix}_xtx"], dtype=np.float64)
+        stats.xty = np.array(arrays[f"{prefix}_xty"], dtype=np.float64)
+        stats.yty, stats.y_sum, n = arrays[f"{prefix}_scalars"].tolist()
+        stats.n = int(n)
+        return stats
+
+def is_test_row(ids: np.ndarray) -> np.ndarray:
+    """Deterministic hash split on row id: a row lands on the same side in every run."""
+    hashed = (ids.astype(np.uint64) * np.uint64(2654435761)) & np.uint64(0xFFFFFFFF)
+    return hashed % np.uint64(100) < np.uint64(TEST_PERCENT)
+
+def iter_training_chunks(after_label_seq: int = 0, chunk_size: int = TRAINING_CHUNK_SIZE) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Rows labelled after after_label_seq, in labelling order (label_seq, stamped by a trigger
+    when yield_observed is set), as column arrays of up to chunk_size rows.
+    """
+    query = f"""
+        SELECT id, label_seq, {', '.join(RAW_TRAINING_COLUMNS)}, {OBSERVED_TARGET}
+        FROM sensor_data
+        WHERE label_seq > ? AND {OBSERVED_TARGET} IS NOT NULL
+          AND moisture IS NOT NULL AND temp IS NOT NULL AND pump_pressure IS NOT NULL
+        ORDER BY label_seq
+    """
+    return DBConnector.iter_query(query, (after_label_seq,), chunk_size=chunk_size, columnar=True)
+
+def _load_previous_stats() -> Optional[Dict[str, Any]]:
+    """Stats and watermark saved by the last database training run, if compatible."""
+    try:
+        with np.load(MODEL_ARTIFACT_FILE, allow_pickle=False) as artifact:
+            if [str(f) for f in artifact["features"]] != MODEL_FEATURES or "label_watermark" not in artifact:
+                return None
+            return {"train": LinearSufficientStats.from_arrays(artifact, "train"),
+                    "test": LinearSufficientStats.from_arrays(artifact, "test"),
+                    "label_watermark": int(artifact["label_watermark"])}
+    except Exception:
+        return None
+
+def train_from_database(incremental: bool = False, chunk_size: int = TRAINING_CHUNK_SIZE) -> Optional[Dict[str, Any]]:
+    """
+    Out-of-core training on labelled sensor_data rows. Memory is bounded by chunk_size:
+    each chunk is turned into features and folded into XᵀX / Xᵀy, never kept.
+    With incremental=True, only rows labelled since the last run (label_seq past its
+    watermark) are read and added to that run's saved sums, however old the rows are.
+    """
+    logging.info(f"--- STARTING {'INCREMENTAL ' if incremental else ''}TRAINING FROM sensor_data ---")
+    start_time = time.time()
+    previous = _load_previous_stats() if incremental else None
+    if incremental and previous is None:
+        logging.warning("No compatible previous model statistics found. Running a full scan.")
+    train = previous["train"] if previous else LinearSufficientStats(len(MODEL_FEATURES))
+    test = previous["test"] if previous else LinearSufficientStats(len(MODEL_FEATURES))
+    watermark = previous["label_watermark"] if previous else 0
+    new_rows = 0
+    feature_buffer = FeatureBuffer(chunk_size, len(MODEL_FEATURES))
+    design = np.empty((chunk_size, len(MODEL_FEATURES) + 1))
+
+    for columns in iter_training_chunks(watermark, chunk_size):
+        ids = columns['id'].astype(np.int64)
+        count = len(ids)
+        features, _ = build_feature_matrix({c: columns[c] for c in RAW_TRAINING_COLUMNS}, MODEL_FEATURES, out=feature_buffer)
+        X = design[:count]
+        X[:, :-1] = features
+        X[:, -1] = 1.0
+        y = columns[OBSERVED_TARGET].astype(np.float64)
+        held_out = is_test_row(ids)
+        train.add(X[~held_out], y[~held_out])
+        test.add(X[held_out], y[held_out])
+        watermark = int(columns['label_seq'][-1])
+        new_rows += count
+
+    if not train.n:
+        logging.warning("No labelled sensor_data rows to train on. Keeping the current model.")
+        return None
+    beta = train.solve()
+    metrics = test.evaluate(beta)
+    train_time = time.time() - start_time
+    model_metadata = {
+        "model_name": "SensorDataLinearRegression-v1.0",
+        "last_trained": time.time(),
+        "training_time_sec": train_time,
+        "records_trained": train.n,
+        "new_records": new_rows,
+        "training_source": "sensor_data",
+        "label_watermark": watermark,
+        "performance_metrics": {"r_squared": metrics["r_squared"], "rmse": metrics["rmse"], "test_records": metrics["records"]},
+        "features_used": MODEL_FEATURES,
+        "artifact_file": MODEL_ARTIFACT_FILE,
+        "label_thresholds": DEFAULT_LABEL_THRESHOLDS
+    }
+    logging.info(f"Trained on {train.n} rows ({new_rows} new) in {train_time:.2f}s. Test R2: {metrics['r_squared']}")
+    publish_trained_model(beta[:-1], beta[-1], MODEL_FEATURES, model_metadata,
+                          label_watermark=np.int64(watermark), **train.to_arrays("train"), **test.to_arrays("test"))
+    return model_metadata
+
 def train_new_model():
     """
     Simulates a full end-to-end training and validation pipeline.
@@ -27,8 +197,9 @@ def train_new_model():
     data = generate_simulated_data(records=2000)
     
     # 2. Split Data
-    X = data[MODEL_FEATURES]
-    y = data[TARGET_VARIABLE]
+    # Same float32 feature builder the server scores with
+    X, _ = build_feature_matrix({column: data[column].to_numpy() for column in data.columns}, MODEL_FEATURES)
+    y = data[TARGET_VARIABLE].to_numpy()
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
     # 3. Simulate Training
@@ -53,22 +224,33 @@ def train_new_model():
             "mae": mae,
             "r_squared": r2
         },
-        "features_used": MODEL_FEATURES
+        "features_used": MODEL_FEATURES,
+        "artifact_file": MODEL_ARTIFACT_FILE,
+        "label_thresholds": DEFAULT_LABEL_THRESHOLDS
     }
     
     logging.info(f"New Model Performance: MAE: {mae:.2f}, R2: {r2:.2f}")
 
-    # 5. Save the "trained model" metadata
-    try:
-        with open(MODEL_SAVE_FILE, 'w') as f:
-            json.dump(model_metadata, f, indent=4)
-        logging.info(f"New model saved to {MODEL_SAVE_FILE}.")
-    except Exception as e:
-        logging.error(f"Failed to save model file: {e}")
+    # 5. Save the fitted weights, then the "trained model" metadata that points at them
+    publish_trained_model(model.coef_, model.intercept_, MODEL_FEATURES, model_metadata)
         
     logging.info("--- ML MODEL TRAINING PIPELINE FINISHED ---")
 
 if __name__ == "__main__":
     # This allows you to run "python src/ml/model_training.py"
     # to "train" your model
-    train_new_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the yield model.")
+    parser.add_argument("--from-db", action="store_true", help="Stream labelled rows from sensor_data instead of simulating data.")
+    parser.add_argument("--incremental", action="store_true", help="With --from-db: only add rows labelled since the last run.")
+    parser.add_argument("--chunk-size", type=int, default=TRAINING_CHUNK_SIZE)
+    parser.add_argument("--search", action="store_true", help="Cross-validate feature sets and model families in parallel; save the best.")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None, help="Search processes (default: one per CPU).")
+    args = parser.parse_args()
+    if args.search:
+        from src.ml.model_search import run_model_search
+        run_model_search(folds=args.folds, workers=args.workers)
+    elif args.from_db:
+        train_from_database(incremental=args.incremental, chunk_size=args.chunk_size)
+    else:
+        train_new_model()
\ No newline at end of file
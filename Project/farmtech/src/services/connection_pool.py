@@ -0,0 +1,174 @@
+# src/services/connection_pool.py
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+POOL_MIN_SIZE = 1             # Connections opened up front and kept open while idle
+POOL_MAX_SIZE = 10            # Hard cap on open connections (checked out + idle)
+POOL_CHECKOUT_TIMEOUT = 10.0  # Seconds acquire() waits for a free connection before giving up
+POOL_MAX_LIFETIME = 1800.0    # Connections older than this are closed and replaced
+POOL_PING_AFTER = 5.0         # Idle seconds after which a connection is pinged before reuse
+
+class PoolTimeoutError(Exception):
+    pass
+
+class _Entry:
+    __slots__ = ('conn', 'created_at', 'released_at')
+
+    def __init__(self, conn: Any):
+        self.conn = conn
+        self.created_at = self.released_at = time.monotonic()
+
+class ConnectionPool:
+    """
+    Bounded pool of DB-API connections shared by all threads of one process.
+    acquire() hands out the most recently returned idle connection (pinging it first if it
+    sat idle for a while), opens a new one while under max_size, or waits up to the checkout
+    timeout. release() rolls back anything left open and puts the connection back.
+    """
+    def __init__(self, connect: Callable[[], Any], is_alive: Callable[[Any], bool], reset: Callable[[Any], None],
+                 min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE,
+                 checkout_timeout: float = POOL_CHECKOUT_TIMEOUT, max_lifetime: float = POOL_MAX_LIFETIME,
+                 ping_after: float = POOL_PING_AFTER):
+        self._connect = connect
+        self._is_alive = is_alive
+        self._reset = reset
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._idle: List[_Entry] = []
+        self._in_use: Dict[int, _Entry] = {}
+        self._opening = 0  # Connections being opened outside the lock (count towards max_size)
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+        self.opened = 0
+        self.recycled = 0
+        self.discarded = 0
+
+    def prefill(self):
+        """Opens min_size connections up front (errors are logged; acquire() retries later)."""
+        for _ in range(self.min_size - self.size()):
+            try:
+                entry = _Entry(self._connect())
+            except Exception as e:
+                logging.error(f"ConnectionPool: could not pre-open connection: {e}")
+                return
+            with self._cond:
+                self.opened += 1
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def size(self) -> int:
+        with self._cond:
+            return len(self._idle) + len(self._in_use) + self._opening
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.max_lifetime > 0 and now - entry.created_at > self.max_lifetime
+
+    def _close(self, entry: _Entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        """Checks out a connection. Raises PoolTimeoutError if none frees up in time."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        entry, stale = None, None
+        with self._cond:
+            while not self._idle and len(self._in_use) + self._opening >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeoutError(f"No database connection free after {timeout:.1f}s "
+                                           f"({len(self._in_use)} of {self.max_size} in use)")
+                waited = True
+                self._cond.wait(remaining)
+            if self._idle:
+                entry = self._idle.pop() # LIFO: the most recently used (warmest) connection
+                if self._expired(entry, time.monotonic()):
+                    stale, entry = entry, None
+                    self.recycled += 1
+            self._opening += 1
+        if stale is not None:
+            self._close(stale)
+        if entry is not None and time.monotonic() - entry.released_at > self.ping_after and not self._is_alive(entry.conn):
+            self._close(entry)
+            entry = None
+            with self._cond:
+                self.discarded += 1
+        if entry is None:
+            try:
+                entry = _Entry(self._connect())
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.opened += 1
+        with self._cond:
+            self._opening -= 1
+            self._in_use[id(entry.conn)] = entry
+            wait_time = time.monotonic() - start
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+        return entry.conn
+
+    def release(self, conn: Any, discard: bool = False):
+        """Returns a checked-out connection. Broken or expired connections are closed instead."""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            logging.warning("ConnectionPool: released a connection this pool did not hand out; closing it.")
+            self._close(_Entry(conn))
+            return
+        if not discard:
+            try:
+                self._reset(conn)
+            except Exception as e:
+                logging.warning(f"ConnectionPool: discarding connection that failed to reset: {e}")
+                discard = True
+        now = time.monotonic()
+        with self._cond:
+            keep = not discard and not self._closed and not self._expired(entry, now)
+            if keep:
+                entry.released_at = now
+                self._idle.append(entry)
+            elif discard:
+                self.discarded += 1
+            else:
+                self.recycled += 1
+            self._cond.notify()
+        if not keep:
+            self._close(entry)
+
+    def close_all(self):
+        """Closes idle connections; checked-out ones are closed when they come back."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._closed = True
+        for entry in idle:
+            self._close(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"in_use": len(self._in_use), "idle": len(self._idle), "max_size": self.max_size,
+                    "checkouts": self.checkouts, "waited_checkouts": self.waits, "timeouts": self.timeouts,
+                    "wait_time_avg_ms": 1000 * self.wait_time_total / self.checkouts if self.checkouts else 0.0,
+                    "wait_time_max_ms": 1000 * self.wait_time_max,
+                    "opened": self.opened, "recycled": self.recycled, "discarded": self.discarded}
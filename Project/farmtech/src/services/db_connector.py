@@ -3,9 +3,16 @@ import sqlite3
 import logging
 import threading
 import os # <-- NEW
+import uuid
+from collections import namedtuple
+import numpy as np
 import psycopg2 # <-- NEW
-from typing import Optional, Any, List, Dict
+from typing import Optional, Any, List, Dict, Iterator, Callable, Sequence
 from urllib.parse import urlparse # <-- NEW
+from src.services.sql_statements import Statement, ROW_FORMATS
+from src.services.sqlite_writer import SQLiteWriter, apply_pragmas
+from src.services.connection_pool import (ConnectionPool, PoolTimeoutError, POOL_MIN_SIZE, POOL_MAX_SIZE,
+                                          POOL_CHECKOUT_TIMEOUT, POOL_MAX_LIFETIME, POOL_PING_AFTER)
 
 # --- NEW: Cloud Database Logic ---
 # Render (and other hosts) provides the DB connection string in an env variable
@@ -14,29 +21,111 @@ IS_PRODUCTION = DATABASE_URL is not None
 
 # Fallback to local file if not in production
 DB_NAME = "local_farm_data.db"
+SQLITE_STATEMENT_CACHE = 256 # Compiled statements sqlite3 keeps per connection (its form of "prepared")
+ITER_CHUNK_SIZE = 10000      # Rows fetched per round trip by iter_query
 
 db_local = threading.local()
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+_sqlite_writer: Optional[SQLiteWriter] = None
+_sqlite_writer_pid: Optional[int] = None
+
+class _PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which registered statements this session has PREPAREd."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+def _connect() -> Any:
+    if IS_PRODUCTION:
+        # --- PRODUCTION: Connect to PostgreSQL ---
+        conn = psycopg2.connect(DATABASE_URL, connection_factory=_PreparingConnection)
+        logging.info("DBConnector: Connected to production PostgreSQL.")
+    else:
+        # --- LOCAL: Connect to SQLite ---
+        conn = sqlite3.connect(DB_NAME, check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn) # WAL, synchronous=NORMAL, cache size, busy timeout
+        logging.info("DBConnector: Connected to local SQLite.")
+    return conn
+
+def _is_alive(conn: Any) -> bool:
+    """Cheap round trip before reusing a connection that sat idle (server restarts, idle timeouts)."""
+    try:
+        if IS_PRODUCTION and conn.closed:
+            return False
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        cursor.close()
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+def _reset(conn: Any):
+    """Ends whatever transaction the last borrower left open, so the next one starts clean."""
+    if IS_PRODUCTION:
+        if conn.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    elif conn.in_transaction:
+        conn.rollback()
 
 class DBConnector:
+    @staticmethod
+    def pool() -> ConnectionPool:
+        """This process's connection pool (a forked worker builds its own instead of sharing sockets)."""
+        global _pool, _pool_pid
+        if _pool is None or _pool_pid != os.getpid():
+            with _pool_lock:
+                if _pool is None or _pool_pid != os.getpid():
+                    pool = ConnectionPool(_connect, _is_alive, _reset,
+                                          min_size=int(os.environ.get('DB_POOL_MIN_SIZE', POOL_MIN_SIZE)),
+                                          max_size=int(os.environ.get('DB_POOL_MAX_SIZE', POOL_MAX_SIZE)),
+                                          checkout_timeout=float(os.environ.get('DB_POOL_TIMEOUT', POOL_CHECKOUT_TIMEOUT)),
+                                          max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', POOL_MAX_LIFETIME)),
+                                          ping_after=float(os.environ.get('DB_POOL_PING_AFTER', POOL_PING_AFTER)))
+                    pool.prefill()
+                    _pool, _pool_pid = pool, os.getpid()
+        return _pool
+
+    @staticmethod
+    def sqlite_writer() -> SQLiteWriter:
+        """This process's single SQLite writer thread (local mode only)."""
+        global _sqlite_writer, _sqlite_writer_pid
+        if _sqlite_writer is None or _sqlite_writer_pid != os.getpid():
+            with _pool_lock:
+                if _sqlite_writer is None or _sqlite_writer_pid != os.getpid():
+                    _sqlite_writer, _sqlite_writer_pid = SQLiteWriter(_connect), os.getpid()
+        return _sqlite_writer
+
+    @staticmethod
+    def _write(fn: Callable[[Any], Any], what: str) -> bool:
+        """Local mode: fn(cursor) runs on the writer thread and is committed with whatever else is queued."""
+        try:
+            DBConnector.sqlite_writer().run(fn)
+            return True
+        except Exception as e:
+            logging.error(f"Error executing {what}: {e}")
+            return False
+
     @staticmethod
     def get_db() -> Any:
         """
         Gets the database connection for the current thread.
-        Uses PostgreSQL in production, SQLite locally.
+        Uses PostgreSQL in production, SQLite locally. The connection is checked out of
+        the pool on first use and stays with the thread until close_db() returns it.
         """
         conn = getattr(db_local, 'connection', None)
-        if conn is None:
+        if conn is None or getattr(db_local, 'pid', None) != os.getpid():
             try:
-                if IS_PRODUCTION:
-                    # --- PRODUCTION: Connect to PostgreSQL ---
-                    conn = db_local.connection = psycopg2.connect(DATABASE_URL)
-                    logging.info("DBConnector: Connected to production PostgreSQL.")
-                else:
-                    # --- LOCAL: Connect to SQLite ---
-                    conn = db_local.connection = sqlite3.connect(DB_NAME, check_same_thread=False)
-                    conn.row_factory = sqlite3.Row
-                    logging.info("DBConnector: Connected to local SQLite.")
+                conn = db_local.connection = DBConnector.pool().acquire()
+                db_local.pid = os.getpid()
             except Exception as e:
+                db_local.connection = None
                 logging.error(f"Database connection error: {e}")
                 raise e
         return conn
@@ -82,26 +171,188 @@ class DBConnector:
     @staticmethod
     def execute_commit(query: str, params: tuple = ()) -> bool:
         """Executes an INSERT/UPDATE/DELETE query and commits."""
+        if not IS_PRODUCTION:
+            return DBConnector._write(lambda cursor: cursor.execute(query, params), "commit")
+        conn = None
         try:
             conn = DBConnector.get_db()
             cursor = conn.cursor()
-            
+            # PostgreSQL uses %s placeholders
+            cursor.execute(query.replace("?", "%s"), params)
+            conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            logging.error(f"Error executing commit: {e}")
+            if conn is not None:
+                conn.rollback() # Rollback on failure
+            return False
+
+    @staticmethod
+    def _run_statement(conn: Any, statement: Statement, params: tuple) -> Any:
+        cursor = conn.cursor()
+        if not IS_PRODUCTION:
+            cursor.row_factory = None # Plain tuples; shaped by the statement
+            cursor.execute(statement.sql, params)
+            return cursor
+        if statement.name not in conn.prepared_statements:
+            cursor.execute(statement.pg_prepare)
+            conn.prepared_statements.add(statement.name)
+        try:
+            cursor.execute(statement.pg_execute, params)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # The session lost it (e.g. DISCARD ALL by a proxy): prepare again, once
+            conn.rollback()
+            conn.prepared_statements.clear()
+            cursor.execute(statement.pg_prepare)
+            conn.prepared_statements.add(statement.name)
+            cursor.execute(statement.pg_execute, params)
+        return cursor
+
+    @staticmethod
+    def execute_statement(statement: Statement, params: tuple = (), one: bool = False,
+                          row_format: str = "dict") -> Optional[Any]:
+        """
+        Runs a registered SELECT (a server-side prepared statement on PostgreSQL).
+        row_format is "dict", "tuple" or "namedtuple". Returns one row or None
+        (one=True), else a list of rows; errors are logged like execute_query's.
+        """
+        if row_format not in ROW_FORMATS:
+            raise ValueError(f"row_format must be one of {ROW_FORMATS}")
+        try:
+            cursor = DBConnector._run_statement(DBConnector.get_db(), statement, params)
+            rows = cursor.fetchmany(1) if one else cursor.fetchall()
+            shaped = statement.shape(cursor.description, rows, row_format)
+            cursor.close()
+            if one:
+                return shaped[0] if shaped else None
+            return shaped
+        except Exception as e:
+            logging.error(f"Error executing statement {statement.name}: {e}")
+            return None if one else []
+
+    @staticmethod
+    def commit_statement(statement: Statement, params: tuple = ()) -> bool:
+        """Runs a registered INSERT/UPDATE/DELETE and commits."""
+        if not IS_PRODUCTION:
+            return DBConnector._write(lambda cursor: cursor.execute(statement.sql, params), f"statement {statement.name}")
+        conn = None
+        try:
+            conn = DBConnector.get_db()
+            DBConnector._run_statement(conn, statement, params).close()
+            conn.commit()
+            return True
+        except Exception as e:
+            logging.error(f"Error executing statement {statement.name}: {e}")
+            if conn is not None:
+                conn.rollback()
+            return False
+
+    @staticmethod
+    def iter_query(query: str, params: tuple = (), chunk_size: int = ITER_CHUNK_SIZE, chunks: bool = False,
+                   row_format: str = "dict", columnar: bool = False) -> Iterator[Any]:
+        """
+        Streams a SELECT with bounded memory: a named server-side cursor on PostgreSQL,
+        fetchmany on SQLite, chunk_size rows per round trip. Yields single rows, or lists
+        of rows with chunks=True, or {column: NumPy array} per chunk with columnar=True.
+        Runs on its own pooled connection, released when the generator is exhausted or
+        closed early. Unlike execute_query, errors are raised, not swallowed.
+        """
+        if row_format not in ROW_FORMATS:
+            raise ValueError(f"row_format must be one of {ROW_FORMATS}")
+        pool = DBConnector.pool()
+        conn = pool.acquire()
+        cursor = None
+        try:
             if IS_PRODUCTION:
-                # PostgreSQL uses %s placeholders
-                query = query.replace("?", "%s")
+                cursor = conn.cursor(name=f"iter_{uuid.uuid4().hex}")
+                cursor.itersize = chunk_size
+                cursor.execute(query.replace("?", "%s"), params)
+            else:
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                cursor.execute(query, params)
+            columns, row_type = None, None
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                if columns is None:
+                    # A named cursor only has a description after its first fetch
+                    columns = [col[0] for col in cursor.description]
+                if columnar:
+                    yield {name: np.array(values) for name, values in zip(columns, zip(*rows))}
+                    continue
+                if row_format == "dict":
+                    rows = [dict(zip(columns, row)) for row in rows]
+                elif row_format == "namedtuple":
+                    row_type = row_type or namedtuple("Row", columns, rename=True)
+                    rows = [row_type._make(row) for row in rows]
+                if chunks:
+                    yield rows
+                else:
+                    yield from rows
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception as e:
+                    logging.warning(f"iter_query: error closing cursor: {e}")
+            pool.release(conn)
 
-            cursor.execute(query, params)
+    @staticmethod
+    def insert_rows(cursor: Any, table: str, columns: List[str], rows: List[tuple], suffix: str = ""):
+        """
+        Multi-row INSERT on an open cursor (no commit). SQLite uses executemany; PostgreSQL
+        sends multi-row statements (execute_values). suffix is appended, e.g. an ON CONFLICT clause.
+        """
+        column_list = ", ".join(columns)
+        if IS_PRODUCTION:
+            from psycopg2.extras import execute_values
+            execute_values(cursor, f"INSERT INTO {table} ({column_list}) VALUES %s {suffix}", rows, page_size=1000)
+        else:
+            placeholders = ", ".join("?" for _ in columns)
+            cursor.executemany(f"INSERT INTO {table} ({column_list}) VALUES ({placeholders}) {suffix}", rows)
+
+    @staticmethod
+    def insert_many(table: str, columns: List[str], rows: List[tuple],
+                    hooks: Sequence[Callable[[Any, List[tuple]], None]] = ()) -> bool:
+        """
+        Inserts many rows in one transaction, so a whole batch costs one commit instead
+        of one per row. Each hook(cursor, rows) runs in the same transaction before the
+        commit (e.g. rollup upserts), so it lands together with the rows or not at all.
+        """
+        if not rows:
+            return True
+        def insert(cursor: Any):
+            DBConnector.insert_rows(cursor, table, columns, rows)
+            for hook in hooks:
+                hook(cursor, rows)
+        if not IS_PRODUCTION:
+            return DBConnector._write(insert, f"bulk insert into {table}")
+        conn = None
+        try:
+            conn = DBConnector.get_db()
+            cursor = conn.cursor()
+            insert(cursor)
             conn.commit()
             cursor.close()
             return True
         except Exception as e:
-            logging.error(f"Error executing commit: {e}")
-            conn.rollback() # Rollback on failure
+            logging.error(f"Error executing bulk insert into {table}: {e}")
+            if conn is not None:
+                conn.rollback()
             return False
 
     @staticmethod
     def close_db(e=None):
+        """Returns this thread's connection to the pool (request teardown, end of a background batch)."""
         conn = getattr(db_local, 'connection', None)
         if conn is not None:
-            conn.close()
-            db_local.connection = None
\ No newline at end of file
+            db_local.connection = None
+            if getattr(db_local, 'pid', None) == os.getpid():
+                DBConnector.pool().release(conn)
+
+    @staticmethod
+    def pool_stats() -> Dict[str, Any]:
+        return DBConnector.pool().stats()
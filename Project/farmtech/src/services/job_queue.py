@@ -0,0 +1,107 @@
+# src/services/job_queue.py
+import logging
+import queue
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+JOB_WORKERS = 4            # Worker threads processing queued ingestion jobs
+MAX_QUEUED_JOBS = 1000     # Jobs waiting across all workers before submit() pushes back
+JOB_RESULT_TTL = 600       # Seconds a finished job's result stays available for polling
+
+class JobQueueFullError(Exception):
+    pass
+
+class Job:
+    """One queued unit of work and, once finished, its (response, code) result."""
+    def __init__(self, field_id: str, owner: Any):
+        self.id = uuid.uuid4().hex
+        self.field_id = field_id
+        self.owner = owner
+        self.status = "queued"        # queued -> running -> done | failed
+        self.result: Optional[Dict[str, Any]] = None
+        self.code: Optional[int] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._finished = threading.Event()
+
+    def wait(self, timeout: float) -> bool:
+        return self._finished.wait(timeout)
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"job_id": self.id, "status": self.status, "field_id": self.field_id, "code": self.code,
+                "result": self.result, "created_at": self.created_at, "finished_at": self.finished_at}
+
+class IngestionJobQueue:
+    """
+    Bounded pool of worker threads that runs ingestion jobs off the request thread.
+    Jobs are routed to a worker by field_id, so readings for one field are always
+    processed in submission order while different fields run in parallel.
+    """
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = MAX_QUEUED_JOBS,
+                 result_ttl: float = JOB_RESULT_TTL):
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._queues: List["queue.Queue[Tuple[Job, Callable, tuple]]"] = [queue.Queue() for _ in range(workers)]
+        self._jobs: Dict[str, Job] = {}
+        self._finished_jobs: "deque[Job]" = deque()  # In finished_at order, oldest first
+        self._lock = threading.Lock()   # Guards _jobs, _finished_jobs and _pending
+        self._pending = 0
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self._threads:
+            return
+        for i, work in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(work,), name=f"Ingestion_Job_Worker_{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"IngestionJobQueue started with {len(self._queues)} workers.")
+
+    def submit(self, field_id: str, owner: Any, fn: Callable[..., Tuple[Dict[str, Any], int]], *args) -> Job:
+        """Queues fn(*args) for field_id. Raises JobQueueFullError when max_queued jobs are waiting."""
+        job = Job(field_id, owner)
+        with self._lock:
+            if self._pending >= self.max_queued:
+                raise JobQueueFullError(f"{self._pending} jobs already queued")
+            self._prune_expired()
+            self._pending += 1
+            self._jobs[job.id] = job
+        self._queues[zlib.crc32(str(field_id).encode()) % len(self._queues)].put((job, fn, args))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def _prune_expired(self):
+        """Drops results older than result_ttl; stops at the first finished job still inside it."""
+        cutoff = time.time() - self.result_ttl
+        while self._finished_jobs and self._finished_jobs[0].finished_at < cutoff:
+            del self._jobs[self._finished_jobs.popleft().id]
+
+    def _run(self, work: "queue.Queue[Tuple[Job, Callable, tuple]]"):
+        while True:
+            job, fn, args = work.get()
+            job.status = "running"
+            try:
+                job.result, job.code = fn(*args)
+                job.status = "done" if job.code < 400 else "failed"
+            except Exception as e:
+                logging.error(f"Ingestion job {job.id} for field {job.field_id} failed: {e}")
+                job.result, job.code, job.status = {"message": f"Unhandled error: {e}"}, 500, "failed"
+            with self._lock:
+                job.finished_at = time.time() # Stamped under the lock so _finished_jobs stays in order
+                self._finished_jobs.append(job)
+                self._pending -= 1
+            job._finished.set()
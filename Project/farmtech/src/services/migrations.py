@@ -0,0 +1,363 @@
+# src/services/migrations.py
+import argparse
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.core.utils import load_json_file
+from src.services.db_connector import DBConnector, IS_PRODUCTION
+
+SCHEMA_VERSION_TABLE = "schema_version"
+CRITICAL_POLICIES_FILE = "config/critical_policies.json"
+DEFAULT_RETENTION_DAYS = 365
+PARTITION_MONTHS_AHEAD = 2           # Monthly sensor_data partitions created ahead of time (PostgreSQL)
+MAINTENANCE_INTERVAL = 6 * 3600      # Seconds between partition/retention passes in the server
+RETENTION_DELETE_CHUNK = 5000        # Expired rows SQLite deletes per writer transaction
+# "drop" deletes expired partitions; "archive" detaches them into standalone archive_* tables
+RETENTION_MODE = os.environ.get('SENSOR_DATA_RETENTION_MODE', 'drop')
+_MIGRATION_LOCK_ID = 724301          # pg_advisory_lock key, so concurrent workers migrate one at a time
+_LABEL_SEQ_LOCK_ID = 724302          # pg_advisory_xact_lock key, so label_seq is handed out in commit order
+_PARTITION_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+class MigrationError(Exception):
+    pass
+
+# --- Migrations: (version, name, fn(cursor)). Append only; never edit one that has shipped. ---
+
+def _m001_base_tables(cursor: Any):
+    serial = "SERIAL PRIMARY KEY" if IS_PRODUCTION else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    timestamp = "TIMESTAMP" if IS_PRODUCTION else "DATETIME"
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS users (
+        id {serial},
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'user'
+    )""")
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS sensor_data (
+        id {serial}, timestamp {timestamp} DEFAULT CURRENT_TIMESTAMP,
+        field_id TEXT, moisture INTEGER, temp INTEGER, nutrient_level TEXT,
+        pump_pressure INTEGER, ai_action TEXT, wind_speed INTEGER, solar_radiation INTEGER
+    )""")
+
+def _m002_sensor_data_training_columns(cursor: Any):
+    """Columns model_training reads; databases from before them get them added in place."""
+    for column, column_type in (("historical_trend", "TEXT"), ("yield_observed", "REAL")):
+        if IS_PRODUCTION:
+            cursor.execute(f"ALTER TABLE sensor_data ADD COLUMN IF NOT EXISTS {column} {column_type}")
+        elif column not in _sqlite_columns(cursor, "sensor_data"):
+            cursor.execute(f"ALTER TABLE sensor_data ADD COLUMN {column} {column_type}")
+
+def _m003_sensor_data_field_time_index(cursor: Any):
+    """Serves "WHERE field_id = ? ORDER BY timestamp DESC LIMIT ?" without a scan and sort."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sensor_data_field_time ON sensor_data (field_id, timestamp DESC)")
+
+def _m004_sensor_data_partitions(cursor: Any):
+    """
+    PostgreSQL: turns sensor_data into a table range-partitioned by month on timestamp.
+    The existing table is attached whole as the partition for everything up to the end
+    of its newest row's month, so no rows are copied. SQLite has no partitions; this is a no-op there.
+    """
+    if not IS_PRODUCTION:
+        return
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'sensor_data'::regclass")
+    if cursor.fetchone()[0] == 'p':
+        return
+    cursor.execute("ALTER TABLE sensor_data RENAME TO sensor_data_legacy")
+    cursor.execute("ALTER TABLE sensor_data_legacy RENAME CONSTRAINT sensor_data_pkey TO sensor_data_legacy_pkey")
+    cursor.execute("ALTER INDEX idx_sensor_data_field_time RENAME TO idx_sensor_data_legacy_field_time")
+    # Range partitions can't hold NULL keys; the column has always defaulted to now
+    cursor.execute("UPDATE sensor_data_legacy SET timestamp = '1970-01-01' WHERE timestamp IS NULL")
+    cursor.execute("ALTER TABLE sensor_data_legacy ALTER COLUMN timestamp SET NOT NULL")
+    # The legacy partition has to cover every row it already holds
+    cursor.execute("SELECT max(timestamp) FROM sensor_data_legacy")
+    newest = cursor.fetchone()[0]
+    boundary = _next_month(_month_start(max(newest or datetime.datetime.min, datetime.datetime.utcnow())))
+    cursor.execute("CREATE TABLE sensor_data (LIKE sensor_data_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (\"timestamp\")")
+    cursor.execute("ALTER TABLE sensor_data ADD PRIMARY KEY (id, timestamp)")
+    cursor.execute("CREATE INDEX idx_sensor_data_field_time ON sensor_data (field_id, timestamp DESC)")
+    # The id sequence must outlive the legacy partition once retention drops it
+    cursor.execute("SELECT pg_get_serial_sequence('sensor_data_legacy', 'id')")
+    sequence = cursor.fetchone()[0]
+    if sequence:
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY sensor_data.id")
+    cursor.execute(f"ALTER TABLE sensor_data ATTACH PARTITION sensor_data_legacy FOR VALUES FROM (MINVALUE) TO ('{boundary:%Y-%m-%d}')")
+    cursor.execute("CREATE TABLE sensor_data_default PARTITION OF sensor_data DEFAULT")
+    _create_month_partitions(cursor, PARTITION_MONTHS_AHEAD)
+
+def _m005_sensor_rollups(cursor: Any):
+    """Hourly and daily per-field aggregates, kept up to date by src/services/sensor_rollups.py."""
+    timestamp = "TIMESTAMP" if IS_PRODUCTION else "DATETIME"
+    metrics = ", ".join(f"{m}_count INTEGER NOT NULL DEFAULT 0, {m}_sum REAL NOT NULL DEFAULT 0, {m}_min REAL, {m}_max REAL"
+                        for m in ("moisture", "temp", "pump_pressure"))
+    for granularity in ("hourly", "daily"):
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS sensor_rollup_{granularity} (
+            field_id TEXT NOT NULL, bucket {timestamp} NOT NULL, readings INTEGER NOT NULL DEFAULT 0,
+            {metrics},
+            PRIMARY KEY (field_id, bucket)
+        )""")
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS sensor_action_rollup_{granularity} (
+            field_id TEXT NOT NULL, bucket {timestamp} NOT NULL, ai_action TEXT NOT NULL, readings INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (field_id, bucket, ai_action)
+        )""")
+
+def _m006_sensor_data_label_seq(cursor: Any):
+    """
+    label_seq numbers rows in the order they got a yield_observed (on insert, or by a later
+    UPDATE), so incremental training can pick up rows labelled after it passed their id.
+    Triggers stamp it; a row relabelled later keeps its number. Existing labels are numbered by id.
+    """
+    if IS_PRODUCTION:
+        cursor.execute("ALTER TABLE sensor_data ADD COLUMN IF NOT EXISTS label_seq BIGINT")
+        cursor.execute("UPDATE sensor_data SET label_seq = id WHERE yield_observed IS NOT NULL AND label_seq IS NULL")
+        cursor.execute("CREATE SEQUENCE IF NOT EXISTS sensor_data_label_seq")
+        cursor.execute("SELECT setval('sensor_data_label_seq', GREATEST((SELECT max(label_seq) FROM sensor_data), 1))")
+        # Labelling transactions take turns until commit, so a lower number never becomes visible after a higher one
+        cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION sensor_data_stamp_label_seq() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.yield_observed IS NOT NULL AND NEW.label_seq IS NULL THEN
+                PERFORM pg_advisory_xact_lock({_LABEL_SEQ_LOCK_ID});
+                NEW.label_seq := nextval('sensor_data_label_seq');
+            END IF;
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql""")
+        cursor.execute("DROP TRIGGER IF EXISTS sensor_data_label_seq ON sensor_data")
+        cursor.execute("""CREATE TRIGGER sensor_data_label_seq BEFORE INSERT OR UPDATE OF yield_observed ON sensor_data
+                          FOR EACH ROW EXECUTE FUNCTION sensor_data_stamp_label_seq()""")
+    else:
+        if "label_seq" not in _sqlite_columns(cursor, "sensor_data"):
+            cursor.execute("ALTER TABLE sensor_data ADD COLUMN label_seq INTEGER")
+        cursor.execute("UPDATE sensor_data SET label_seq = id WHERE yield_observed IS NOT NULL AND label_seq IS NULL")
+        # SQLite has one writer at a time, so max + 1 inside the writing transaction is already in commit order
+        stamp = """UPDATE sensor_data SET label_seq = (SELECT IFNULL(MAX(label_seq), 0) + 1 FROM sensor_data)
+                   WHERE id = NEW.id"""
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS sensor_data_label_seq_insert AFTER INSERT ON sensor_data
+                           WHEN NEW.yield_observed IS NOT NULL AND NEW.label_seq IS NULL BEGIN {stamp}; END""")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS sensor_data_label_seq_update AFTER UPDATE OF yield_observed ON sensor_data
+                           WHEN NEW.yield_observed IS NOT NULL AND NEW.label_seq IS NULL BEGIN {stamp}; END""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sensor_data_label_seq ON sensor_data (label_seq)")
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Any], None]]] = [
+    (1, "base_tables", _m001_base_tables),
+    (2, "sensor_data_training_columns", _m002_sensor_data_training_columns),
+    (3, "sensor_data_field_time_index", _m003_sensor_data_field_time_index),
+    (4, "sensor_data_partitions", _m004_sensor_data_partitions),
+    (5, "sensor_rollups", _m005_sensor_rollups),
+    (6, "sensor_data_label_seq", _m006_sensor_data_label_seq),
+]
+
+# --- Helpers ---
+
+def _sqlite_columns(cursor: Any, table: str) -> List[str]:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+def _month_start(moment: datetime.datetime) -> datetime.date:
+    return datetime.date(moment.year, moment.month, 1)
+
+def _next_month(month: datetime.date) -> datetime.date:
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def _partition_bounds(cursor: Any) -> List[Tuple[str, Optional[datetime.datetime]]]:
+    """(name, exclusive upper bound) of every sensor_data partition; None for the DEFAULT one."""
+    cursor.execute("""SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i
+                      JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'sensor_data'::regclass""")
+    bounds = []
+    for name, bound in cursor.fetchall():
+        match = _PARTITION_BOUND.search(bound or "")
+        bounds.append((name, datetime.datetime.fromisoformat(match.group(1)) if match else None))
+    return bounds
+
+def _create_month_partitions(cursor: Any, months_ahead: int):
+    """Adds monthly partitions after the last existing one, up to months_ahead past this month."""
+    uppers = [upper for _, upper in _partition_bounds(cursor) if upper is not None]
+    current = _month_start(datetime.datetime.utcnow())
+    month = _month_start(max(uppers)) if uppers else current
+    last = current
+    for _ in range(months_ahead):
+        last = _next_month(last)
+    while month <= last:
+        end = _next_month(month)
+        cursor.execute(f"CREATE TABLE sensor_data_p{month:%Y%m} PARTITION OF sensor_data "
+                       f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')")
+        month = end
+
+def _placeholder() -> str:
+    return "%s" if IS_PRODUCTION else "?"
+
+# --- Runner ---
+
+def applied_versions(cursor: Any) -> Dict[int, str]:
+    cursor.execute(f"SELECT version, name FROM {SCHEMA_VERSION_TABLE}")
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+def run_migrations(target: Optional[int] = None) -> List[int]:
+    """
+    Applies every migration newer than the recorded schema version, each in its own
+    transaction together with its schema_version row. Safe to call from every worker at
+    startup: PostgreSQL serializes runners with an advisory lock, SQLite with BEGIN IMMEDIATE.
+    Returns the versions applied.
+    """
+    conn = DBConnector.get_db()
+    cursor = conn.cursor()
+    timestamp = "TIMESTAMP" if IS_PRODUCTION else "DATETIME"
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (version INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+                   f"applied_at {timestamp} DEFAULT CURRENT_TIMESTAMP)")
+    conn.commit()
+    if IS_PRODUCTION:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (_MIGRATION_LOCK_ID,))
+    applied: List[int] = []
+    try:
+        for version, name, migrate in MIGRATIONS:
+            if target is not None and version > target:
+                break
+            if not IS_PRODUCTION:
+                cursor.execute("BEGIN IMMEDIATE")
+            if version in applied_versions(cursor):
+                conn.rollback()
+                continue
+            try:
+                migrate(cursor)
+                cursor.execute(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, name) VALUES ({_placeholder()}, {_placeholder()})",
+                               (version, name))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise MigrationError(f"Migration {version} ({name}) failed: {e}") from e
+            applied.append(version)
+            logging.info(f"Migrations: applied {version} ({name}).")
+    finally:
+        if IS_PRODUCTION:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (_MIGRATION_LOCK_ID,))
+            conn.commit()
+        cursor.close()
+    return applied
+
+# --- Partition upkeep and retention ---
+
+def retention_days(policy_file: str = CRITICAL_POLICIES_FILE) -> int:
+    policies = load_json_file(policy_file)
+    days = policies.get("security_protocols", {}).get("resource_management", {}).get("data_retention_days")
+    return int(days) if days else DEFAULT_RETENTION_DAYS
+
+def ensure_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """Creates the next months' sensor_data partitions, so new rows never land in the default one."""
+    if not IS_PRODUCTION:
+        return
+    conn = DBConnector.get_db()
+    cursor = conn.cursor()
+    try:
+        _create_month_partitions(cursor, months_ahead)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def enforce_retention(days: Optional[int] = None, mode: str = RETENTION_MODE) -> int:
+    """
+    Removes sensor_data older than the retention period. On PostgreSQL only whole
+    partitions whose range ends before the cutoff go: dropped, or detached as
+    archive_<name> tables when mode is "archive". SQLite deletes the expired rows in id
+    order, RETENTION_DELETE_CHUNK per writer transaction, so ingestion writes interleave.
+    Returns the number of partitions (PostgreSQL) or rows (SQLite) removed.
+    """
+    days = days if days is not None else retention_days()
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    if not IS_PRODUCTION:
+        return _delete_expired_rows(cutoff.strftime('%Y-%m-%d %H:%M:%S'), days)
+    conn = DBConnector.get_db()
+    cursor = conn.cursor()
+    try:
+        removed = 0
+        for partition, upper in _partition_bounds(cursor):
+            if upper is None or upper > cutoff:
+                continue # DEFAULT partition, or still holds rows inside the retention period
+            cursor.execute(f"ALTER TABLE sensor_data DETACH PARTITION {partition}")
+            if mode == "archive":
+                cursor.execute(f"ALTER TABLE {partition} RENAME TO archive_{partition}")
+            else:
+                cursor.execute(f"DROP TABLE {partition}")
+            conn.commit()
+            removed += 1
+            logging.info(f"Retention: {'archived' if mode == 'archive' else 'dropped'} partition {partition} (ends {upper:%Y-%m-%d}).")
+        return removed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def _delete_expired_rows(cutoff: str, days: int) -> int:
+    """SQLite retention: one bounded DELETE per writer call, resuming after the last id deleted."""
+    removed, after_id = 0, 0
+    def delete_chunk(cursor: Any) -> Tuple[Optional[int], int]:
+        cursor.execute("SELECT id FROM sensor_data WHERE id > ? AND timestamp < ? ORDER BY id LIMIT ?",
+                       (after_id, cutoff, RETENTION_DELETE_CHUNK))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return None, 0
+        cursor.execute("DELETE FROM sensor_data WHERE id > ? AND id <= ? AND timestamp < ?", (after_id, ids[-1], cutoff))
+        return ids[-1], cursor.rowcount
+    while True:
+        last_id, deleted = DBConnector.sqlite_writer().run(delete_chunk)
+        removed += deleted
+        if last_id is None or deleted < RETENTION_DELETE_CHUNK:
+            break
+        after_id = last_id
+    logging.info(f"Retention: deleted {removed} sensor_data rows older than {days} days.")
+    return removed
+
+def maintain_sensor_data():
+    """One upkeep pass: partitions ahead, then retention (a failure in one doesn't skip the other)."""
+    try:
+        try:
+            ensure_partitions()
+        except Exception as e:
+            logging.error(f"sensor_data partition upkeep failed: {e}")
+        try:
+            enforce_retention()
+        except Exception as e:
+            logging.error(f"sensor_data retention failed: {e}")
+    finally:
+        DBConnector.close_db()
+
+def start_maintenance(interval: float = MAINTENANCE_INTERVAL) -> threading.Thread:
+    def run():
+        while True:
+            maintain_sensor_data()
+            time.sleep(interval)
+    thread = threading.Thread(target=run, name="SensorData_Maintenance", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    # "python -m src.services.migrations status|migrate|retention"
+    parser = argparse.ArgumentParser(description="Schema migrations and sensor_data retention.")
+    parser.add_argument("command", choices=["status", "migrate", "retention"])
+    parser.add_argument("--target", type=int, default=None, help="Migrate up to this version only.")
+    parser.add_argument("--days", type=int, default=None, help="Override data_retention_days.")
+    parser.add_argument("--mode", choices=["drop", "archive"], default=RETENTION_MODE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "migrate":
+        print(f"Applied: {run_migrations(args.target) or 'nothing (up to date)'}")
+    elif args.command == "retention":
+        ensure_partitions()
+        print(f"Removed: {enforce_retention(args.days, args.mode)}")
+    else:
+        run_migrations(target=0) # Only makes sure schema_version exists
+        conn = DBConnector.get_db()
+        cursor = conn.cursor()
+        done = applied_versions(cursor)
+        for version, name, _ in MIGRATIONS:
+            print(f"{'x' if version in done else ' '} {version:03d} {name}")
+    DBConnector.close_db()
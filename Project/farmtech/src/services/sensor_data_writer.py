@@ -0,0 +1,134 @@
+# src/services/sensor_data_writer.py
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional
+from src.services.db_connector import DBConnector
+
+SENSOR_DATA_TABLE = "sensor_data"
+SENSOR_DATA_COLUMNS = ["timestamp", "field_id", "moisture", "temp", "nutrient_level",
+                       "pump_pressure", "ai_action", "wind_speed", "solar_radiation", "historical_trend", "yield_observed"]
+MAX_BUFFERED_READINGS = 10000  # Readings held in memory before new ones are dropped
+FLUSH_BATCH_SIZE = 500         # Flush as soon as this many readings are waiting
+FLUSH_INTERVAL = 2.0           # ...or after this many seconds, whichever comes first
+
+class SensorDataWriter:
+    """
+    Persists ingested readings (with the chosen ai_action) into sensor_data off the request path.
+    record() only stamps the row and puts it on a bounded queue; a background thread
+    writes queued rows in bulk through DBConnector.insert_many. close() drains the queue.
+    """
+    def __init__(self, max_buffered: int = MAX_BUFFERED_READINGS, batch_size: int = FLUSH_BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max_buffered)
+        self._retry: List[tuple] = []  # Last batch that failed to write, retried first
+        self._flush_hooks: List[Callable[[Any, List[tuple]], None]] = []
+        self._commit_listeners: List[Callable[[List[tuple], bool], None]] = []
+        self._stats_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="SensorData_Writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        logging.info("SensorDataWriter started.")
+
+    def add_flush_hook(self, hook: Callable[[Any, List[tuple]], None]):
+        """hook(cursor, rows) runs inside every flush's transaction; rows are in SENSOR_DATA_COLUMNS order."""
+        self._flush_hooks.append(hook)
+
+    def add_commit_listener(self, listener: Callable[[List[tuple], bool], None]):
+        """listener(rows, committed) runs after every flush attempt, outside its transaction."""
+        self._commit_listeners.append(listener)
+
+    def record(self, reading: Dict[str, Any], ai_action: str) -> bool:
+        """Queues one reading for persistence. Never blocks; returns False if the buffer is full."""
+        # Stamped now, not at flush time, so history keeps the real ingestion order
+        row = (time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()), reading.get("field_id"), reading.get("moisture"),
+               reading.get("temp"), reading.get("nutrient_level"), reading.get("pump_pressure"), ai_action,
+               reading.get("wind_speed"), reading.get("solar_radiation"),
+               reading.get("historical_trend"), reading.get("yield_observed"))
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 1000 == 0:
+                logging.warning(f"SensorDataWriter: buffer full, {dropped} readings dropped so far.")
+            return False
+
+    def _collect(self) -> List[tuple]:
+        """Waits for rows until a full batch is ready or the flush interval runs out."""
+        batch = self._retry
+        self._retry = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stopped.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self) -> List[tuple]:
+        batch = self._retry
+        self._retry = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _flush(self, batch: List[tuple]):
+        if not batch:
+            return
+        committed = False
+        try:
+            if DBConnector.insert_many(SENSOR_DATA_TABLE, SENSOR_DATA_COLUMNS, batch, hooks=self._flush_hooks):
+                committed = True
+                with self._stats_lock:
+                    self.written += len(batch)
+            else:
+                # Keep the batch for the next cycle; the queue stays bounded meanwhile
+                self._retry = batch
+        finally:
+            DBConnector.close_db() # Don't hold a pooled connection between flushes
+            for listener in self._commit_listeners:
+                try:
+                    listener(batch, committed)
+                except Exception as e:
+                    logging.error(f"SensorDataWriter: commit listener failed: {e}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._flush(self._collect())
+        self._flush(self._drain())
+
+    def close(self):
+        """Stops the flusher and writes whatever is still buffered."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 10)
+        else:
+            self._flush(self._drain())
+        if self._retry or not self._queue.empty():
+            logging.error(f"SensorDataWriter: {len(self._retry) + self._queue.qsize()} readings could not be written on shutdown.")
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {"buffered": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
@@ -0,0 +1,133 @@
+# src/services/sensor_rollups.py
+import argparse
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from src.services.db_connector import DBConnector, IS_PRODUCTION
+from src.services.sensor_data_writer import SENSOR_DATA_COLUMNS
+
+ROLLUP_METRICS = ["moisture", "temp", "pump_pressure"]
+ROLLUP_GRANULARITIES = ["hourly", "daily"]   # Stored; "weekly" is merged from daily rows when read
+ROLLUP_COLUMNS = ["field_id", "bucket", "readings"] + [f"{m}_{stat}" for m in ROLLUP_METRICS for stat in ("count", "sum", "min", "max")]
+ACTION_ROLLUP_COLUMNS = ["field_id", "bucket", "ai_action", "readings"]
+
+_TIMESTAMP, _FIELD_ID, _AI_ACTION = (SENSOR_DATA_COLUMNS.index(c) for c in ("timestamp", "field_id", "ai_action"))
+_METRIC_INDEX = [SENSOR_DATA_COLUMNS.index(m) for m in ROLLUP_METRICS]
+
+def bucket_of(timestamp: Any, granularity: str) -> str:
+    """Start of the hour/day a 'YYYY-MM-DD HH:MM:SS' timestamp (or datetime) falls in."""
+    if not isinstance(timestamp, str):
+        timestamp = timestamp.strftime('%Y-%m-%d %H:%M:%S')
+    return f"{timestamp[:13]}:00:00" if granularity == "hourly" else f"{timestamp[:10]} 00:00:00"
+
+def _upsert_suffixes() -> Tuple[str, str]:
+    """ON CONFLICT clauses that merge a batch's partial aggregates into the stored ones (built once)."""
+    least, greatest = ("LEAST", "GREATEST") if IS_PRODUCTION else ("MIN", "MAX")
+    sets = ["readings = {t}.readings + excluded.readings"]
+    for m in ROLLUP_METRICS:
+        sets += [f"{m}_count = {{t}}.{m}_count + excluded.{m}_count", f"{m}_sum = {{t}}.{m}_sum + excluded.{m}_sum",
+                 f"{m}_min = {least}(COALESCE({{t}}.{m}_min, excluded.{m}_min), COALESCE(excluded.{m}_min, {{t}}.{m}_min))",
+                 f"{m}_max = {greatest}(COALESCE({{t}}.{m}_max, excluded.{m}_max), COALESCE(excluded.{m}_max, {{t}}.{m}_max))"]
+    metrics = "ON CONFLICT (field_id, bucket) DO UPDATE SET " + ", ".join(sets)
+    actions = "ON CONFLICT (field_id, bucket, ai_action) DO UPDATE SET readings = {t}.readings + excluded.readings"
+    return metrics, actions
+
+_METRIC_UPSERT, _ACTION_UPSERT = _upsert_suffixes()
+
+def aggregate_rows(rows: List[tuple], granularity: str) -> Tuple[List[list], List[tuple]]:
+    """Partial aggregates of sensor_data rows (SENSOR_DATA_COLUMNS order), one entry per (field, bucket)."""
+    metrics: Dict[Tuple[str, str], list] = {}
+    actions: Dict[Tuple[str, str, str], int] = {}
+    for row in rows:
+        field_id, timestamp = row[_FIELD_ID], row[_TIMESTAMP]
+        if field_id is None or timestamp is None:
+            continue
+        bucket = bucket_of(timestamp, granularity)
+        entry = metrics.get((field_id, bucket))
+        if entry is None:
+            entry = metrics[(field_id, bucket)] = [field_id, bucket, 0] + [0, 0.0, None, None] * len(ROLLUP_METRICS)
+        entry[2] += 1
+        for k, index in enumerate(_METRIC_INDEX):
+            value = row[index]
+            if value is None:
+                continue
+            base = 3 + 4 * k
+            entry[base] += 1
+            entry[base + 1] += value
+            if entry[base + 2] is None or value < entry[base + 2]:
+                entry[base + 2] = value
+            if entry[base + 3] is None or value > entry[base + 3]:
+                entry[base + 3] = value
+        action = row[_AI_ACTION]
+        if action is not None:
+            actions[(field_id, bucket, action)] = actions.get((field_id, bucket, action), 0) + 1
+    return list(metrics.values()), [key + (count,) for key, count in actions.items()]
+
+def update_rollups(cursor: Any, rows: List[tuple]):
+    """SensorDataWriter flush hook: folds a freshly inserted batch into every rollup, in the same transaction."""
+    for granularity in ROLLUP_GRANULARITIES:
+        metrics, actions = aggregate_rows(rows, granularity)
+        table, action_table = f"sensor_rollup_{granularity}", f"sensor_action_rollup_{granularity}"
+        if metrics:
+            DBConnector.insert_rows(cursor, table, ROLLUP_COLUMNS, [tuple(m) for m in metrics], _METRIC_UPSERT.format(t=table))
+        if actions:
+            DBConnector.insert_rows(cursor, action_table, ACTION_ROLLUP_COLUMNS, actions, _ACTION_UPSERT.format(t=action_table))
+
+def backfill_rollups(since: Optional[str] = None) -> Dict[str, int]:
+    """
+    Rebuilds the rollups from sensor_data (everything, or from the day of `since` on)
+    with one GROUP BY per table, inside a single transaction. Returns rows written per table.
+    """
+    p = "%s" if IS_PRODUCTION else "?"
+    where = "field_id IS NOT NULL AND timestamp IS NOT NULL"
+    params: tuple = ()
+    if since:
+        since = bucket_of(since, "daily")
+        where += f" AND timestamp >= {p}"
+        params = (since,)
+    aggregates = ", ".join(f"COUNT({m}), COALESCE(SUM({m}), 0), MIN({m}), MAX({m})" for m in ROLLUP_METRICS)
+    written: Dict[str, int] = {}
+
+    def rebuild(cursor: Any):
+        for granularity in ROLLUP_GRANULARITIES:
+            if IS_PRODUCTION:
+                bucket = f"date_trunc('{'hour' if granularity == 'hourly' else 'day'}', timestamp)"
+            else:
+                bucket = f"strftime('{'%Y-%m-%d %H:00:00' if granularity == 'hourly' else '%Y-%m-%d 00:00:00'}', timestamp)"
+            for table, columns, select, group in (
+                    (f"sensor_rollup_{granularity}", ROLLUP_COLUMNS, f"COUNT(*), {aggregates}", "field_id, bucket"),
+                    (f"sensor_action_rollup_{granularity}", ACTION_ROLLUP_COLUMNS, "ai_action, COUNT(*)", "field_id, bucket, ai_action")):
+                cursor.execute(f"DELETE FROM {table}" + (f" WHERE bucket >= {p}" if since else ""), params)
+                action_filter = " AND ai_action IS NOT NULL" if "ai_action" in columns else ""
+                cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) "
+                               f"SELECT field_id, {bucket} AS bucket, {select} FROM sensor_data "
+                               f"WHERE {where}{action_filter} GROUP BY {group}", params)
+                written[table] = cursor.rowcount
+
+    if not IS_PRODUCTION:
+        DBConnector.sqlite_writer().run(rebuild, timeout=None) # SQLite: only the writer thread writes
+        return written
+    conn = DBConnector.get_db()
+    cursor = conn.cursor()
+    try:
+        rebuild(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return written
+
+if __name__ == "__main__":
+    # "python -m src.services.sensor_rollups backfill [--since 2026-01-01]"
+    parser = argparse.ArgumentParser(description="Rebuild sensor_data rollups from raw history.")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--since", default=None, help="Only rebuild buckets from this day on (YYYY-MM-DD).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    start = time.time()
+    for table, count in backfill_rollups(args.since).items():
+        print(f"{table}: {count} rows")
+    print(f"Backfill finished in {time.time() - start:.1f}s.")
+    DBConnector.close_db()
@@ -0,0 +1,71 @@
+# src/services/sql_statements.py
+import re
+import threading
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+ROW_FORMATS = ("dict", "tuple", "namedtuple")
+_NAME_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+class StatementError(Exception):
+    pass
+
+class Statement:
+    """
+    One named query, written once with SQLite '?' placeholders. Its PostgreSQL forms
+    (PREPARE ... $1, and EXECUTE with psycopg2 '%s' parameters) are built here, at
+    registration, so nothing is rewritten per call.
+    """
+    def __init__(self, name: str, sql: str):
+        if not _NAME_PATTERN.match(name):
+            raise StatementError(f"Statement name must be a lowercase SQL identifier: {name!r}")
+        self.name = name
+        self.sql = sql
+        parts = sql.split("?")
+        self.param_count = len(parts) - 1
+        self.pg_prepare = f"PREPARE {name} AS " + "".join(
+            part + (f"${i + 1}" if i < self.param_count else "") for i, part in enumerate(parts))
+        self.pg_execute = f"EXECUTE {name}" + (f" ({', '.join(['%s'] * self.param_count)})" if self.param_count else "")
+        self._columns: Optional[Tuple[str, ...]] = None
+        self._row_type: Optional[type] = None
+        self._lock = threading.Lock()
+
+    def columns(self, description: Sequence[Any]) -> Tuple[str, ...]:
+        """Result column names, taken from the first execution's cursor.description."""
+        if self._columns is None:
+            with self._lock:
+                if self._columns is None:
+                    self._columns = tuple(col[0] for col in description)
+        return self._columns
+
+    def row_type(self, description: Sequence[Any]) -> type:
+        if self._row_type is None:
+            columns = self.columns(description)
+            with self._lock:
+                if self._row_type is None:
+                    self._row_type = namedtuple(f"{self.name}_row", columns, rename=True)
+        return self._row_type
+
+    def shape(self, description: Sequence[Any], rows: List[tuple], row_format: str) -> List[Any]:
+        """Converts raw tuples into the requested row format."""
+        if row_format == "tuple":
+            return [tuple(row) for row in rows]
+        if row_format == "namedtuple":
+            row_type = self.row_type(description)
+            return [row_type._make(row) for row in rows]
+        columns = self.columns(description)
+        return [dict(zip(columns, row)) for row in rows]
+
+STATEMENTS: Dict[str, Statement] = {}
+_registry_lock = threading.Lock()
+
+def register_statement(name: str, sql: str) -> Statement:
+    """Declares a query once (at import time). Re-registering the same SQL returns the existing statement."""
+    with _registry_lock:
+        existing = STATEMENTS.get(name)
+        if existing is not None:
+            if existing.sql != sql:
+                raise StatementError(f"Statement {name!r} is already registered with different SQL")
+            return existing
+        statement = STATEMENTS[name] = Statement(name, sql)
+        return statement
@@ -0,0 +1,135 @@
+# src/services/sqlite_writer.py
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Applied to every SQLite connection at connect time. WAL lets readers run while the
+# writer commits; synchronous=NORMAL in WAL mode syncs at checkpoints, not every commit.
+SQLITE_PRAGMAS: Dict[str, str] = {
+    "busy_timeout": "10000",      # First, so switching to WAL waits out other connections
+    "journal_mode": "WAL",
+    "synchronous": os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    "cache_size": str(-int(os.environ.get('SQLITE_CACHE_KB', 65536))),  # Negative = KiB
+    "temp_store": "MEMORY",
+    "wal_autocheckpoint": "2000",
+}
+MAX_GROUP_WRITES = 256     # Queued writes committed together in one transaction
+WRITE_TIMEOUT = 30.0       # Seconds a caller waits for its write to be picked up by the writer
+
+def apply_pragmas(conn: sqlite3.Connection):
+    for pragma, value in SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+
+class SQLiteWriter:
+    """
+    The one thread that writes to a local SQLite database. Callers submit fn(cursor)
+    and block until it is committed; everything queued meanwhile shares a single
+    transaction (group commit), each write in its own SAVEPOINT so one failing write
+    is rolled back alone. Reads keep using separate pooled connections.
+    """
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_group: int = MAX_GROUP_WRITES):
+        self._connect = connect
+        self.max_group = max_group
+        self._queue: "queue.Queue[Tuple[Callable[[Any], Any], Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.transactions = 0
+        self.writes = 0
+        self.failed = 0
+        self.largest_group = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="SQLite_Writer", daemon=True)
+                self._thread.start()
+
+    def run(self, fn: Callable[[Any], Any], timeout: float = WRITE_TIMEOUT) -> Any:
+        """
+        Runs fn(cursor) on the writer thread and returns its result once committed (or raises).
+        A write still queued after timeout seconds is cancelled and TimeoutError raised, so it
+        never commits; one the writer has already started is waited for, however long it takes.
+        """
+        self.start()
+        future: Future = Future()
+        self._queue.put((fn, future))
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
+
+    def _run(self):
+        conn = None
+        while True:
+            group = [self._queue.get()]
+            while len(group) < self.max_group:
+                try:
+                    group.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # From here on a write can't be cancelled; ones whose caller gave up are dropped
+            group = [(fn, future) for fn, future in group if future.set_running_or_notify_cancel()]
+            if not group:
+                continue
+            if conn is None:
+                try:
+                    conn = self._connect()
+                    conn.isolation_level = None # Transactions are managed explicitly below
+                except Exception as e:
+                    logging.error(f"SQLiteWriter: could not open the database: {e}")
+                    for _, future in group:
+                        future.set_exception(e)
+                    continue
+            if not self._commit_group(conn, group):
+                conn.close() # Reopened for the next group, in case the connection itself went bad
+                conn = None
+
+    def _commit_group(self, conn: sqlite3.Connection, group: List[Tuple[Callable[[Any], Any], Future]]) -> bool:
+        outcomes: List[Tuple[Future, Any, BaseException]] = []
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for fn, future in group:
+                cursor.execute("SAVEPOINT write_item")
+                try:
+                    outcomes.append((future, fn(cursor), None))
+                    cursor.execute("RELEASE write_item")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_item")
+                    cursor.execute("RELEASE write_item")
+                    outcomes.append((future, None, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            logging.error(f"SQLiteWriter: group of {len(group)} writes failed to commit: {e}")
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            self.failed += len(group)
+            for _, future in group:
+                future.set_exception(e)
+            return False
+        finally:
+            cursor.close()
+        self.transactions += 1
+        self.writes += len(group)
+        self.largest_group = max(self.largest_group, len(group))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                self.failed += 1
+                future.set_exception(error)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._queue.qsize(), "transactions": self.transactions, "writes": self.writes,
+                "failed": self.failed, "largest_group": self.largest_group,
+                "writes_per_transaction": self.writes / self.transactions if self.transactions else None}
@@ -0,0 +1,17 @@
+# tests/conftest.py
+import pytest
+from src.services import db_connector
+from src.services.migrations import run_migrations
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """A migrated local SQLite database in a temporary working directory, with a fresh pool and writer."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(db_connector, "_pool", None)
+    monkeypatch.setattr(db_connector, "_sqlite_writer", None)
+    db_connector.db_local.connection = None
+    run_migrations()
+    yield tmp_path / db_connector.DB_NAME
+    db_connector.DBConnector.close_db()
+    if db_connector._pool is not None:
+        db_connector._pool.close_all()
@@ -0,0 +1,94 @@
+# tests/test_connection_pool.py
+import threading
+import time
+import pytest
+from src.services import db_connector
+from src.services.connection_pool import ConnectionPool, PoolTimeoutError
+from src.services.db_connector import DBConnector
+
+def _pool(**kwargs) -> ConnectionPool:
+    """A pool over the fixture's SQLite file, built the way DBConnector builds its own."""
+    return ConnectionPool(db_connector._connect, db_connector._is_alive, db_connector._reset, **kwargs)
+
+def test_acquire_times_out_when_exhausted(sqlite_db):
+    pool = _pool(min_size=0, max_size=2)
+    first, second = pool.acquire(), pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire(timeout=0.05)
+    assert pool.stats()["timeouts"] == 1
+    pool.release(second)
+    assert pool.acquire(timeout=0.05) is second
+    pool.release(first)
+    pool.close_all()
+
+def test_waiter_gets_a_connection_released_by_another_thread(sqlite_db):
+    pool = _pool(min_size=0, max_size=1)
+    held = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire(timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    pool.release(held)
+    waiter.join(5)
+    assert got == [held]
+    assert pool.stats()["waited_checkouts"] == 1
+    pool.release(held)
+    pool.close_all()
+
+def test_connection_returned_after_an_exception_is_rolled_back(sqlite_db):
+    pool = _pool(min_size=0, max_size=1)
+    conn = pool.acquire()
+    with pytest.raises(ZeroDivisionError):
+        try:
+            conn.execute("INSERT INTO sensor_data (field_id) VALUES ('F1')")
+            1 / 0
+        finally:
+            pool.release(conn)
+    again = pool.acquire(timeout=0.05)
+    assert again is conn and not again.in_transaction
+    assert again.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0] == 0
+    pool.release(again)
+    pool.close_all()
+
+def test_broken_connection_is_discarded_and_replaced(sqlite_db):
+    pool = _pool(min_size=0, max_size=1)
+    conn = pool.acquire()
+    conn.close()
+    pool.release(conn)
+    assert pool.stats()["discarded"] == 1
+    fresh = pool.acquire(timeout=0.05)
+    assert fresh is not conn and fresh.execute("SELECT 1").fetchone()[0] == 1
+    pool.release(fresh)
+    pool.close_all()
+
+def test_idle_connection_is_pinged_and_expired_one_recycled(sqlite_db):
+    pool = _pool(min_size=1, max_size=1, ping_after=0)
+    pool.prefill()
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close() # Dies while idle: the ping on checkout catches it
+    replacement = pool.acquire(timeout=0.05)
+    assert replacement is not conn and pool.stats()["discarded"] == 1
+    pool.release(replacement)
+    pool.close_all()
+
+    pool = _pool(min_size=0, max_size=1, max_lifetime=0.01)
+    conn = pool.acquire()
+    time.sleep(0.02)
+    pool.release(conn)
+    assert pool.stats()["recycled"] == 1 and pool.stats()["idle"] == 0
+
+def test_close_db_returns_the_thread_connection_to_the_pool(sqlite_db):
+    DBConnector.close_db()
+    conn = DBConnector.get_db()
+    assert DBConnector.get_db() is conn
+    assert DBConnector.pool_stats()["in_use"] == 1
+    DBConnector.close_db()
+    assert DBConnector.pool_stats()["in_use"] == 0
+    assert DBConnector.get_db() is conn
+
+def test_forked_process_builds_its_own_pool(sqlite_db, monkeypatch):
+    pool = DBConnector.pool()
+    monkeypatch.setattr(db_connector, "_pool_pid", -1)
+    assert DBConnector.pool() is not pool
+    pool.close_all()
@@ -0,0 +1,80 @@
+# tests/test_decide_batch.py
+import json
+import numpy as np
+import pytest
+from src.ai import ai_agent
+from src.ai.ai_agent import AIActionDecider, AgentConfig
+from src.ai.heuristic_engine import HeuristicEngine
+from src.ai.heuristic_store import HeuristicStore
+from src.ai.rule_compiler import columns_from_readings
+
+RULES = [
+    {"id": "FLOOD", "condition": "moisture > 90", "action": "ACTION: DRAIN", "log": "flood", "priority": 10},
+    {"id": "WARM", "condition": "not (temp < 10)", "action": "ACTION: WARM", "log": "not cold", "priority": 1},
+    {"id": "DRY_OR_HOT", "condition": "moisture < 60 or temp > 40", "action": "ACTION: IRRIGATE", "log": "dry", "priority": 2},
+    {"id": "NOT_HIGH", "condition": "nutrient_level != 'HIGH'", "action": "ACTION: FERTILIZE", "log": "nutrients", "priority": 2},
+    {"id": "OPTIMAL", "condition": "prediction == 'Optimal Irrigation Recommended' and moisture < 70",
+     "action": "ACTION: BOOST", "log": "optimal", "priority": 3},
+    {"id": "NO_PUMP", "condition": "pump_pressure is None", "action": "ACTION: CHECK_PUMP", "log": "pump", "priority": 4},
+    {"id": "MILD", "condition": "10 < temp < 30 and moisture >= 50", "action": "ACTION: MONITOR", "log": "mild", "priority": 2},
+    {"id": "ANY_TEMP", "condition": "temp >= 0", "action": "ACTION: LOG_TEMP", "log": "temp", "priority": 2},
+]
+
+READINGS = [
+    {"field_id": "F1", "moisture": 95, "temp": 20, "nutrient_level": "LOW", "pump_pressure": 70},
+    {"field_id": "F2", "moisture": 55, "temp": 5, "nutrient_level": "HIGH", "pump_pressure": 70},
+    {"field_id": "F1", "temp": 45, "nutrient_level": "HIGH", "pump_pressure": 70},          # no moisture
+    {"field_id": "F3", "moisture": 80, "nutrient_level": "HIGH", "pump_pressure": 70},      # no temp
+    {"field_id": "F2", "moisture": 80, "temp": 20, "pump_pressure": 70},                    # no nutrient_level
+    {"moisture": 65, "temp": 20, "nutrient_level": "HIGH", "pump_pressure": 70},            # no field_id
+    {"field_id": None, "moisture": 65, "temp": 20, "nutrient_level": "HIGH", "pump_pressure": 70},
+    {"field_id": "F1", "moisture": 62.5, "temp": 25, "nutrient_level": "MEDIUM", "pump_pressure": None},
+    {"field_id": "F4", "moisture": 62, "temp": 25, "nutrient_level": "HIGH"},               # no pump_pressure
+    {"field_id": "F4"},                                                                     # nothing at all
+    {"field_id": "F5", "moisture": 40, "temp": None, "nutrient_level": "HIGH", "pump_pressure": 70},
+]
+PREDICTIONS = ["Optimal Irrigation Recommended", "All Metrics Stable"] * 6
+
+class _Config:
+    def is_safety_lock_active(self):
+        return False
+
+class _Core:
+    config = _Config()
+
+@pytest.fixture
+def decider(tmp_path, monkeypatch):
+    knowledge = tmp_path / "ai_knowledge.json"
+    knowledge.write_text(json.dumps({"safety_thresholds": {}, "decision_rules": RULES}))
+    monkeypatch.setattr(AgentConfig, "KNOWLEDGE_FILE", str(knowledge))
+    # Per-field confidences, so the field a reading is scored under changes the winner
+    store = HeuristicStore({
+        "DRY_OR_HOT@unknown": {"confidence": 0.1, "successes": 0, "failures": 9},
+        "NOT_HIGH@None": {"confidence": 0.1, "successes": 0, "failures": 9},
+        "MILD@F1": {"confidence": 0.2, "successes": 0, "failures": 8},
+        "MILD@unknown": {"confidence": 0.1, "successes": 0, "failures": 9},
+        "NOT_HIGH@F2": {"confidence": 0.4, "successes": 0, "failures": 6},
+    })
+    return AIActionDecider(_Core(), HeuristicEngine(store=store))
+
+def test_batch_matches_single_reading_path(decider):
+    predictions = PREDICTIONS[:len(READINGS)]
+    expected = [decider.decide_action(p, r) for p, r in zip(predictions, READINGS)]
+    columns, present = columns_from_readings(READINGS, decider.decision_fields)
+    assert decider.decide_batch(predictions, columns, present=present) == expected
+
+def test_batch_matches_one_reading_at_a_time(decider):
+    for prediction, reading in zip(PREDICTIONS, READINGS):
+        columns, present = columns_from_readings([reading], decider.decision_fields)
+        assert decider.decide_batch([prediction], columns, present=present) == [decider.decide_action(prediction, reading)]
+
+def test_missing_field_never_matches_negated_rule(decider):
+    columns, present = columns_from_readings([{"field_id": "F9", "moisture": 75}], decider.decision_fields)
+    action, _ = decider.decide_batch(["All Metrics Stable"], columns, present=present)[0]
+    assert action == "ACTION: MONITOR_QUIETLY" # WARM and NOT_HIGH read absent fields
+
+def test_unknown_category_codes_are_rejected(decider):
+    columns = {"field_id": np.array(["F1", "F2"], dtype=object), "moisture": np.array([95, 20]),
+               "temp": np.array([20, 20]), "nutrient_level": np.array([0, -1]), "pump_pressure": np.array([70, 70])}
+    with pytest.raises(ValueError):
+        decider.decide_batch(["All Metrics Stable"] * 2, columns, categories={"nutrient_level": {"LOW": 0, "HIGH": 1}})
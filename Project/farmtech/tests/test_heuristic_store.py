@@ -0,0 +1,140 @@
+# tests/test_heuristic_store.py
+import threading
+import fakeredis
+import pytest
+from src.ai import heuristic_engine
+from src.ai.heuristic_engine import HeuristicEngine, MAX_CONFIDENCE
+from src.ai.heuristic_store import HeuristicStore, RedisHeuristicStore
+
+DEFAULT = {"confidence": 1.0, "successes": 0, "failures": 0}
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+@pytest.fixture
+def redis_store(server):
+    return RedisHeuristicStore(fakeredis.FakeRedis(server=server, decode_responses=True), prefix="test")
+
+def reward(entry):
+    before = entry["confidence"]
+    entry["successes"] += 1
+    entry["confidence"] = max(0.1, entry["confidence"] - 0.2)
+    return before
+
+def test_update_creates_from_default_and_returns_apply_result(redis_store):
+    assert redis_store.get("R1", "F1") is None
+    assert redis_store.update("R1", "F1", DEFAULT, reward) == 1.0
+    assert redis_store.update("R1", "F1", DEFAULT, reward) == pytest.approx(0.8)
+    assert redis_store.get("R1", "F1") == {"confidence": pytest.approx(0.6), "successes": 2, "failures": 0}
+    assert len(redis_store) == 1
+    assert redis_store.fields_for_rule("R1") == {"F1"}
+    assert redis_store.rules_for_field("F1") == {"R1"}
+
+def test_confidence_matrix_uses_default_for_unknown_pairs(redis_store):
+    redis_store.put("R1", "F1", {"confidence": 0.5, "successes": 1, "failures": 2})
+    redis_store.put("R2", "F2", {"confidence": 0.3, "successes": 0, "failures": 3})
+    matrix = redis_store.confidence_matrix(["R1", "R2", "R3"], ["F1", "F2"], MAX_CONFIDENCE)
+    assert matrix == [[0.5, 1.0], [1.0, 0.3], [1.0, 1.0]]
+    assert redis_store.confidences(["R2", "R1"], "F2", 0.9) == [0.3, 0.9]
+
+def test_average_confidence_tracks_puts_and_updates(redis_store):
+    assert redis_store.average_confidence("R1") is None
+    redis_store.put("R1", "F1", {"confidence": 0.5, "successes": 0, "failures": 0})
+    redis_store.put("R1", "F2", {"confidence": 0.9, "successes": 0, "failures": 0})
+    assert redis_store.average_confidence("R1") == pytest.approx(0.7)
+    redis_store.put("R1", "F2", {"confidence": 0.3, "successes": 0, "failures": 0}) # Overwrite, not a new entry
+    redis_store.update("R1", "F3", DEFAULT, reward)
+    assert redis_store.average_confidence("R1") == pytest.approx((0.5 + 0.3 + 0.8) / 3)
+
+def test_matches_local_store(redis_store):
+    local = HeuristicStore()
+    for store in (local, redis_store):
+        for i in range(12):
+            store.update(f"R{i % 3}", f"F{i % 4}", DEFAULT, reward)
+    assert redis_store.snapshot() == local.snapshot()
+    for rule in ("R0", "R1", "R2"):
+        assert redis_store.average_confidence(rule) == pytest.approx(local.average_confidence(rule))
+
+def test_concurrent_updates_are_not_lost(server):
+    threads, updates = 8, 25
+    def worker():
+        # One client per thread, like separate worker processes sharing one Redis
+        store = RedisHeuristicStore(fakeredis.FakeRedis(server=server, decode_responses=True), prefix="test")
+        for _ in range(updates):
+            store.update("R1", "F1", DEFAULT, reward)
+            store.update("R1", f"F{threading.get_ident()}", DEFAULT, reward)
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    store = RedisHeuristicStore(fakeredis.FakeRedis(server=server, decode_responses=True), prefix="test")
+    assert store.get("R1", "F1")["successes"] == threads * updates
+    assert len(store) == threads + 1
+    entries = store.snapshot().values()
+    assert store.average_confidence("R1") == pytest.approx(sum(e["confidence"] for e in entries) / len(entries))
+
+def test_engine_falls_back_to_local_memory_and_replays_feedback_into_redis(server, redis_store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(heuristic_engine.time, "monotonic", lambda: now[0])
+    engine = HeuristicEngine(store=redis_store)
+    engine.learn_from_feedback("R1", "F1", success=False)
+    assert engine.get_confidence_scores(["R1"], "F1") == [pytest.approx(0.8)]
+
+    server.connected = False
+    assert engine.get_confidence_scores(["R1", "R2"], "F1") == [MAX_CONFIDENCE, MAX_CONFIDENCE]
+    engine.learn_from_feedback("R1", "F1", success=False) # Lands in local memory, no exception
+    engine.learn_from_feedback("R2", "F1", success=True)
+    assert engine.get_confidence_matrix(["R1"], ["F1", "F2"]) == [[pytest.approx(0.8), MAX_CONFIDENCE]]
+    assert engine.get_average_confidence("R1") == pytest.approx(0.8)
+
+    # Back up, but not retried until the interval has passed
+    server.connected = True
+    now[0] += heuristic_engine.REDIS_RETRY_INTERVAL - 1
+    assert engine.get_confidence_scores(["R1"], "F1") == [pytest.approx(0.8)]
+    assert redis_store.get("R1", "F1")["failures"] == 1
+
+    now[0] += 1
+    assert engine.get_confidence_scores(["R1", "R2"], "F1") == [pytest.approx(0.6), MAX_CONFIDENCE]
+    assert redis_store.get("R1", "F1") == {"confidence": pytest.approx(0.6), "successes": 0, "failures": 2}
+    assert redis_store.get("R2", "F1") == {"confidence": MAX_CONFIDENCE, "successes": 1, "failures": 0}
+    engine.learn_from_feedback("R1", "F1", success=True)
+    assert redis_store.get("R1", "F1")["successes"] == 1 # Replayed once, not again
+
+def test_existing_file_memory_is_imported_into_empty_redis_once(server, tmp_path, monkeypatch):
+    snapshot, journal = tmp_path / "heuristics.json", tmp_path / "heuristics.journal"
+    snapshot.write_text('{"R1@F1": {"confidence": 0.4, "successes": 1, "failures": 4}}')
+    journal.write_text('["R2@F1", 0.7, 0, 2]\n')
+    monkeypatch.setattr(heuristic_engine, "REDIS_URL", "redis://test")
+    monkeypatch.setattr(heuristic_engine.redis, "from_url",
+                        lambda *args, **kwargs: fakeredis.FakeRedis(server=server, decode_responses=True))
+    engine = HeuristicEngine(str(snapshot), str(journal))
+    assert isinstance(engine.heuristics, RedisHeuristicStore)
+    assert engine.get_confidence_matrix(["R1", "R2"], ["F1"]) == [[0.4], [0.7]]
+    assert engine.heuristics.get("R1", "F1") == {"confidence": 0.4, "successes": 1, "failures": 4}
+    assert engine.get_average_confidence("R2") == pytest.approx(0.7)
+
+    engine.learn_from_feedback("R1", "F1", success=True)
+    snapshot.write_text('{"R3@F1": {"confidence": 0.2, "successes": 0, "failures": 8}}')
+    again = HeuristicEngine(str(snapshot), str(journal)) # Later starts never import again
+    assert again.heuristics.get("R3", "F1") is None
+    assert again.heuristics.get("R1", "F1")["successes"] == 2
+
+def test_workers_sharing_the_files_keep_each_others_feedback(tmp_path):
+    files = (str(tmp_path / "heuristics.json"), str(tmp_path / "heuristics.journal"))
+    first, second = HeuristicEngine(*files), HeuristicEngine(*files) # Two workers, same files
+    first.learn_from_feedback("R1", "F1", success=False)
+    second.learn_from_feedback("R2", "F1", success=False)
+    second.learn_from_feedback("R1", "F1", success=False)
+    second.learn_from_feedback("R1", "F1", success=False)
+    second.close() # Compacts and truncates the shared journal
+    first.close()  # Must not overwrite what the second worker saved
+
+    assert first.get_confidence_score("R2", "F1") == pytest.approx(0.8) # Taken on from the other worker
+    restarted = HeuristicEngine(*files)
+    assert restarted.snapshot() == {
+        "R1@F1": {"confidence": pytest.approx(0.6), "successes": 0, "failures": 2},
+        "R2@F1": {"confidence": pytest.approx(0.8), "successes": 0, "failures": 1},
+    }
+    restarted.close()
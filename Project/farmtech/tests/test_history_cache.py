@@ -0,0 +1,59 @@
+# tests/test_history_cache.py
+from src.ml.history_cache import FieldHistoryCache, HISTORY_COLUMNS
+from src.services.sensor_data_writer import SENSOR_DATA_COLUMNS
+
+def _history(minute: int) -> tuple:
+    return (40, 20, "Medium", 60, "NONE", f"2026-01-01 10:{minute:02d}:00")
+
+def _written(field_id: str, minute: int) -> tuple:
+    values = dict(zip(HISTORY_COLUMNS, _history(minute)), field_id=field_id)
+    return tuple(values.get(column) for column in SENSOR_DATA_COLUMNS)
+
+class _Loader:
+    def __init__(self, rows, during=None):
+        self.rows, self.during, self.calls = rows, during, 0
+
+    def __call__(self, field_id, limit):
+        self.calls += 1
+        if self.during:
+            self.during()
+        return self.rows[:limit]
+
+def test_load_overlapping_a_flush_is_returned_but_not_stored():
+    load = _Loader([_history(5), _history(4)])
+    cache = FieldHistoryCache(load, rows_per_field=3)
+    load.during = lambda: cache.flush_started(None, []) # A flush begins while the field loads
+    assert cache.recent("F1", 2) == [_history(5), _history(4)]
+    cache.flush_finished([_written("F1", 6)], committed=True)
+    load.during = None
+    cache.recent("F1", 2)
+    assert load.calls == 2 # Reloaded: the first load may have missed the flushed row
+
+    cache.flush_started(None, []) # Still in flight while the next field loads
+    cache.recent("F2", 2)
+    cache.recent("F2", 2)
+    assert load.calls == 4
+
+def test_committed_rows_merge_newest_first_and_truncate():
+    load = _Loader([_history(5), _history(3), _history(1)])
+    cache = FieldHistoryCache(load, rows_per_field=3)
+    cache.recent("F1", 3)
+    cache.flush_started(None, [])
+    cache.flush_finished([_written("F1", 4), _written("F2", 9), _written("F1", 6)], committed=True)
+    assert cache.recent("F1", 3) == [_history(6), _history(5), _history(4)]
+    assert load.calls == 1
+    assert cache.stats()["merged_rows"] == 2
+
+def test_uncertain_flush_drops_the_cached_field():
+    load = _Loader([_history(5)])
+    cache = FieldHistoryCache(load, rows_per_field=3)
+    cache.recent("F1", 1)
+    cache.flush_started(None, [])
+    cache.flush_finished([_written("F1", 6)], committed=False)
+    cache.recent("F1", 1)
+    assert load.calls == 2
+
+    cache.flush_finished([_written("F1", 7)], committed=True) # No flush_started before it
+    cache.recent("F1", 1)
+    assert load.calls == 3
+    assert cache.stats()["invalidated_fields"] == 2
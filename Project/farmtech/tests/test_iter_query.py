@@ -0,0 +1,30 @@
+# tests/test_iter_query.py
+import sqlite3
+import pytest
+from src.services.db_connector import DBConnector
+
+@pytest.fixture
+def readings(sqlite_db):
+    DBConnector.close_db() # Leave the pool with nothing checked out
+    assert DBConnector.insert_many("sensor_data", ["field_id", "moisture"], [(f"F{i}", i) for i in range(25)])
+
+def test_streams_every_row_in_chunks(readings):
+    chunks = list(DBConnector.iter_query("SELECT moisture FROM sensor_data ORDER BY id", chunk_size=10, chunks=True))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    columns = list(DBConnector.iter_query("SELECT moisture FROM sensor_data ORDER BY id", chunk_size=10, columnar=True))
+    assert columns[-1]["moisture"].tolist() == [20, 21, 22, 23, 24]
+    assert DBConnector.pool_stats()["in_use"] == 0
+
+def test_closing_early_returns_the_connection(readings):
+    rows = DBConnector.iter_query("SELECT field_id FROM sensor_data ORDER BY id", chunk_size=10)
+    assert next(rows) == {"field_id": "F0"}
+    assert DBConnector.pool_stats()["in_use"] == 1
+    rows.close()
+    assert DBConnector.pool_stats()["in_use"] == 0
+
+def test_failing_query_raises_and_returns_the_connection(readings):
+    with pytest.raises(sqlite3.OperationalError):
+        list(DBConnector.iter_query("SELECT no_such_column FROM sensor_data"))
+    assert DBConnector.pool_stats()["in_use"] == 0
+    with pytest.raises(ValueError):
+        list(DBConnector.iter_query("SELECT 1", row_format="xml"))
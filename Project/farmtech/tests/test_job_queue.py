@@ -0,0 +1,46 @@
+# tests/test_job_queue.py
+import threading
+import pytest
+from src.services.job_queue import IngestionJobQueue, JobQueueFullError
+
+def test_jobs_for_one_field_run_in_submission_order():
+    jobs = IngestionJobQueue(workers=3)
+    jobs.start()
+    seen = []
+    submitted = [jobs.submit(f"F{i % 2}", None, lambda i=i: (seen.append(i) or {"n": i}, 200)) for i in range(40)]
+    for job in submitted:
+        assert job.wait(5)
+    for field in (0, 1):
+        assert [i for i in seen if i % 2 == field] == list(range(field, 40, 2))
+    assert [job.status for job in submitted] == ["done"] * 40
+    assert jobs.depth() == 0
+
+def test_failed_job_keeps_error_result():
+    jobs = IngestionJobQueue(workers=1)
+    jobs.start()
+    job = jobs.submit("F1", None, lambda: 1 / 0)
+    assert job.wait(5)
+    assert (job.status, job.code) == ("failed", 500)
+
+def test_submit_pushes_back_when_full():
+    jobs = IngestionJobQueue(workers=1, max_queued=2) # Not started: nothing drains
+    jobs.submit("F1", None, lambda: ({}, 200))
+    jobs.submit("F1", None, lambda: ({}, 200))
+    with pytest.raises(JobQueueFullError):
+        jobs.submit("F1", None, lambda: ({}, 200))
+
+def test_expired_results_are_pruned_oldest_first(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("src.services.job_queue.time.time", lambda: clock[0])
+    jobs = IngestionJobQueue(workers=1, result_ttl=60)
+    jobs.start()
+    old = jobs.submit("F1", None, lambda: ({}, 200))
+    assert old.wait(5)
+    clock[0] += 50
+    recent = jobs.submit("F1", None, lambda: ({}, 200))
+    assert recent.wait(5)
+    clock[0] += 20 # old finished 70s ago, recent 20s ago
+    jobs.submit("F2", None, lambda: ({}, 200)).wait(5)
+    assert jobs.get(old.id) is None
+    assert jobs.get(recent.id) is recent
+    assert list(jobs._finished_jobs)[0] is recent
@@ -0,0 +1,39 @@
+# tests/test_migrations.py
+import datetime
+from src.services import migrations
+from src.services.db_connector import DBConnector
+
+def _insert_at(*ages_in_days: int):
+    now = datetime.datetime.utcnow()
+    rows = [(f"F{i}", (now - datetime.timedelta(days=age)).strftime('%Y-%m-%d %H:%M:%S'), 40)
+            for i, age in enumerate(ages_in_days)]
+    assert DBConnector.insert_many("sensor_data", ["field_id", "timestamp", "moisture"], rows)
+
+def test_run_migrations_is_idempotent(sqlite_db):
+    versions = [version for version, _, _ in migrations.MIGRATIONS]
+    assert sorted(migrations.applied_versions(DBConnector.get_db().cursor())) == versions
+    assert migrations.run_migrations() == []
+    assert sorted(migrations.applied_versions(DBConnector.get_db().cursor())) == versions
+
+def test_retention_deletes_expired_rows_in_bounded_chunks(sqlite_db, monkeypatch):
+    _insert_at(400, 10, 500, 366, 1, 800, 700, 364, 900)
+    monkeypatch.setattr(migrations, "RETENTION_DELETE_CHUNK", 2)
+    writer = DBConnector.sqlite_writer()
+    calls = []
+    run = writer.run
+    monkeypatch.setattr(writer, "run", lambda fn, *args, **kwargs: calls.append(fn) or run(fn, *args, **kwargs))
+
+    assert migrations.enforce_retention(days=365) == 6
+    assert len(calls) == 4 # Three full chunks, then one that comes up empty
+    remaining = DBConnector.execute_query("SELECT field_id FROM sensor_data ORDER BY id")
+    assert [row["field_id"] for row in remaining] == ["F1", "F4", "F7"]
+    assert migrations.enforce_retention(days=365) == 0
+
+def test_maintenance_runs_retention_when_partition_upkeep_fails(sqlite_db, monkeypatch):
+    def fail():
+        raise RuntimeError("partition upkeep failed")
+    ran = []
+    monkeypatch.setattr(migrations, "ensure_partitions", fail)
+    monkeypatch.setattr(migrations, "enforce_retention", lambda: ran.append(True))
+    migrations.maintain_sensor_data()
+    assert ran == [True]
@@ -0,0 +1,27 @@
+# tests/test_ml_model.py
+from src.ml.ml_model import MachineLearningModel
+from src.ml.model_registry import ModelRegistry
+from src.ml.model_training import MODEL_FEATURES
+
+READING = {"moisture": 40, "temp": 22, "pump_pressure": 60, "nutrient_level": "Medium", "historical_trend": "stable"}
+
+def _publish(registry: ModelRegistry, intercept: float) -> str:
+    return registry.publish([0.1] * len(MODEL_FEATURES), intercept, MODEL_FEATURES, {"model_name": "test"})
+
+def test_describe_reports_an_empty_prediction_cache(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    _publish(registry, 10.0)
+    model = MachineLearningModel(model_file=str(tmp_path / "missing.json"), registry=registry, cache_size=8)
+    stats = model.describe()["prediction_cache"]
+    assert stats is not None and (stats["size"], stats["capacity"]) == (0, 8)
+
+def test_hot_swap_clears_the_prediction_cache(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    _publish(registry, 10.0)
+    model = MachineLearningModel(model_file=str(tmp_path / "missing.json"), registry=registry, cache_size=8)
+    model.run_prediction([READING])
+    assert len(model.prediction_cache) == 1
+    _publish(registry, 50.0)
+    assert model.reload_if_changed()
+    assert len(model.prediction_cache) == 0
+    assert model.describe()["model_version"] == "v0002"
@@ -0,0 +1,33 @@
+# tests/test_model_training.py
+import numpy as np
+from src.ml import model_training
+from src.services.db_connector import DBConnector
+
+def _reading(i: int, labelled: bool) -> tuple:
+    return (f"F{i % 3}", 30 + i % 40, 15 + i % 20, 50 + i % 30, "Medium", "stable", (i % 17) * 1.5 if labelled else None)
+
+def _insert(readings):
+    assert DBConnector.insert_many("sensor_data", ["field_id", "moisture", "temp", "pump_pressure", "nutrient_level",
+                                                   "historical_trend", "yield_observed"], readings)
+
+def test_incremental_run_picks_up_rows_labelled_after_the_watermark(sqlite_db):
+    _insert([_reading(i, labelled=i % 2 == 0) for i in range(200)])
+    first = model_training.train_from_database(chunk_size=32)
+    assert first["records_trained"] + first["performance_metrics"]["test_records"] == 100
+
+    # Older rows labelled after that run (ids below its last row), plus new labelled rows
+    assert DBConnector.execute_commit("UPDATE sensor_data SET yield_observed = (id % 17) * 1.5 WHERE id % 2 = 0")
+    _insert([_reading(i, labelled=True) for i in range(200, 250)])
+    incremental = model_training.train_from_database(incremental=True, chunk_size=32)
+    assert incremental["new_records"] == 150
+
+    full = model_training.train_from_database(chunk_size=32)
+    assert incremental["records_trained"] == full["records_trained"]
+    assert incremental["performance_metrics"]["test_records"] == full["performance_metrics"]["test_records"]
+    assert np.isclose(incremental["performance_metrics"]["rmse"], full["performance_metrics"]["rmse"])
+
+def test_relabelled_row_is_not_counted_twice(sqlite_db):
+    _insert([_reading(i, labelled=True) for i in range(100)])
+    model_training.train_from_database()
+    assert DBConnector.execute_commit("UPDATE sensor_data SET yield_observed = 99 WHERE id = 5")
+    assert model_training.train_from_database(incremental=True)["new_records"] == 0
@@ -0,0 +1,72 @@
+# tests/test_schema_validator.py
+import numpy as np
+import pytest
+from src.core.schema_definitions import (
+    SENSOR_DATA_SCHEMA, OPTIONAL_FIELD_DEFAULTS, FIELD_RANGES, MISSING, NOT_AN_OBJECT, MISSING_FIELD,
+    WRONG_TYPE, OUT_OF_RANGE, validate_record, validate_columns, apply_optional_defaults, is_valid_schema)
+
+VALID = {"field_id": "F1", "moisture": 55, "temp": 25, "nutrient_level": "LOW", "cost_kes": 1000,
+         "pump_pressure": 70, "historical_trend": "NORMAL", "wind_speed": 3, "solar_radiation": 400}
+WRONG_VALUES = {int: "12", str: 12}
+
+def test_valid_record():
+    assert validate_record(VALID) is None
+    assert is_valid_schema(VALID)
+
+@pytest.mark.parametrize("record", [None, [], "reading", 42])
+def test_not_an_object(record):
+    assert validate_record(record) == (NOT_AN_OBJECT, None)
+
+@pytest.mark.parametrize("field", list(SENSOR_DATA_SCHEMA))
+def test_missing_field(field):
+    record = {k: v for k, v in VALID.items() if k != field}
+    expected = None if field in OPTIONAL_FIELD_DEFAULTS else (MISSING_FIELD, field)
+    assert validate_record(record) == expected
+
+@pytest.mark.parametrize("field", list(SENSOR_DATA_SCHEMA))
+def test_wrong_type(field):
+    for value in (WRONG_VALUES[SENSOR_DATA_SCHEMA[field]], None, 1.5):
+        assert validate_record(dict(VALID, **{field: value})) == (WRONG_TYPE, field)
+
+@pytest.mark.parametrize("field", [f for f, t in SENSOR_DATA_SCHEMA.items() if t is int])
+def test_bool_is_not_an_int(field):
+    assert validate_record(dict(VALID, **{field: True})) == (WRONG_TYPE, field)
+
+@pytest.mark.parametrize("field", list(FIELD_RANGES))
+def test_range_bounds_are_inclusive(field):
+    low, high = FIELD_RANGES[field]
+    assert validate_record(dict(VALID, **{field: low})) is None
+    assert validate_record(dict(VALID, **{field: high})) is None
+    assert validate_record(dict(VALID, **{field: low - 1})) == (OUT_OF_RANGE, field)
+    assert validate_record(dict(VALID, **{field: high + 1})) == (OUT_OF_RANGE, field)
+
+def test_first_failing_field_in_schema_order_wins():
+    record = dict(VALID, temp=99, moisture="wet")
+    del record["cost_kes"]
+    assert validate_record(record) == (WRONG_TYPE, "moisture")
+    assert validate_record(dict(VALID, temp=99, pump_pressure="high")) == (WRONG_TYPE, "pump_pressure") # Types before ranges
+
+def test_record_is_not_modified_and_defaults_are_copied():
+    record = {k: v for k, v in VALID.items() if k not in OPTIONAL_FIELD_DEFAULTS}
+    before = dict(record)
+    assert validate_record(record) is None and record == before
+    filled = apply_optional_defaults(record)
+    assert filled == {**record, **OPTIONAL_FIELD_DEFAULTS} and record == before
+    assert apply_optional_defaults(VALID) is VALID
+
+def test_columns_report_the_same_errors_as_records():
+    records = [VALID, dict(VALID, moisture=101), dict(VALID, temp="hot"), dict(VALID, field_id=None),
+               {k: v for k, v in VALID.items() if k != "nutrient_level"},
+               {k: v for k, v in VALID.items() if k != "wind_speed"}, dict(VALID, moisture=-1, temp=51)]
+    columns = {field: [r.get(field, MISSING) for r in records] for field in SENSOR_DATA_SCHEMA}
+    codes, fields = validate_columns(columns, len(records))
+    expected = [validate_record(r) or (None, None) for r in records]
+    assert list(zip(codes, fields)) == expected
+
+def test_typed_numpy_columns():
+    rows = 4
+    columns = {field: np.array([VALID[field]] * rows) for field in SENSOR_DATA_SCHEMA}
+    columns["moisture"] = np.array([0, 100, 101, -5])
+    codes, fields = validate_columns(columns, rows)
+    assert codes.tolist() == [None, None, OUT_OF_RANGE, OUT_OF_RANGE]
+    assert fields.tolist() == [None, None, "moisture", "moisture"]
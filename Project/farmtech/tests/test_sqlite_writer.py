@@ -0,0 +1,44 @@
+# tests/test_sqlite_writer.py
+import sqlite3
+import threading
+import time
+import pytest
+from src.services.sqlite_writer import SQLiteWriter
+
+@pytest.fixture
+def writer(tmp_path):
+    path = str(tmp_path / "writer.db")
+    sqlite3.connect(path).execute("CREATE TABLE t (v INTEGER)").connection.close()
+    writer = SQLiteWriter(lambda: sqlite3.connect(path, check_same_thread=False))
+    writer.count = lambda: sqlite3.connect(path).execute("SELECT COUNT(*) FROM t").fetchone()[0]
+    return writer
+
+def _insert(cursor):
+    cursor.execute("INSERT INTO t (v) VALUES (1)")
+    return cursor.lastrowid
+
+def test_groups_commit_and_failures_roll_back_alone(writer):
+    assert writer.run(_insert) == 1
+    with pytest.raises(sqlite3.OperationalError):
+        writer.run(lambda cursor: cursor.execute("INSERT INTO missing VALUES (1)"))
+    assert writer.run(_insert) == 2
+    assert writer.count() == 2
+
+def test_write_timed_out_in_the_queue_never_commits(writer):
+    release = threading.Event()
+    blocker = threading.Thread(target=writer.run, args=(lambda cursor: release.wait(5),))
+    blocker.start()
+    time.sleep(0.05) # The writer is now busy with the blocking write
+    with pytest.raises(TimeoutError):
+        writer.run(_insert, timeout=0.05)
+    release.set()
+    blocker.join(5)
+    writer.run(lambda cursor: None) # Everything queued before this has been handled
+    assert writer.count() == 0
+
+def test_write_timed_out_while_running_reports_its_commit(writer):
+    def slow_insert(cursor):
+        time.sleep(0.2)
+        return _insert(cursor)
+    assert writer.run(slow_insert, timeout=0.05) == 1
+    assert writer.count() == 1
@@ -0,0 +1,54 @@
+# tests/test_stream_ingestion.py
+import json
+import pytest
+from scheduler_gateway import DataIngestionHandler
+
+READING = {"field_id": "F1", "moisture": 55, "temp": 25, "nutrient_level": "LOW", "cost_kes": 1000,
+           "pump_pressure": 70, "historical_trend": "NORMAL"}
+
+class _Config:
+    def is_safety_lock_active(self):
+        return False
+
+class _Model:
+    def run_prediction(self, readings):
+        return "All Metrics Stable"
+
+class _Agent:
+    def decide_action(self, prediction, reading):
+        if reading["field_id"] == "BROKEN":
+            raise ConnectionError("heuristic store unavailable")
+        return "ACTION: MONITOR_QUIETLY", "quiet"
+
+class _Autonomy:
+    def execute_action(self, action, field_id):
+        return {"success": True}
+
+class _Heuristics:
+    def learn_from_feedback(self, rule_id, field_id, success):
+        if field_id == "NO_LEARN":
+            raise ConnectionError("feedback lost")
+
+@pytest.fixture
+def handler():
+    handler = DataIngestionHandler(_Config(), _Model())
+    handler.ai_agent, handler.autonomy_engine, handler.heuristic_engine = _Agent(), _Autonomy(), _Heuristics()
+    return handler
+
+def stream(handler, readings):
+    lines = [json.dumps(r).encode() if isinstance(r, dict) else r for r in readings]
+    return [json.loads(out) for out in handler.handle_stream_ingestion(lines)]
+
+def test_failing_line_reports_processing_failed_and_stream_continues(handler):
+    results = stream(handler, [READING, dict(READING, field_id="BROKEN"), dict(READING, field_id="NO_LEARN"),
+                               b"{not json", None, READING])
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4, 5]
+    assert results[0]["status"] == "success" and results[5]["status"] == "success"
+    for failed in (results[1], results[2]):
+        assert failed == {"index": failed["index"], "status": "error", "code": 500, "error_code": "PROCESSING_FAILED"}
+    assert results[3]["error_code"] == "INVALID_JSON"
+    assert results[4]["error_code"] == "LINE_TOO_LONG"
+
+def test_invalid_reading_is_a_schema_error(handler):
+    result, = stream(handler, [dict(READING, moisture="wet")])
+    assert (result["status"], result["code"], result["error_code"]) == ("error", 400, "INVALID_SCHEMA")